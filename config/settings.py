@@ -59,6 +59,8 @@ FILE_TIMEOUT_SECONDS = 120
 ENABLE_MEMORY_MONITOR = True
 MEMORY_LIMIT_MB = 2048
 ENABLE_RESUME = True
+# 建立 baseline 的並發檔案數：1 = 逐檔序列（原行為）；>1 時每個 worker 記憶體預算為 MEMORY_LIMIT_MB / N
+BASELINE_WORKERS = 1
 FORMULA_ONLY_MODE = True
 DEBOUNCE_INTERVAL_SEC = 4
 
@@ -71,11 +73,30 @@ LZ4_COMPRESSION_LEVEL = 1       # LZ4: 0-16, 越高壓縮率越好但越慢
 ZSTD_COMPRESSION_LEVEL = 3      # Zstd: 1-22, 推薦 3-6
 GZIP_COMPRESSION_LEVEL = 6      # gzip: 1-9, 推薦 6
 
+# zstd 字典：以現有基準線與歷史快照訓練共用字典（只用於 zstd 格式），小區塊（每表、delta 段）壓縮率與解壓速度明顯改善
+# 字典以版本保存於 ZSTD_DICTIONARY_DIR（留空 = LOG_FOLDER/zstd_dict），舊版字典保留以讀取舊檔
+ZSTD_DICTIONARY_ENABLED = False
+ZSTD_DICTIONARY_DIR = ''
+ZSTD_DICTIONARY_SIZE_KB = 112           # 字典大小
+ZSTD_DICTIONARY_RETRAIN_DAYS = 30       # 建立基準線後，目前字典超過此天數即重新訓練（0 = 只訓練一次）
+
 # 歸檔設定
 ENABLE_ARCHIVE_MODE = True              # 是否啟用歸檔模式
 ARCHIVE_AFTER_DAYS = 7                  # 多少天後轉為歸檔格式
 ARCHIVE_COMPRESSION_FORMAT = 'zstd'     # 歸檔使用的壓縮格式
 
+# 基準線檔案格式：'binary'（版本化二進位容器 .baseline.bin，各表獨立壓縮，msgpack 可用時以 msgpack 編碼）
+# 'json'（舊版 .baseline.json.*）；兩種格式都可讀取，保存時轉為此設定的格式
+BASELINE_FILE_FORMAT = 'binary'
+# 二進位基準線逐表延遲載入：比較時只解壓實際用到的工作表（沿用未變的表不解壓）
+BASELINE_LAZY_LOAD = True
+
+# 增量基準線：比較後自動更新只追加變更的儲存格（delta 段），不重寫整份基準線
+BASELINE_DELTA_ENABLED = True
+BASELINE_DELTA_MAX_RATIO = 0.2          # 本次變更格數超過總格數此比例時直接全量保存
+BASELINE_DELTA_MAX_SEGMENTS = 20        # delta 段數達此值即於背景壓實成新的全量基準線
+BASELINE_DELTA_MAX_MB = 8               # delta 檔大小（MB）達此值即於背景壓實
+
 # 效能監控
 SHOW_COMPRESSION_STATS = True           # 是否顯示壓縮統計
 
@@ -120,6 +141,26 @@ FORCE_BASELINE_ON_FIRST_SEEN = [
 
 # =========== Polling Config ============
 POLLING_SIZE_THRESHOLD_MB = 10
+# 輪詢比較的工作執行緒數：所有輪詢由單一排程執行緒派發，同時最多 N 個檔案在解析/比較（同一檔案不會並行）
+POLLING_MAX_WORKERS = 2
+# 檔案事件比較佇列的工作執行緒數：observer 只負責放入佇列（同檔案事件合併、小檔/最近變更者優先），由這些執行緒解析比較
+COMPARE_WORKERS = 2
+# asyncio 事件管線：複製前穩定等待、複製重試退避以 await 進行（等待中的檔案不佔執行緒），完成後才交給比較執行緒
+ASYNC_PIPELINE_ENABLED = True
+PIPELINE_IO_WORKERS = 4             # 管線中 stat/複製使用的 I/O 執行緒數
+# stat 快取：輪詢、copy_to_cache、quick-skip 在同一 tick（秒）內共用一次目錄掃描的結果；0 = 停用（每次直接 os.stat）
+# 注意：tick 內來源的再次變動最遲在下一個 tick 才會看到（穩定性檢查一律重新掃描）
+STAT_CACHE_TTL_SEC = 1.0
+STAT_CACHE_MAX_DIR_ENTRIES = 5000   # 目錄項目超過此數時改為逐檔 stat，避免為一個檔案列出巨大目錄
+# 磁碟根目錄/UNC 路徑的輪詢後端：只追蹤 SUPPORTED_EXTS，目錄 mtime 未變則不列出內容（索引保存在 LOG_FOLDER/tree_index），
+# 各子樹平行 scandir，每個目錄依近期活動調整輪詢間隔；False = 使用 watchdog PollingObserver（每次重掃整棵樹）
+TREE_POLLING_ENABLED = True
+TREE_POLL_WORKERS = 8               # 平行 stat/scandir 目錄的執行緒數
+TREE_POLL_MIN_INTERVAL_SEC = 5      # 近期有變動的目錄的輪詢間隔（秒）
+TREE_POLL_MAX_INTERVAL_SEC = 300    # 長期無變動的目錄最長輪詢間隔（秒）
+TREE_POLL_BACKOFF = 2.0             # 目錄無變動時間隔的倍增係數
+TREE_POLL_FULL_RESCAN_SEC = 3600    # 無論目錄 mtime 是否變動，每隔多久重新列出一次（捕捉原地寫入；0 = 不強制）
+TREE_POLL_INDEX_SAVE_SEC = 300      # 目錄索引保存間隔（秒；停止時一定保存）
 
 # =========== Console 比較表格顯示 ============
 # Address 欄寬（字元，0=自動依目前變更的最長 Address）
@@ -150,10 +191,21 @@ SPARSE_POLLING_DURATION_SEC = 15
 VALUE_ENGINE = 'polars_xml'
 # CSV 是否落地保存（polars 模式下除錯用；預設 False，使用 BytesIO in-memory）
 CSV_PERSIST = True  # 預設開啟（合併 CSV：<CACHE_FOLDER>/values/<baseline_key>.values.csv）
-# 公式讀取引擎：暫保留 openpyxl；之後可提供 'xml'
+# 公式讀取引擎：'openpyxl'（預設）或 'xml'（iterparse 單次串流，同時讀公式與值，支援 shared/array formula）
 FORMULA_ENGINE = 'openpyxl'
-# 允許的最大並發 sheet 讀取數
+# 允許的最大並發 sheet 讀取數（XML 公式/值引擎以行程池逐表解析；1=停用並發）
 MAX_SHEET_WORKERS = 4
+# 活頁簿 worksheet XML 未壓縮總量低於此值（MB）時不啟用行程池（行程派工成本高於收益）
+PARALLEL_SHEET_MIN_MB = 8
+# 工作表宣告範圍（<dimension>）面積超過此格數或觸及 XFD/1048576 時發出警告（0=只檢查 Excel 上限）
+SHEET_DIMENSION_WARN_CELLS = 5000000
+# 行程內解析結果快取（同一快取副本 size/mtime 未變時重用解析結果）；容量 = MEMORY_LIMIT_MB × 比例
+PARSE_CACHE_ENABLED = True
+PARSE_CACHE_MEMORY_RATIO = 0.25
+# 儲存格存放格式：'columnar'（每張表以欄式 SheetCells 存放，每格約 30 bytes）或 'dict'（原巢狀 dict）
+CELL_STORE = 'columnar'
+# 工作表差異引擎：'columnar'（排序位址 merge-join + 整欄比較）或 'legacy'（逐格 set 聯集比較）；兩者輸出相同
+DIFF_ENGINE = 'columnar'
 
 # =========== 歷史快照與時間線（Git/SQLite） ============
 # 可一鍵關閉 Git 整合（包括快照同步與自動提交、時間線伺服器）
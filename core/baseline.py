@@ -8,19 +8,30 @@ import shutil
 import time
 import gc
 import threading
+import struct
+import functools
 from datetime import datetime, timedelta
 import logging
 import config.settings as settings
 from utils.helpers import save_progress, load_progress
 from utils.memory import check_memory_limit, get_memory_usage
+from utils.cell_store import (
+    compact_workbook, compact_enabled, groups_from_json, expand_formula_groups, SheetCells, LazySheet, addr_to_key,
+    json_default
+)
 from utils.compression import (
     CompressionFormat, 
     save_compressed_file, 
     load_compressed_file,
+    compress_data,
+    decompress_data,
     get_compression_stats,
     migrate_baseline_format
 )
-from core.excel_parser import dump_excel_cells_with_timeout, hash_excel_content, get_excel_last_author
+from utils.baseline_format import (
+    binary_baseline_path, write_binary_baseline, read_binary_baseline, read_binary_header, load_binary_file, decode_sheet_block
+)
+from core.excel_parser import dump_excel_cells_with_timeout, hash_excel_content, get_excel_last_author, EXTERNAL_REF_DETECTOR_VERSION
 
 def baseline_file_path(base_name):
     """
@@ -34,6 +45,10 @@ def get_baseline_file_with_extension(base_name):
     """
     base_path = baseline_file_path(base_name)
     
+    binary_file = binary_baseline_path(base_path)
+    if os.path.exists(binary_file):
+        return binary_file
+    
     # 按優先順序檢查不同格式的檔案
     for format_type in [settings.DEFAULT_COMPRESSION_FORMAT, 'lz4', 'zstd', 'gzip']:
         ext = CompressionFormat.get_extension(format_type)
@@ -43,22 +58,46 @@ def get_baseline_file_with_extension(base_name):
     
     return None
 
-def load_baseline(baseline_file_or_base_name):
+def load_baseline(baseline_file_or_base_name, lazy=True):
     """
     載入基準線檔案，支援多種壓縮格式
+    lazy=True 且為二進位容器時逐表延遲載入：未被 delta 改動的表以 LazySheet 佔位，用到時才解壓解碼
+    （xml 引擎沿用未變工作表時，該表從頭到尾都不需解壓）
     """
     try:
         # 如果是基準名稱，轉換為檔案路徑
-        if not os.path.sep in baseline_file_or_base_name and not baseline_file_or_base_name.endswith('.json'):
-            base_path = baseline_file_path(baseline_file_or_base_name)
-        else:
-            base_path = baseline_file_or_base_name
-            if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
-                base_path = base_path.rsplit('.', 1)[0]
+        base_path = _resolve_base_path(baseline_file_or_base_name)
+        
+        # 二進位容器優先；只有舊版 .baseline.json.* 時照常讀取（下次保存即轉為新格式）
+        data, binary = _load_snapshot(base_path, lazy=lazy)
+        
+        # 增量基準線：快照之後追加的 delta 段
+        segments = []
+        if isinstance(data, dict):
+            segments = _read_delta_segments(base_path, int(data.pop('delta_seq', 0) or 0))
+        
+        # 二進位容器：delta 會改動的表立即解碼，其餘延遲
+        lazy_state = {}
+        if binary is not None:
+            touched = {name for record in segments for name in (record.get('sheets') or {})}
+            _attach_binary_sheets(data, binary, touched, lazy_state)
+        
+        # shared formula 按組保存的表：組員格 formula 為 None，需連同組表還原
+        formula_groups = None
+        if isinstance(data, dict) and data.get('formula_groups'):
+            formula_groups = {name: groups_from_json(g) for name, g in data.pop('formula_groups').items()}
+        
+        if segments:
+            _apply_delta_segments(data, segments, formula_groups)
         
-        # 使用壓縮工具載入
-        from utils.compression import load_compressed_file
-        data = load_compressed_file(base_path)
+        ext_scanned = isinstance(data, dict) and data.get('external_ref_version') == EXTERNAL_REF_DETECTOR_VERSION
+        lazy_state['ext_scanned'] = ext_scanned
+        
+        # 欄式存放：載入後即把每張表換成 SheetCells，舊 baseline 不用常駐巢狀 dict
+        if isinstance(data, dict) and compact_enabled():
+            compact_workbook(data.get('cells'), ext_scanned=ext_scanned, formula_groups=formula_groups)
+        elif formula_groups and isinstance(data, dict):
+            expand_formula_groups(data.get('cells') or {}, formula_groups)
         
         # 移除所有 [DEBUG] 載入基準線的訊息
         
@@ -70,30 +109,75 @@ def load_baseline(baseline_file_or_base_name):
 
 def save_baseline(baseline_file_or_base_name, data):
     """
-    保存基準線檔案，使用設定的壓縮格式
+    保存基準線檔案，使用設定的壓縮格式（全量快照；已追加的 delta 段一併視為已併入）
     """
     try:
         # 如果是基準名稱，轉換為檔案路徑
-        if not os.path.sep in baseline_file_or_base_name and not baseline_file_or_base_name.endswith('.json'):
-            base_path = baseline_file_path(baseline_file_or_base_name)
-        else:
-            base_path = baseline_file_or_base_name
-            if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
-                base_path = base_path.rsplit('.', 1)[0]
+        base_path = _resolve_base_path(baseline_file_or_base_name)
         
         # 移除： print(f"[DEBUG] 基準路徑: {base_path}")
         
-        # 確保目錄存在
-        dir_name = os.path.dirname(base_path)
-        os.makedirs(dir_name, exist_ok=True)
-        
-        # 使用新的壓縮工具
-        from utils.compression import save_compressed_file, get_compression_stats, CompressionFormat
-        
-        # 選擇壓縮格式
-        compression_format = settings.DEFAULT_COMPRESSION_FORMAT
-        # 移除： print(f"[DEBUG] 使用格式: {compression_format}")
+        with _locks_for(base_path)[1]:
+            with _delta_guard:
+                _full_generation[base_path] = _full_generation.get(base_path, 0) + 1
+            return _write_full_baseline(base_path, data)
         
+    except (FileNotFoundError, PermissionError, OSError) as e:
+        logging.error(f"保存基準線檔案失敗: {e}")
+        return False
+
+def _resolve_base_path(baseline_file_or_base_name):
+    # 基準名稱或檔案路徑 -> 不含壓縮副檔名的基準線路徑
+    if not os.path.sep in baseline_file_or_base_name and not baseline_file_or_base_name.endswith('.json'):
+        return baseline_file_path(baseline_file_or_base_name)
+    base_path = baseline_file_or_base_name
+    if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
+        base_path = base_path.rsplit('.', 1)[0]
+    elif base_path.endswith('.baseline.bin'):
+        base_path = base_path[:-len('.bin')] + '.json'
+    return base_path
+
+def _write_full_baseline(base_path, data, delta_seq=None):
+    """
+    寫出全量快照；delta_seq 為快照已涵蓋的最後一個 delta 段序號（None = 目前 delta 檔的最後一段）。
+    寫完後移除已併入的 delta 段。呼叫方需持有該基準線的寫入鎖。
+    BASELINE_FILE_FORMAT='binary' 寫二進位容器（.baseline.bin），'json' 寫舊版 .baseline.json.*。
+    """
+    # 確保目錄存在
+    dir_name = os.path.dirname(base_path)
+    os.makedirs(dir_name, exist_ok=True)
+    
+    # 使用新的壓縮工具
+    from utils.compression import save_compressed_file, get_compression_stats, CompressionFormat
+    
+    # 選擇壓縮格式
+    compression_format = settings.DEFAULT_COMPRESSION_FORMAT
+    binary = str(getattr(settings, 'BASELINE_FILE_FORMAT', 'binary')).lower() == 'binary'
+    # 移除： print(f"[DEBUG] 使用格式: {compression_format}")
+    
+    # 記錄快照已涵蓋的 delta 序號，載入時不再重覆套用
+    if delta_seq is None:
+        delta_seq = _last_delta_seq(base_path)
+    if isinstance(data, dict):
+        data = dict(data, delta_seq=delta_seq)
+    
+    # cells 一律來自目前的解析器：標記 external_ref 的偵測版本，載入後比較時可直接信任
+    if isinstance(data, dict) and 'cells' in data:
+        data = dict(data, external_ref_version=EXTERNAL_REF_DETECTOR_VERSION)
+    
+    stats = None
+    if binary and isinstance(data, dict):
+        # 二進位容器：各表獨立壓縮、單次寫出；寫成功後才移除舊版 JSON 檔（舊檔讀取不受影響）
+        actual_file = binary_baseline_path(base_path)
+        stats = write_binary_baseline(actual_file, data, compression_format)
+        for old_format in ['gzip', 'lz4', 'zstd']:
+            old_file = base_path + CompressionFormat.get_extension(old_format)
+            if os.path.exists(old_file):
+                try:
+                    os.remove(old_file)
+                except OSError as e:
+                    logging.warning(f"清理舊檔案失敗: {e}")
+    else:
         # 檢查是否需要清理舊格式的檔案
         for old_format in ['gzip', 'lz4', 'zstd']:
             if old_format != compression_format:
@@ -105,22 +189,360 @@ def save_baseline(baseline_file_or_base_name, data):
                     except OSError as e:
                         logging.warning(f"清理舊檔案失敗: {e}")
         
+        # shared formula 按組保存：組員公式不逐格寫出，只寫 master 原文 + 組員範圍
+        cells = data.get('cells') if isinstance(data, dict) else None
+        if isinstance(cells, dict) and any(isinstance(ws, SheetCells) and ws.has_formula_groups for ws in cells.values()):
+            groups = {}
+            packed = {}
+            for name, ws in cells.items():
+                if isinstance(ws, SheetCells) and ws.has_formula_groups:
+                    packed[name] = ws.to_dict(expand_formulas=False)
+                    groups[name] = ws.formula_groups()
+                else:
+                    packed[name] = ws
+            data = dict(data, cells=packed, formula_groups=groups)
+        
         # 保存新檔案
         # 移除： print(f"[DEBUG] 開始保存壓縮檔案...")
         actual_file = save_compressed_file(base_path, data, compression_format)
         # 移除： print(f"[DEBUG] 保存完成: {actual_file}")
-        
-        # 簡化壓縮統計顯示
-        if settings.SHOW_COMPRESSION_STATS:
-            stats = get_compression_stats(actual_file)
-            if stats:
-                print(f"基準線保存: {os.path.basename(actual_file)} ({stats['format'].upper()}, {stats['compression_ratio']:.1f}%)")
-        
+        binary_file = binary_baseline_path(base_path)
+        if os.path.exists(binary_file):
+            try:
+                os.remove(binary_file)
+            except OSError as e:
+                logging.warning(f"清理舊檔案失敗: {e}")
+    
+    # 簡化壓縮統計顯示
+    if settings.SHOW_COMPRESSION_STATS:
+        stats = stats or get_compression_stats(actual_file)
+        if stats:
+            print(f"基準線保存: {os.path.basename(actual_file)} ({stats['format'].upper()}, {stats['compression_ratio']:.1f}%)")
+    
+    if delta_seq:
+        _trim_delta(base_path, delta_seq)
+    return True
+
+def _snapshot_exists(base_path):
+    return os.path.exists(binary_baseline_path(base_path)) or _legacy_snapshot_exists(base_path)
+
+def _legacy_snapshot_exists(base_path):
+    return any(os.path.exists(base_path + CompressionFormat.get_extension(f)) for f in ('gzip', 'lz4', 'zstd'))
+
+def _preferred_binary_file(base_path):
+    """
+    應讀取的二進位容器路徑；沒有二進位檔、或舊版 .baseline.json.* 較新（格式切換中途中斷）時返回 None
+    """
+    binary_file = binary_baseline_path(base_path)
+    if not os.path.exists(binary_file):
+        return None
+    legacy_mtimes = [os.path.getmtime(base_path + CompressionFormat.get_extension(f))
+                     for f in ('gzip', 'lz4', 'zstd')
+                     if os.path.exists(base_path + CompressionFormat.get_extension(f))]
+    if legacy_mtimes and os.path.getmtime(binary_file) < max(legacy_mtimes):
+        return None
+    return binary_file
+
+def _load_snapshot(base_path, lazy=False):
+    """
+    載入全量快照，返回 (data, binary)：
+    - 舊版 JSON 或 lazy=False：data 為 meta 欄位 + cells（+ formula_groups），binary 為 None
+    - 二進位容器且 lazy=True：data 只有 meta 欄位，binary = (header, blob)，由 _attach_binary_sheets 補上 cells
+    """
+    binary_file = _preferred_binary_file(base_path)
+    if binary_file:
+        try:
+            if lazy:
+                header, blob = load_binary_file(binary_file)
+                return dict(header.meta), (header, blob)
+            return read_binary_baseline(binary_file), None
+        except (ValueError, KeyError, IndexError, TypeError, struct.error) as e:
+            logging.error(f"讀取二進位基準線失敗 {os.path.basename(binary_file)}: {e}")
+            if not _legacy_snapshot_exists(base_path):
+                return None, None
+    from utils.compression import load_compressed_file
+    return load_compressed_file(base_path), None
+
+def _attach_binary_sheets(data, binary, eager_names, lazy_state):
+    """二進位容器的各表放入 data['cells']：eager_names 中的表立即解碼（供套用 delta），其餘以 LazySheet 佔位"""
+    header, blob = binary
+    cells = {}
+    groups = {}
+    for entry in header.sheets:
+        name = entry[0]
+        if name in eager_names or len(entry) < 5:
+            ws, g = decode_sheet_block(header, blob, entry)
+            cells[name] = ws
+            if g:
+                groups[name] = g
+        else:
+            cells[name] = LazySheet(functools.partial(_decode_lazy_sheet, header, blob, entry, lazy_state),
+                                    count=entry[4], nbytes=entry[3])
+    data['cells'] = cells
+    if groups:
+        data['formula_groups'] = groups
+
+def _decode_lazy_sheet(header, blob, entry, lazy_state):
+    # LazySheet 首次讀取：解碼該表並套用與整份載入相同的存放形式（欄式 / 展開 shared formula）
+    name = entry[0]
+    ws, g = decode_sheet_block(header, blob, entry)
+    one = {name: ws}
+    groups = {name: groups_from_json(g)} if g else None
+    if compact_enabled():
+        compact_workbook(one, ext_scanned=lazy_state.get('ext_scanned', False), formula_groups=groups)
+    elif groups:
+        expand_formula_groups(one, groups)
+    return one[name]
+
+def load_baseline_meta(baseline_file_or_base_name):
+    """
+    只讀基準線的中繼資料（source_mtime/source_size/last_author/...，已套用 delta 段的更新），不含 cells。
+    二進位容器只讀檔頭不解壓任何表；舊版 JSON 基準線只能整份載入後取出。
+    """
+    try:
+        base_path = _resolve_base_path(baseline_file_or_base_name)
+        binary_file = _preferred_binary_file(base_path)
+        meta = None
+        if binary_file:
+            try:
+                meta = dict(read_binary_header(binary_file).meta)
+            except (ValueError, KeyError, IndexError, TypeError, struct.error) as e:
+                logging.error(f"讀取二進位基準線失敗 {os.path.basename(binary_file)}: {e}")
+        if meta is None:
+            from utils.compression import load_compressed_file
+            data = load_compressed_file(base_path)
+            if not isinstance(data, dict):
+                return None
+            meta = {k: v for k, v in data.items() if k not in ('cells', 'formula_groups')}
+        for record in _read_delta_segments(base_path, int(meta.pop('delta_seq', 0) or 0)):
+            meta.update(record.get('meta') or {})
+        return meta
+    except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError, gzip.BadGzipFile) as e:
+        logging.error(f"載入基準線失敗 {baseline_file_or_base_name}: {e}")
+        return None
+
+# =========== 增量基準線 ============
+# 基準線 = 全量快照（<base>.baseline.json.*）+ 追加的 delta 段（<base>.baseline.json.delta）。
+# delta 檔：magic + 序號下限（已併入快照者），之後每段為 (壓縮格式碼, 序號, 長度) + 壓縮 JSON：
+#   {'meta': cells 以外的頂層欄位, 'sheet_order': [...], 'sheets': {ws: {'set': {addr: cell}, 'del': [addr]}}}
+# 快照記錄 delta_seq，載入時只套用序號更大的段；壓實或全量保存中途中斷也不會重覆套用。
+_DELTA_EXT = '.delta'
+_DELTA_MAGIC = b'BLDELTA1'
+_DELTA_FILE_HEADER = struct.Struct('<Q')
+_DELTA_SEG_HEADER = struct.Struct('<BQI')
+_DELTA_FORMATS = (CompressionFormat.GZIP, CompressionFormat.LZ4, CompressionFormat.ZSTD)
+
+_delta_guard = threading.Lock()
+_delta_locks = {}        # base_path -> (追加鎖, 全量寫入鎖)
+_full_generation = {}    # base_path -> 全量保存次數；背景壓實開工前據此判斷是否已被新的全量保存取代
+_compacting = set()
+_compact_slots = threading.BoundedSemaphore(1)   # 同時最多一個背景壓實，限制記憶體與 CPU 佔用
+
+def _locks_for(base_path):
+    with _delta_guard:
+        locks = _delta_locks.get(base_path)
+        if locks is None:
+            locks = _delta_locks[base_path] = (threading.Lock(), threading.Lock())
+        return locks
+
+def _scan_delta(f):
+    """
+    掃描已開啟的 delta 檔，返回 (序號下限, [(格式碼, 序號, 資料位移, 長度), ...], 最後完整段的結尾位置)。
+    檔頭無效時結尾位置為 None；尾端寫到一半的段略過。
+    """
+    head_size = len(_DELTA_MAGIC) + _DELTA_FILE_HEADER.size
+    head = f.read(head_size)
+    if len(head) < head_size or not head.startswith(_DELTA_MAGIC):
+        return 0, [], None
+    floor = _DELTA_FILE_HEADER.unpack_from(head, len(_DELTA_MAGIC))[0]
+    size = os.fstat(f.fileno()).st_size
+    segs = []
+    pos = head_size
+    while pos + _DELTA_SEG_HEADER.size <= size:
+        f.seek(pos)
+        fmt, seq, length = _DELTA_SEG_HEADER.unpack(f.read(_DELTA_SEG_HEADER.size))
+        start = pos + _DELTA_SEG_HEADER.size
+        if start + length > size:
+            break
+        segs.append((fmt, seq, start, length))
+        pos = start + length
+    return floor, segs, pos
+
+def _last_delta_seq(base_path):
+    with _locks_for(base_path)[0]:
+        try:
+            with open(base_path + _DELTA_EXT, 'rb') as f:
+                floor, segs, _ = _scan_delta(f)
+        except FileNotFoundError:
+            return 0
+    return max([floor] + [s[1] for s in segs])
+
+def _read_delta_segments(base_path, after_seq):
+    """按序讀出序號大於 after_seq 的 delta 段；某段損壞時之後的段一律不套用"""
+    out = []
+    try:
+        with open(base_path + _DELTA_EXT, 'rb') as f:
+            _, segs, _ = _scan_delta(f)
+            for fmt, seq, start, length in segs:
+                if seq <= after_seq:
+                    continue
+                f.seek(start)
+                try:
+                    out.append(json.loads(decompress_data(f.read(length), _DELTA_FORMATS[fmt])))
+                except (ValueError, IndexError, OSError) as e:
+                    logging.warning(f"delta 段讀取失敗 {os.path.basename(base_path)}#{seq}: {e}")
+                    break
+    except FileNotFoundError:
+        pass
+    return out
+
+def _apply_delta_segments(data, segments, formula_groups=None):
+    """
+    把 delta 段依序套用到剛載入的基準線（cells 仍為 dict）。
+    被改寫或刪除的儲存格移出 shared formula 組（其公式已在 delta 中逐格記錄）。
+    """
+    cells = data.get('cells') or {}
+    versions = {data.get('external_ref_version')}
+    for record in segments:
+        meta = record.get('meta') or {}
+        versions.add(meta.get('external_ref_version'))
+        data.update(meta)
+        for name, change in (record.get('sheets') or {}).items():
+            ws = cells.get(name)
+            if not isinstance(ws, dict):
+                ws = cells[name] = {}
+            touched = list((change.get('set') or {}).keys())
+            ws.update(change.get('set') or {})
+            for addr in change.get('del') or ():
+                ws.pop(addr, None)
+                touched.append(addr)
+            groups = (formula_groups or {}).get(name)
+            if groups and touched:
+                keys = {addr_to_key(a) for a in touched}
+                formula_groups[name] = [(raw, mk, [k for k in members if k not in keys]) for raw, mk, members in groups]
+        order = record.get('sheet_order')
+        if order is not None:
+            cells = {name: cells.get(name, {}) for name in order}
+            for name in list(formula_groups or {}):
+                if name not in cells:
+                    del formula_groups[name]
+    data['cells'] = cells
+    # 快照與 delta 來自不同版本的外部參照偵測時，不可再信任 external_ref 位元
+    if len(versions) > 1:
+        data['external_ref_version'] = None
+
+def _append_delta_segment(base_path, record):
+    """追加一段 delta，返回 (序號, 段數, delta 檔大小)"""
+    fmt = CompressionFormat.validate_format(settings.DEFAULT_COMPRESSION_FORMAT)
+    payload = compress_data(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=json_default), fmt)
+    delta_path = base_path + _DELTA_EXT
+    with _locks_for(base_path)[0]:
+        try:
+            with open(delta_path, 'rb') as f:
+                floor, segs, end = _scan_delta(f)
+        except FileNotFoundError:
+            floor, segs, end = 0, [], None
+        seq = max([floor] + [s[1] for s in segs]) + 1
+        if end is None:
+            with open(delta_path, 'wb') as f:
+                f.write(_DELTA_MAGIC + _DELTA_FILE_HEADER.pack(floor))
+            end = len(_DELTA_MAGIC) + _DELTA_FILE_HEADER.size
+        with open(delta_path, 'r+b') as f:
+            f.seek(end)
+            f.truncate()
+            f.write(_DELTA_SEG_HEADER.pack(_DELTA_FORMATS.index(fmt), seq, len(payload)))
+            f.write(payload)
+            size = f.tell()
+    return seq, len(segs) + 1, size
+
+def _trim_delta(base_path, upto_seq):
+    """移除已併入快照（序號 <= upto_seq）的 delta 段；序號下限保留，之後追加的序號仍遞增"""
+    delta_path = base_path + _DELTA_EXT
+    with _locks_for(base_path)[0]:
+        try:
+            with open(delta_path, 'rb') as f:
+                floor, segs, end = _scan_delta(f)
+                if end is None:
+                    return
+                kept = []
+                for fmt, seq, start, length in segs:
+                    if seq > upto_seq:
+                        f.seek(start)
+                        kept.append(_DELTA_SEG_HEADER.pack(fmt, seq, length) + f.read(length))
+        except FileNotFoundError:
+            return
+        tmp_path = delta_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_DELTA_MAGIC + _DELTA_FILE_HEADER.pack(max(floor, upto_seq)))
+            for chunk in kept:
+                f.write(chunk)
+        os.replace(tmp_path, delta_path)
+
+def _schedule_compaction(base_path, data, seq):
+    """背景壓實：以本次完整內容（已含序號 <= seq 的所有 delta）重寫快照，再移除已併入的段"""
+    with _delta_guard:
+        if base_path in _compacting:
+            return
+        _compacting.add(base_path)
+        generation = _full_generation.get(base_path, 0)
+
+    def _run():
+        try:
+            with _compact_slots, _locks_for(base_path)[1]:
+                # 期間已有全量保存（內容更新），不再以較舊的內容覆寫
+                if _full_generation.get(base_path, 0) == generation:
+                    _write_full_baseline(base_path, data, delta_seq=seq)
+        except Exception as e:
+            logging.warning(f"背景壓實基準線失敗 {os.path.basename(base_path)}: {e}")
+        finally:
+            with _delta_guard:
+                _compacting.discard(base_path)
+
+    threading.Thread(target=_run, name='baseline-compact', daemon=True).start()
+
+def update_baseline(baseline_file_or_base_name, data, changed_cells=None):
+    """
+    比較後更新基準線。changed_cells = { sheet: [與現有基準線不同的位址...] }（取自本次事件差異）。
+    - 已有快照且變更比例不高時只追加 delta 段，不重寫整份基準線
+    - delta 段數或大小達上限時於背景壓實
+    - 未啟用增量、沒有快照、未提供 changed_cells 或變更過多時等同 save_baseline
+    """
+    if not getattr(settings, 'BASELINE_DELTA_ENABLED', True) or changed_cells is None or not isinstance(data, dict):
+        return save_baseline(baseline_file_or_base_name, data)
+    try:
+        base_path = _resolve_base_path(baseline_file_or_base_name)
+        has_snapshot = _snapshot_exists(base_path)
+        cells = data.get('cells') or {}
+        total = sum(len(ws) for ws in cells.values())
+        n_changed = sum(len(addrs) for addrs in changed_cells.values())
+        max_ratio = float(getattr(settings, 'BASELINE_DELTA_MAX_RATIO', 0.2) or 0)
+        if not has_snapshot or n_changed > max_ratio * max(total, 1):
+            return save_baseline(baseline_file_or_base_name, data)
+
+        sheets = {}
+        for name, addrs in changed_cells.items():
+            ws = cells.get(name) or {}
+            set_cells, deleted = {}, []
+            for addr in addrs:
+                cell = ws.get(addr)
+                if cell is None:
+                    deleted.append(addr)
+                else:
+                    set_cells[addr] = cell
+            sheets[name] = {'set': set_cells, 'del': deleted}
+        meta = {k: v for k, v in data.items() if k != 'cells'}
+        meta['external_ref_version'] = EXTERNAL_REF_DETECTOR_VERSION
+        record = {'meta': meta, 'sheet_order': list(cells.keys()), 'sheets': sheets}
+        seq, count, size = _append_delta_segment(base_path, record)
+
+        max_segments = int(getattr(settings, 'BASELINE_DELTA_MAX_SEGMENTS', 20) or 0)
+        max_bytes = float(getattr(settings, 'BASELINE_DELTA_MAX_MB', 8) or 0) * 1024 * 1024
+        if (max_segments and count >= max_segments) or (max_bytes and size >= max_bytes):
+            _schedule_compaction(base_path, data, seq)
         return True
-        
-    except (FileNotFoundError, PermissionError, OSError) as e:
-        logging.error(f"保存基準線檔案失敗: {e}")
-        return False
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f"增量更新基準線失敗，改為全量保存: {e}")
+        return save_baseline(baseline_file_or_base_name, data)
 
 def archive_old_baselines():
     """
@@ -153,6 +575,180 @@ def archive_old_baselines():
     except (OSError, shutil.Error) as e:
         logging.error(f"歸檔過程出錯: {e}")
 
+def _build_baseline_for_file(file_path, silent=False, track_timeout=True):
+    """
+    單檔 baseline：載入舊基準線 → 解析 → 雜湊 → 保存。
+    回傳 {status, elapsed, original_size, compressed_size, error}，供序列與並發模式共用。
+    track_timeout=False（並發模式）時不寫入 timeout_handler 監看的全局 current_processing_file，
+    超時只以本檔自己的耗時判斷，避免不同 worker 互相誤判或清除。
+    """
+    from utils.helpers import _baseline_key_for_path
+    # 使用包含路徑哈希的 key，避免同名不同路徑覆蓋
+    base_key = _baseline_key_for_path(file_path)
+    outcome = {'file_path': file_path, 'status': None, 'elapsed': 0.0,
+               'original_size': 0, 'compressed_size': 0, 'error': None}
+    file_start_time = time.time()
+    cell_data = None
+    old_baseline = None
+    try:
+        old_baseline = load_baseline(base_key)
+        old_hash = old_baseline['content_hash'] if old_baseline and 'content_hash' in old_baseline else None
+
+        zip_members = {}
+        cell_data = dump_excel_cells_with_timeout(file_path, silent=silent, reuse_baseline=old_baseline,
+                                                  members_out=zip_members, track_timeout=track_timeout)
+
+        if cell_data is None:
+            timed_out = (time.time() - file_start_time) > settings.FILE_TIMEOUT_SECONDS
+            if track_timeout:
+                timed_out = timed_out and settings.current_processing_file is None
+            outcome['status'] = 'TIMEOUT' if timed_out else 'READ_ERROR'
+        else:
+            curr_hash = hash_excel_content(cell_data)
+            if old_hash == curr_hash and old_hash is not None:
+                outcome['status'] = 'SKIP'
+                # 舊 baseline 尚未記錄 zip 成員清單時補寫一次，之後比較可跳過未變工作表
+                if zip_members and not old_baseline.get('zip_members'):
+                    old_baseline['zip_members'] = zip_members
+                    save_baseline(base_key, old_baseline)
+            else:
+                curr_author = get_excel_last_author(file_path)
+                baseline_data = {
+                    "source_mtime": os.path.getmtime(file_path),
+                    "source_size": os.path.getsize(file_path),
+                    "last_author": curr_author,
+                    "content_hash": curr_hash,
+                    "cells": cell_data
+                }
+                if zip_members:
+                    baseline_data["zip_members"] = zip_members
+                if save_baseline(base_key, baseline_data):
+                    outcome['status'] = 'OK'
+                    # 統計壓縮效果
+                    if settings.SHOW_COMPRESSION_STATS:
+                        actual_file = get_baseline_file_with_extension(base_key)
+                        if actual_file:
+                            stats = get_compression_stats(actual_file)
+                            if stats and stats['original_size']:
+                                outcome['original_size'] = stats['original_size']
+                                outcome['compressed_size'] = stats['compressed_size']
+                else:
+                    outcome['status'] = 'SAVE_ERROR'
+    except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
+        outcome['status'] = 'UNEXPECTED_ERROR'
+        outcome['error'] = e
+    finally:
+        if cell_data is not None:
+            del cell_data
+        if old_baseline is not None:
+            del old_baseline
+        gc.collect()
+        outcome['elapsed'] = time.time() - file_start_time
+    return outcome
+
+def _report_baseline_outcome(outcome):
+    """
+    輸出單檔 baseline 結果（序列模式逐檔輸出；並發模式按檔案順序輸出）
+    """
+    if outcome['status'] == 'UNEXPECTED_ERROR':
+        logging.error(f"  結果: [UNEXPECTED_ERROR]\n  錯誤: {outcome['error']}\n  耗時: {outcome['elapsed']:.2f} 秒\n")
+        return
+    label = {'SKIP': '[SKIP] (Hash unchanged)'}.get(outcome['status'], f"[{outcome['status']}]")
+    print(f"  結果: {label}")
+    print(f"  耗時: {outcome['elapsed']:.2f} 秒")
+    print("")
+
+def _wait_for_memory_budget(budget_mb, max_wait_sec=60.0):
+    """
+    並發模式的記憶體預算：目前用量 + 單一 worker 預算超過 MEMORY_LIMIT_MB 時先等待其他檔案釋放。
+    逾時仍不足則回傳 False（由呼叫方停止派工並保存進度）。
+    """
+    if not settings.ENABLE_MEMORY_MONITOR:
+        return True
+    deadline = time.time() + max_wait_sec
+    while get_memory_usage() + budget_mb > settings.MEMORY_LIMIT_MB:
+        if settings.force_stop or time.time() > deadline:
+            return False
+        gc.collect()
+        time.sleep(0.5)
+    return True
+
+def _create_baselines_parallel(xlsx_files, start_index, total, workers):
+    """
+    並發建立 baseline：複製/解析/雜湊/保存由 N 個 worker 管線化執行。
+    - 每個 worker 的記憶體預算為 MEMORY_LIMIT_MB / N，不足時延後開工
+    - 結果按檔案順序輸出；進度只記錄「連續完成」的前綴，與 save_progress/load_progress 續跑相容
+    回傳 (success, skip, error, original_size, compressed_size)
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    budget_mb = float(settings.MEMORY_LIMIT_MB) / workers
+    print(f"🧵 並發建立基準線: {workers} 個 worker（每個記憶體預算 {budget_mb:.0f} MB）")
+    success_count, skip_count, error_count = 0, 0, 0
+    total_original_size, total_compressed_size = 0, 0
+    stop_reason = None
+
+    def _job(i):
+        if settings.force_stop:
+            return {'file_path': xlsx_files[i], 'status': 'CANCELLED'}
+        if not _wait_for_memory_budget(budget_mb):
+            return {'file_path': xlsx_files[i], 'status': 'MEMORY'}
+        return _build_baseline_for_file(xlsx_files[i], silent=True, track_timeout=False)
+
+    results = {}
+    next_to_report = start_index
+    next_to_submit = start_index
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='baseline') as executor:
+        while True:
+            # 有界派工：最多 2N 個在途，停止或記憶體不足時不再派新工
+            while stop_reason is None and next_to_submit < total and len(pending) < workers * 2:
+                pending[executor.submit(_job, next_to_submit)] = next_to_submit
+                next_to_submit += 1
+            if not pending:
+                break
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = pending.pop(fut)
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    results[i] = {'file_path': xlsx_files[i], 'status': 'UNEXPECTED_ERROR', 'error': e, 'elapsed': 0.0}
+
+            # 按順序輸出並推進進度水位
+            while next_to_report in results:
+                outcome = results[next_to_report]
+                status = outcome['status']
+                if status in ('CANCELLED', 'MEMORY'):
+                    if stop_reason is None:
+                        stop_reason = status
+                    break
+                results.pop(next_to_report)
+                print(f"[{next_to_report+1:>2}/{total}] {os.path.basename(outcome['file_path'])}")
+                _report_baseline_outcome(outcome)
+                if status == 'OK':
+                    success_count += 1
+                    total_original_size += outcome.get('original_size', 0)
+                    total_compressed_size += outcome.get('compressed_size', 0)
+                elif status == 'SKIP':
+                    skip_count += 1
+                else:
+                    error_count += 1
+                next_to_report += 1
+                save_progress(next_to_report, total)
+
+            if stop_reason is None and settings.force_stop:
+                stop_reason = 'CANCELLED'
+
+    if stop_reason == 'CANCELLED':
+        print("\n🛑 收到停止信號，正在安全退出...")
+    elif stop_reason == 'MEMORY':
+        print(f"❌ 記憶體仍然過高，停止處理")
+    if stop_reason:
+        # 已完成但未連續的檔案不計入水位，續跑時會重新處理（baseline 雜湊相同會直接 SKIP）
+        save_progress(next_to_report, total)
+    return success_count, skip_count, error_count, total_original_size, total_compressed_size
+
 def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     """
     為多個檔案建立基準線
@@ -182,8 +778,11 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
         # 自動續跑：不再詢問
         start_index = progress.get('completed', 0)
     
-    # 啟動超時處理
-    if settings.ENABLE_TIMEOUT:
+    workers = max(1, int(getattr(settings, 'BASELINE_WORKERS', 1) or 1))
+    parallel = workers > 1 and (total - start_index) > 1
+
+    # 啟動超時處理（只監看序列模式寫入的全局目前檔案；並發模式各 worker 以自己的耗時判斷）
+    if settings.ENABLE_TIMEOUT and not parallel:
         from utils.helpers import timeout_handler
         timeout_thread = threading.Thread(target=timeout_handler, daemon=True)
         timeout_thread.start()
@@ -210,93 +809,54 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     total_original_size = 0
     total_compressed_size = 0
     
-    for i in range(start_index, total):
-        if settings.force_stop:
-            print("\n🛑 收到停止信號，正在安全退出...")
-            save_progress(i, total)
-            break
-        
-        file_path = xlsx_files[i]
-        # 使用包含路徑哈希的 key，避免同名不同路徑覆蓋
-        from utils.helpers import _baseline_key_for_path
-        base_key = _baseline_key_for_path(file_path)
-        display_name = os.path.basename(file_path)
-        
-        if check_memory_limit():
-            print(f"⚠️ 記憶體使用量過高，暫停10秒...")
-            time.sleep(10)
-            if check_memory_limit(): 
-                print(f"❌ 記憶體仍然過高，停止處理")
+    if parallel:
+        counts = _create_baselines_parallel(xlsx_files, start_index, total, workers)
+        success_count, skip_count, error_count, total_original_size, total_compressed_size = counts
+    else:
+        for i in range(start_index, total):
+            if settings.force_stop:
+                print("\n🛑 收到停止信號，正在安全退出...")
                 save_progress(i, total)
                 break
 
-        file_start_time = time.time()
-        print(f"[{i+1:>2}/{total}] 處理中: {display_name} (記憶體: {get_memory_usage():.1f}MB)")
-        
-        cell_data = None
-        try:
-            old_baseline = load_baseline(base_key)
-            old_hash = old_baseline['content_hash'] if old_baseline and 'content_hash' in old_baseline else None
-            
-            cell_data = dump_excel_cells_with_timeout(file_path)
-            
-            if cell_data is None:
-                if settings.current_processing_file is None and (time.time() - file_start_time) > settings.FILE_TIMEOUT_SECONDS:
-                     print(f"  結果: [TIMEOUT]")
-                else:
-                     print(f"  結果: [READ_ERROR]")
-                error_count += 1
+            file_path = xlsx_files[i]
+            display_name = os.path.basename(file_path)
+
+            if check_memory_limit():
+                print(f"⚠️ 記憶體使用量過高，暫停10秒...")
+                time.sleep(10)
+                if check_memory_limit():
+                    print(f"❌ 記憶體仍然過高，停止處理")
+                    save_progress(i, total)
+                    break
+
+            print(f"[{i+1:>2}/{total}] 處理中: {display_name} (記憶體: {get_memory_usage():.1f}MB)")
+            outcome = _build_baseline_for_file(file_path)
+            _report_baseline_outcome(outcome)
+            status = outcome['status']
+            if status == 'OK':
+                success_count += 1
+                total_original_size += outcome['original_size']
+                total_compressed_size += outcome['compressed_size']
+            elif status == 'SKIP':
+                skip_count += 1
             else:
-                curr_hash = hash_excel_content(cell_data)
-                if old_hash == curr_hash and old_hash is not None:
-                    print(f"  結果: [SKIP] (Hash unchanged)")
-                    skip_count += 1
-                else:
-                    curr_author = get_excel_last_author(file_path)
-                    baseline_data = {
-                        "source_mtime": os.path.getmtime(file_path),
-                        "source_size": os.path.getsize(file_path),
-                        "last_author": curr_author, 
-                        "content_hash": curr_hash, 
-                        "cells": cell_data
-                    }
-                    
-                    if save_baseline(base_key, baseline_data):
-                        print(f"  結果: [OK]")
-                        success_count += 1
-                        
-                        # 統計壓縮效果
-                        if settings.SHOW_COMPRESSION_STATS:
-                            actual_file = get_baseline_file_with_extension(base_key)
-                            if actual_file:
-                                stats = get_compression_stats(actual_file)
-                                if stats and stats['original_size']:
-                                    total_original_size += stats['original_size']
-                                    total_compressed_size += stats['compressed_size']
-                    else:
-                        print(f"  結果: [SAVE_ERROR]")
-                        error_count += 1
-            
-            print(f"  耗時: {time.time() - file_start_time:.2f} 秒")
-            print("")
-            save_progress(i + 1, total)
-            
-        except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
-            logging.error(f"  結果: [UNEXPECTED_ERROR]\n  錯誤: {e}\n  耗時: {time.time() - file_start_time:.2f} 秒\n")
-            error_count += 1
+                error_count += 1
             save_progress(i + 1, total)
-        finally:
-            if cell_data is not None: 
-                del cell_data
-            if 'old_baseline' in locals() and old_baseline is not None: 
-                del old_baseline
-            gc.collect()
 
     # 執行歸檔
     if settings.ENABLE_ARCHIVE_MODE:
         print("\n🗂️  檢查歸檔...")
         archive_old_baselines()
 
+    # zstd 字典：尚無字典或已過期時，以剛建立的基準線重新訓練
+    if getattr(settings, 'ZSTD_DICTIONARY_ENABLED', False):
+        try:
+            from utils.compression import maybe_train_zstd_dictionary
+            maybe_train_zstd_dictionary()
+        except (OSError, ValueError) as e:
+            logging.error(f"zstd 字典訓練失敗: {e}")
+
     settings.baseline_completed = True
     print("-" * 90 + f"\n🎯 BASELINE 建立完成! (總耗時: {time.time() - start_time:.2f} 秒)")
     print(f"✅ 成功: {success_count}, ⏭️  跳過: {skip_count}, ❌ 失敗: {error_count}")
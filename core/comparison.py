@@ -12,12 +12,14 @@ from wcwidth import wcwidth
 import config.settings as settings
 from utils.logging import _get_display_width
 from utils.helpers import get_file_mtime
-from core.excel_parser import pretty_formula, extract_external_refs, get_excel_last_author
-from core.baseline import load_baseline, baseline_file_path
+from core.excel_parser import pretty_formula, extract_external_refs, get_excel_last_author, has_external_reference
+from core.baseline import load_baseline, load_baseline_meta, baseline_file_path
+from utils.stat_cache import get_mtime, get_size
 import logging
 import hashlib
 import json as _json
 import core.baseline as baseline
+from utils.cell_store import SheetCells, key_to_addr, formula_text
 
 # 全局累積器：每次事件（file_path,event_number）收集所有工作表的顯示資料
 _per_event_accum = {}
@@ -261,64 +263,141 @@ def format_timestamp_for_display(timestamp_str):
         logging.error(f"格式化時間戳失敗: {timestamp_str}, 錯誤: {e}")
         return timestamp_str
 
-def compare_excel_changes(file_path, silent=False, event_number=None, is_polling=False):
+def diff_excel_changes(file_path, is_polling=False, retry_read=True):
     """
-    [最終修正版] 統一日誌記錄和顯示邏輯
+    只讀取並比對一次，返回結構化結果（不輸出、不寫檔）；由 render_excel_changes 決定顯示或保持靜默。
+    status: 'quick_skip' | 'read_error' | 'unchanged' | 'changed' | 'error'
+    retry_read=False：讀取失敗時不在本執行緒 sleep 重試，直接返回 read_error（由 asyncio 管線非阻塞地延後重試）
     """
+    result = {
+        'file_path': file_path,
+        'is_polling': is_polling,
+        'status': 'error',
+        'has_changes': False,
+        'base_key': None,
+        'old_baseline': {},
+        'baseline_cells': {},
+        'current_data': None,
+        'zip_members': None,
+        'old_author': 'N/A',
+        'new_author': 'Unknown',
+        'error': None,
+    }
     try:
         from core.excel_parser import dump_excel_cells_with_timeout
         
         from utils.helpers import _baseline_key_for_path
         base_key = _baseline_key_for_path(file_path)
+        result['base_key'] = base_key
         
-        old_baseline = load_baseline(base_key)
         # 快速跳過：只在「輪詢比較」時啟用；即時比較一律重新讀取，避免漏判
-        if is_polling and settings.QUICK_SKIP_BY_STAT and old_baseline and \
-           ("source_mtime" in old_baseline) and ("source_size" in old_baseline):
-            try:
-                cur_mtime = os.path.getmtime(file_path)
-                cur_size  = os.path.getsize(file_path)
-                base_mtime = float(old_baseline.get("source_mtime", 0))
-                base_size  = int(old_baseline.get("source_size", -1))
-                if (cur_size == base_size) and (abs(cur_mtime - base_mtime) <= float(getattr(settings,'MTIME_TOLERANCE_SEC',2.0))):
-                    if not silent:
-                        print(f"[快速通過] {os.path.basename(file_path)} mtime/size 未變，略過讀取。")
-                    return False
-            except Exception:
-                pass
+        # 只讀基準線中繼資料（二進位容器只讀檔頭），命中時完全不解壓任何工作表
+        if is_polling and settings.QUICK_SKIP_BY_STAT:
+            base_meta = load_baseline_meta(base_key)
+            if base_meta and ("source_mtime" in base_meta) and ("source_size" in base_meta):
+                try:
+                    # stat 快取：與輪詢/複製同一 tick 共用，不再另外往返
+                    cur_mtime = get_mtime(file_path)
+                    cur_size  = get_size(file_path)
+                    base_mtime = float(base_meta.get("source_mtime", 0))
+                    base_size  = int(base_meta.get("source_size", -1))
+                    if (cur_size == base_size) and (abs(cur_mtime - base_mtime) <= float(getattr(settings,'MTIME_TOLERANCE_SEC',2.0))):
+                        result['status'] = 'quick_skip'
+                        return result
+                except Exception:
+                    pass
+        
+        # 二進位基準線逐表延遲載入：沿用（zip 成員未變）的表不會被解壓
+        old_baseline = load_baseline(base_key, lazy=bool(getattr(settings, 'BASELINE_LAZY_LOAD', True)))
         if old_baseline is None:
             old_baseline = {}
+        result['old_baseline'] = old_baseline
 
-        current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True)
+        # 傳入舊 baseline：zip 成員 CRC 未變的工作表直接沿用，只解析有變的表
+        zip_members = {}
+        current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True,
+                                                     reuse_baseline=old_baseline, members_out=zip_members)
         if current_data is None:
+            if not retry_read:
+                result['status'] = 'read_error'
+                return result
             time.sleep(1)
-            current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True)
+            current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True,
+                                                         reuse_baseline=old_baseline, members_out=zip_members)
             if current_data is None:
-                if not silent:
-                    print(f"❌ 重試後仍無法讀取檔案: {os.path.basename(file_path)}")
-                return False
+                result['status'] = 'read_error'
+                return result
+        result['current_data'] = current_data
+        result['zip_members'] = zip_members or None
         
         baseline_cells = old_baseline.get('cells', {})
+        result['baseline_cells'] = baseline_cells
         if baseline_cells == current_data:
+            result['status'] = 'unchanged'
+            return result
+        
+        result['old_author'] = old_baseline.get('last_author', 'N/A')
+        try:
+            result['new_author'] = get_excel_last_author(file_path)
+        except Exception:
+            result['new_author'] = 'Unknown'
+
+        result['has_changes'] = any(
+            baseline_cells.get(ws, {}) != current_data.get(ws, {})
+            for ws in set(baseline_cells.keys()) | set(current_data.keys())
+        )
+        result['status'] = 'changed'
+        return result
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = e
+        return result
+
+def render_excel_changes(result, silent=False, event_number=None, is_polling=None):
+    """
+    使用 diff_excel_changes 的結果輸出比較表、寫 CSV/歷史並（如啟用）更新基準線；
+    silent=True 時不輸出也不寫檔，只返回是否有變更。
+    """
+    file_path = result['file_path']
+    if is_polling is None:
+        is_polling = result.get('is_polling', False)
+    status = result.get('status')
+    try:
+        if status == 'error':
+            if not silent and result.get('error') is not None:
+                logging.error(f"比較過程出錯: {result['error']}")
+            return False
+        if status == 'quick_skip':
+            if not silent:
+                print(f"[快速通過] {os.path.basename(file_path)} mtime/size 未變，略過讀取。")
+            return False
+        if status == 'read_error':
+            if not silent:
+                print(f"❌ 重試後仍無法讀取檔案: {os.path.basename(file_path)}")
+            return False
+        if status == 'unchanged':
             # 如果是輪詢且無變化，則不顯示任何內容
             if is_polling:
                 print(f"    [輪詢檢查] {os.path.basename(file_path)} 內容無變化。")
             return False
-        
+
+        base_key = result['base_key']
+        old_baseline = result['old_baseline']
+        baseline_cells = result['baseline_cells']
+        current_data = result['current_data']
+        old_author = result['old_author']
+        new_author = result['new_author']
         any_sheet_has_changes = False
-        
-        old_author = old_baseline.get('last_author', 'N/A')
-        try:
-            new_author = get_excel_last_author(file_path)
-        except Exception:
-            new_author = 'Unknown'
+        if silent:
+            # 靜默只需判斷有無差異，不做逐格分類
+            return bool(result.get('has_changes'))
 
-        for worksheet_name in set(baseline_cells.keys()) | set(current_data.keys()):
+        # 整個事件只比對一次：顯示、CSV、歷史快照與事件索引共用同一份結果
+        event_diff = get_event_diff(result)
+
+        for worksheet_name, sheet_diff in event_diff['sheets'].items():
             old_ws = baseline_cells.get(worksheet_name, {})
             new_ws = current_data.get(worksheet_name, {})
-            
-            if old_ws == new_ws:
-                continue
 
             any_sheet_has_changes = True
             
@@ -328,7 +407,7 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
                 current_timestamp = get_file_mtime(file_path)
                 
                 # 只顯示「有意義變更」（隱藏間接變更/無意義變更）
-                meaningful_changes = analyze_meaningful_changes(old_ws, new_ws)
+                meaningful_changes = sheet_diff['changes']
                 if not meaningful_changes:
                     continue
                 addrs = [c['address'] for c in meaningful_changes]
@@ -376,9 +455,7 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
                 except Exception:
                     pass
                 
-                # 分析並記錄有意義的變更
-                        # 分析並記錄有意義的變更（帶入設定控制）
-                meaningful_changes = analyze_meaningful_changes(old_ws, new_ws)
+                # 記錄有意義的變更（帶入設定控制）
                 if meaningful_changes:
                     # 只在非輪詢的第一次檢查時記錄日誌，避免重複
                     if not is_polling:
@@ -409,23 +486,14 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
             # MVP：保存完整快照（timeline）
             try:
                 from utils.history import save_history_snapshot, sync_history_to_git_repo, insert_event_index
-                mc_count = 0
-                try:
-                    mc_count = sum(len(analyze_meaningful_changes(baseline_cells.get(ws, {}), current_data.get(ws, {}))) for ws in set(baseline_cells.keys()) | set(current_data.keys()))
-                except Exception:
-                    mc_count = 0
+                mc_count = event_diff['meaningful_count']
                 # 1) 保存壓縮快照（LOG_FOLDER/history）
                 snap_path = save_history_snapshot(file_path, current_data, last_author=new_author, event_number=event_number, meaningful_changes_count=mc_count)
                 # 2) 同步純 JSON 到 excel_git_repo 並 commit（如 Git 可用）
                 git_json_path = sync_history_to_git_repo(file_path, current_data, last_author=new_author, event_number=event_number, meaningful_changes_count=mc_count)
-                # 3) 插入事件索引（SQLite）
-                try:
-                    old_cells = (baseline.load_baseline(base_key) or {}).get('cells', {})
-                except Exception:
-                    old_cells = baseline_cells or {}
+                # 3) 插入事件索引（SQLite）；計數直接取自本次事件差異，不再重新分類
                 insert_event_index(file_path,
-                                   old_cells=old_cells,
-                                   new_cells=current_data,
+                                   counters=event_diff['counters'],
                                    last_author=new_author,
                                    event_number=event_number,
                                    snapshot_path=snap_path,
@@ -446,7 +514,11 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
                      "source_mtime": cur_mtime,
                      "source_size": cur_size
                 }
-                if not baseline.save_baseline(base_key, updated_baseline):
+                if result.get('zip_members'):
+                    updated_baseline["zip_members"] = result['zip_members']
+                # 只把本次差異的儲存格追加為 delta 段（必要時由 update_baseline 改為全量保存）
+                changed_cells = {ws: info['addresses'] for ws, info in event_diff['sheets'].items()}
+                if not baseline.update_baseline(base_key, updated_baseline, changed_cells):
                     print(f"[WARNING] 基準線更新失敗: {os.path.basename(file_path)}")
         
         return any_sheet_has_changes
@@ -456,6 +528,14 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
             logging.error(f"比較過程出錯: {e}")
         return False
 
+
+def compare_excel_changes(file_path, silent=False, event_number=None, is_polling=False):
+    """
+    [最終修正版] 統一日誌記錄和顯示邏輯（讀取一次 + 輸出）
+    """
+    result = diff_excel_changes(file_path, is_polling=is_polling)
+    return render_excel_changes(result, silent=silent, event_number=event_number, is_polling=is_polling)
+
 def _sanitize_filename_component(s: str) -> str:
     try:
         s = str(s or '').strip()
@@ -565,11 +645,53 @@ def _write_full_event_console_file(file_path, event_number, worksheet_name, disp
         logging.error(f"寫入完整 Console 檔失敗: {e}")
 
 
+def _change_filtered_out(change_type):
+    """依 TRACK_*/IGNORE_* 設定判斷此變更類型是否不需記錄"""
+    return (
+        change_type in ('FORMULA_CHANGE_INTERNAL', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_FORMULA_CHANGES
+    ) or (
+        change_type == 'DIRECT_VALUE_CHANGE' and not settings.TRACK_DIRECT_VALUE_CHANGES
+    ) or (
+        change_type in ('EXTERNAL_REFRESH_UPDATE', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_EXTERNAL_REFERENCES
+    ) or (
+        change_type == 'INDIRECT_CHANGE' and settings.IGNORE_INDIRECT_CHANGES
+    )
+
+
 def analyze_meaningful_changes(old_ws, new_ws):
     """
     🧠 分析有意義的變更
     """
-    meaningful_changes = []
+    return _meaningful_from_differences(_sheet_differences(old_ws, new_ws))
+
+
+# 事件計數欄位：原始分類 -> compute_change_counters 的欄位名
+_COUNTER_FIELDS = {
+    'CELL_ADDED': 'addc',
+    'CELL_DELETED': 'delc',
+    'DIRECT_VALUE_CHANGE': 'dvc',
+    'FORMULA_CHANGE_INTERNAL': 'fci',
+    'EXTERNAL_REF_LINK_CHANGE': 'xrlc',
+    'EXTERNAL_REFRESH_UPDATE': 'xru',
+}
+
+
+def _sheet_differences(old_ws, new_ws):
+    """
+    返回兩張表所有不同儲存格的 (address, old_value, new_value, old_formula, new_formula, raw_type)。
+    值為顯示值（cached_value 優先）；raw_type 以「不套用顯示設定」的旗標分類
+    （show_external_refresh=True、不抑制同值、非 formula-only），顯示設定由 _effective_change_type 再套用。
+    DIFF_ENGINE='columnar'（預設）時走排序位址 merge-join 的整欄比較；無法轉為欄式的表回退逐格比較。
+    """
+    if str(getattr(settings, 'DIFF_ENGINE', 'columnar')).lower() == 'columnar':
+        try:
+            diffs = _sheet_differences_columnar(old_ws, new_ws)
+            if diffs is not None:
+                return diffs
+        except Exception as e:
+            logging.warning(f"欄式比較失敗，回退逐格比較: {e}")
+
+    diffs = []
     all_addresses = set(old_ws.keys()) | set(new_ws.keys())
     
     for addr in all_addresses:
@@ -579,40 +701,219 @@ def analyze_meaningful_changes(old_ws, new_ws):
         if old_cell == new_cell:
             continue
 
-        change_type = classify_change_type(
-            old_cell,
-            new_cell,
-            show_external_refresh=getattr(settings, 'SHOW_EXTERNAL_REFRESH_CHANGES', True),
-            suppress_internal_same_value=getattr(settings, 'SUPPRESS_INTERNAL_FORMULA_CHANGE_WITH_SAME_VALUE', False),
-            formula_only_mode=getattr(settings, 'FORMULA_ONLY_MODE', False),
-        )
-        
-        # 根據設定過濾變更
-        if (
-            change_type in ('FORMULA_CHANGE_INTERNAL', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_FORMULA_CHANGES
-        ) or (
-            change_type == 'DIRECT_VALUE_CHANGE' and not settings.TRACK_DIRECT_VALUE_CHANGES
-        ) or (
-            change_type in ('EXTERNAL_REFRESH_UPDATE', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_EXTERNAL_REFERENCES
-        ) or (
-            change_type == 'INDIRECT_CHANGE' and settings.IGNORE_INDIRECT_CHANGES
-        ):
-            continue
+        raw_type = classify_change_type(old_cell, new_cell,
+                                        show_external_refresh=True,
+                                        suppress_internal_same_value=False,
+                                        formula_only_mode=False)
 
         # 將輸出值優先用 cached_value（若存在）
         def _disp(x):
             return x.get('cached_value') if x.get('cached_value') is not None else x.get('value')
+        diffs.append((addr, _disp(old_cell), _disp(new_cell), old_cell.get('formula'), new_cell.get('formula'), raw_type))
+    
+    return diffs
+
+
+def _effective_change_type(raw_type, old_val, new_val, *, show_external_refresh, suppress_internal_same_value, formula_only_mode):
+    """把原始分類套上顯示設定；與 classify_change_type 帶同樣旗標時的結果一致"""
+    if raw_type == 'EXTERNAL_REFRESH_UPDATE' and not show_external_refresh:
+        return 'NO_CHANGE'
+    if raw_type == 'FORMULA_CHANGE_INTERNAL' and suppress_internal_same_value and (old_val == new_val):
+        return 'NO_CHANGE'
+    if raw_type == 'DIRECT_VALUE_CHANGE' and formula_only_mode:
+        return 'NO_CHANGE'
+    return raw_type
+
+
+def _meaningful_from_differences(diffs):
+    """由 _sheet_differences 的結果套用顯示設定與 TRACK_*/IGNORE_* 過濾，得出有意義變更列表"""
+    show_external_refresh = getattr(settings, 'SHOW_EXTERNAL_REFRESH_CHANGES', True)
+    suppress_internal_same_value = getattr(settings, 'SUPPRESS_INTERNAL_FORMULA_CHANGE_WITH_SAME_VALUE', False)
+    formula_only_mode = getattr(settings, 'FORMULA_ONLY_MODE', False)
+    meaningful_changes = []
+    for addr, old_val, new_val, old_formula, new_formula, raw_type in diffs:
+        change_type = _effective_change_type(raw_type, old_val, new_val,
+                                             show_external_refresh=show_external_refresh,
+                                             suppress_internal_same_value=suppress_internal_same_value,
+                                             formula_only_mode=formula_only_mode)
+        # 根據設定過濾變更
+        if _change_filtered_out(change_type):
+            continue
         meaningful_changes.append({
             'address': addr,
-            'old_value': _disp(old_cell),
-            'new_value': _disp(new_cell),
-            'old_formula': old_cell.get('formula'),
-            'new_formula': new_cell.get('formula'),
+            'old_value': old_val,
+            'new_value': new_val,
+            'old_formula': old_formula,
+            'new_formula': new_formula,
             'change_type': change_type
         })
-    
     return meaningful_changes
 
+
+def _counters_from_differences(diffs, counters=None):
+    """累加 dvc/fci/xrlc/xru/addc/delc/total_changes（與 compute_change_counters 定義一致）"""
+    if counters is None:
+        counters = {k: 0 for k in ['dvc', 'fci', 'xrlc', 'xru', 'addc', 'delc']}
+        counters['total_changes'] = 0
+    for d in diffs:
+        field = _COUNTER_FIELDS.get(d[5])
+        if field:
+            counters[field] += 1
+        # 其他（INDIRECT/NO_CHANGE）不計入上述細項，但 total 仍計
+    counters['total_changes'] += len(diffs)
+    return counters
+
+
+def compute_event_diff(old_cells, new_cells):
+    """
+    一次事件只比對一次：返回供顯示、CSV、歷史快照與事件索引共用的結果
+    {
+      'sheets': { ws: {'changes': [有意義變更...], 'differing_cells': n, 'addresses': [差異位址...], 'counters': {...}} },  # 只含有差異的表
+      'counters': {dvc, fci, xrlc, xru, addc, delc, total_changes},
+      'meaningful_count': n,
+    }
+    """
+    old_cells = old_cells or {}
+    new_cells = new_cells or {}
+    sheets = {}
+    totals = _counters_from_differences(())
+    meaningful_count = 0
+    names = list(old_cells.keys()) + [n for n in new_cells.keys() if n not in old_cells]
+    for ws in names:
+        old_ws = old_cells.get(ws, {})
+        new_ws = new_cells.get(ws, {})
+        if old_ws == new_ws:
+            continue
+        diffs = _sheet_differences(old_ws, new_ws)
+        changes = _meaningful_from_differences(diffs)
+        sheets[ws] = {
+            'changes': changes,
+            'differing_cells': len(diffs),
+            'addresses': [d[0] for d in diffs],
+            'counters': _counters_from_differences(diffs),
+        }
+        _counters_from_differences(diffs, totals)
+        meaningful_count += len(changes)
+    return {'sheets': sheets, 'counters': totals, 'meaningful_count': meaningful_count}
+
+
+def get_event_diff(result):
+    """diff_excel_changes 結果上的事件差異（首次取用時計算並存回 result['event_diff']）"""
+    event_diff = result.get('event_diff')
+    if event_diff is None:
+        event_diff = compute_event_diff(result.get('baseline_cells'), result.get('current_data'))
+        result['event_diff'] = event_diff
+    return event_diff
+
+
+# 整欄比較的區塊大小：整塊 list 切片相等（C 層比較）即跳過，只有不等的區塊才逐格檢查
+_DIFF_CHUNK = 512
+
+
+def _sheet_columns(ws):
+    """
+    返回 (key_array, (formula, value, cached_value, external_ref) 欄, external_ref 是否已由解析器偵測)；
+    無法轉為欄式時返回 None。公式欄保留 shared formula 組標記（同組同位置即同公式，不必展開）
+    """
+    sc = SheetCells.from_dict(ws) if not isinstance(ws, SheetCells) else ws
+    if sc is None:
+        return None
+    return sc.key_array, sc.columns(expand_formulas=False), sc.ext_scanned
+
+
+def _merge_join(okeys, nkeys):
+    """
+    兩個已排序位址鍵的 merge-join。
+    返回 (配對舊索引, 配對新索引, 只在舊的索引, 只在新的索引)。
+    """
+    pairs_o, pairs_n, only_o, only_n = [], [], [], []
+    i = j = 0
+    no, nn = len(okeys), len(nkeys)
+    while i < no and j < nn:
+        a, b = okeys[i], nkeys[j]
+        if a == b:
+            pairs_o.append(i)
+            pairs_n.append(j)
+            i += 1
+            j += 1
+        elif a < b:
+            only_o.append(i)
+            i += 1
+        else:
+            only_n.append(j)
+            j += 1
+    only_o.extend(range(i, no))
+    only_n.extend(range(j, nn))
+    return pairs_o, pairs_n, only_o, only_n
+
+
+def _changed_positions(old_cols, new_cols, n):
+    """已對齊的兩組欄中，(formula, value, cached_value, external_ref) 任一不等的位置"""
+    out = []
+    of, ov, oc, oe = old_cols
+    nf, nv, nc, ne = new_cols
+    for s in range(0, n, _DIFF_CHUNK):
+        e = min(s + _DIFF_CHUNK, n)
+        if of[s:e] == nf[s:e] and ov[s:e] == nv[s:e] and oc[s:e] == nc[s:e] and oe[s:e] == ne[s:e]:
+            continue
+        for p in range(s, e):
+            # tuple 比較與 dict == 相同（含 identity 捷徑）
+            if (of[p], ov[p], oc[p], oe[p]) != (nf[p], nv[p], nc[p], ne[p]):
+                out.append(p)
+    return out
+
+
+def _sheet_differences_columnar(old_ws, new_ws):
+    """
+    _sheet_differences 的欄式實作，輸出與逐格版本相同的差異（按列優先位址排序）：
+    - 兩邊轉成排序位址鍵 + 平行欄，merge-join 對齊；位址集合相同時直接對齊不需 join
+    - 整欄分塊比較過濾未變儲存格，不建立每格 dict
+    - 解析器已偵測過的表直接用 external_ref 位元，不再掃公式；其餘走 has_external_reference（LRU 快取）
+    - shared formula 組員以組標記比較，只有不等的位置才展開公式（展開後相同即非差異）
+    任一邊無法轉為欄式時返回 None（由呼叫方走逐格版本）。
+    """
+    old_side = _sheet_columns(old_ws)
+    new_side = _sheet_columns(new_ws)
+    if old_side is None or new_side is None:
+        return None
+    okeys, (OF, OV, OC, OE), old_scanned = old_side
+    nkeys, (NF, NV, NC, NE), new_scanned = new_side
+
+    found = []  # (key, 差異 tuple)
+
+    if okeys == nkeys:
+        po = pn = None
+        only_o = only_n = ()
+        old_cols, new_cols = (OF, OV, OC, OE), (NF, NV, NC, NE)
+    else:
+        po, pn, only_o, only_n = _merge_join(okeys, nkeys)
+        old_cols = tuple([col[i] for i in po] for col in (OF, OV, OC, OE))
+        new_cols = tuple([col[j] for j in pn] for col in (NF, NV, NC, NE))
+
+    for p in _changed_positions(old_cols, new_cols, len(old_cols[0])):
+        i = po[p] if po is not None else p
+        j = pn[p] if pn is not None else p
+        of, nf = formula_text(OF[i], okeys[i]), formula_text(NF[j], nkeys[j])
+        if of == nf and (OV[i], OC[i], OE[i]) == (NV[j], NC[j], NE[j]):
+            continue   # 只是存放形式不同（組標記 vs 字串）
+        old_val = OC[i] if OC[i] is not None else OV[i]
+        new_val = NC[j] if NC[j] is not None else NV[j]
+        # 解析器的 external_ref 已涵蓋 has_external_reference(規範化公式) 的所有情況
+        is_external = OE[i] or NE[j] or (not old_scanned and has_external_reference(of)) \
+            or (not new_scanned and has_external_reference(nf))
+        raw_type = _classify_present_cells(of, nf, old_val, new_val, is_external)
+        found.append((okeys[i], (key_to_addr(okeys[i]), old_val, new_val, of, nf, raw_type)))
+
+    for i in only_o:
+        found.append((okeys[i], (key_to_addr(okeys[i]), OC[i] if OC[i] is not None else OV[i], None,
+                                 formula_text(OF[i], okeys[i]), None, 'CELL_DELETED')))
+    for j in only_n:
+        found.append((nkeys[j], (key_to_addr(nkeys[j]), None, NC[j] if NC[j] is not None else NV[j],
+                                 None, formula_text(NF[j], nkeys[j]), 'CELL_ADDED')))
+
+    found.sort(key=lambda x: x[0])
+    return [d for _, d in found]
+
 def classify_change_type(old_cell, new_cell, *, show_external_refresh=True, suppress_internal_same_value=False, formula_only_mode=False):
     """
     🔍 分類變更類型
@@ -630,6 +931,13 @@ def classify_change_type(old_cell, new_cell, *, show_external_refresh=True, supp
     if old_cell and not new_cell:
         return 'CELL_DELETED'
 
+    return _classify_present_cells(old_formula, new_formula, old_val, new_val, is_external,
+                                   show_external_refresh=show_external_refresh,
+                                   suppress_internal_same_value=suppress_internal_same_value,
+                                   formula_only_mode=formula_only_mode)
+
+def _classify_present_cells(old_formula, new_formula, old_val, new_val, is_external, *, show_external_refresh=True, suppress_internal_same_value=False, formula_only_mode=False):
+    """兩邊儲存格都存在時的分類（逐格與欄式比較共用）"""
     # 公式變更：外部 vs 內部
     if old_formula != new_formula:
         if is_external:
@@ -654,25 +962,6 @@ def classify_change_type(old_cell, new_cell, *, show_external_refresh=True, supp
 
     return 'NO_CHANGE'
 
-def has_external_reference(formula):
-    if not formula:
-        return False
-    try:
-        import re
-        s = str(formula)
-        # 命中 [n]Sheet!A1
-        if re.search(r"\[(\d+)\][^!\]]+!", s):
-            return True
-        # 命中 '...\\[Book.xlsx]Sheet'!
-        if re.search(r"'[^']*\\\[[^\\\]]+\][^']*'!", s):
-            return True
-        # 命中 [Book.xlsx]Sheet!A1（無引號）
-        if re.search(r"\[[^\]]+\][^!]+!", s):
-            return True
-        return False
-    except Exception:
-        return False
-
 _recent_log_signatures = {}
 
 def log_meaningful_changes_to_csv(file_path, worksheet_name, changes, current_author):
@@ -8,11 +8,16 @@ import xml.etree.ElementTree as ET
 import re
 import json
 import hashlib
+import functools
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from openpyxl import load_workbook
 from openpyxl.worksheet.formula import ArrayFormula
 import config.settings as settings
 from utils.cache import copy_to_cache
+from utils.parse_cache import make_parse_key, get_cached, put_cached, get_parse_cache_stats
+from utils.cell_store import compact_workbook, compact_enabled, json_default, groups_from_parser
 import logging
 import urllib.parse
 
@@ -87,7 +92,7 @@ def _normalize_path(p: str) -> str:
     if s.startswith('\\\\'):
         prefix = '\\'
         t = s[2:]
-        while '\\' in t:
+        while '\\\\' in t:
             t = t.replace('\\\\', '\\')
         s = '\\' + t
     else:
@@ -117,23 +122,42 @@ def _excel_external_prefix(norm_path: str, sheet: str) -> str:
     return f"'{inside}'"
 
 
-def pretty_formula(formula, ref_map=None):
+# pretty_formula 用的樣式（預先編譯）
+_RE_PRETTY_PATH_WITH_SHEET = re.compile(r"\[(\d+)\]([^!\]]+)!")
+_RE_PRETTY_INDEX = re.compile(r"\[(\d+)\]")
+_RE_PRETTY_EQ_QUOTES = re.compile(r"=\s*''(?=(?:[A-Za-z]:\\|\\\\))")
+# 每個活頁簿（ref_map）的整式記憶上限；超過即清空重來
+_PRETTY_MEMO_MAX = 100000
+# 同時保留的活頁簿美化器數量（依 ref_map 內容區分，最近使用優先）
+_PRETTIFIER_SLOTS = 16
+
+
+class _FormulaPrettifier:
     """
-    將公式中的外部參照 [n]Sheet! 還原為 'full\\normalized\\path'!Sheet! 的可讀形式。
-    同時保留 Excel 語法結構，避免造成假差異。
+    單一活頁簿的公式美化器：ref_map 固定，因此
+    - [n] -> 歸一化路徑、(n, 工作表) -> 'path\\[Book]Sheet'! 前綴都只算一次（查表）
+    - 原始公式 -> 美化結果整式記憶（填滿整欄的絕對參照公式只跑一次 regex）
+    - 不含 '[' 也不含 "''" 的公式直接原樣返回，不跑 regex
     """
-    if formula is None:
-        return None
-    
-    # 修改：處理 ArrayFormula 物件
-    if isinstance(formula, ArrayFormula):
-        formula_str = formula.text if hasattr(formula, 'text') else str(formula)
-    else:
-        formula_str = str(formula)
-    
-    if ref_map:
+
+    def __init__(self, ref_map):
+        self.ref_map = dict(ref_map)
+        self._norm = {}
+        self._sheet_repl = {}
+        self._annotate = {}
+        self._memo = {}
+
+    def _norm_path(self, n):
+        norm_path = self._norm.get(n)
+        if norm_path is None:
+            norm_path = self._norm[n] = _normalize_path(self.ref_map.get(n, ''))
+        return norm_path
+
+    def _repl_path_with_sheet(self, m):
         # 1) 直接替換形如 [n]Sheet! 為 'path'!Sheet!
-        def repl_path_with_sheet(m):
+        key = (m.group(1), m.group(2))
+        out = self._sheet_repl.get(key)
+        if out is None:
             n = int(m.group(1))
             sheet = m.group(2)
             # 清理工作表名左右可能存在的引號，避免重複引號（例如 'Sheet 2' 內層再包一層）
@@ -142,35 +166,127 @@ def pretty_formula(formula, ref_map=None):
                     sheet = str(sheet).strip().strip("'\"")
             except Exception:
                 pass
-            raw_path = ref_map.get(n, '')
-            norm_path = _normalize_path(raw_path)
+            norm_path = self._norm_path(n)
             if norm_path:
                 prefix = _excel_external_prefix(norm_path, sheet)
                 # 保證只有一個單引號包裹在 ! 之前：處理邊界 "''!" → "'!"
                 out = f"{prefix}!"
                 out = out.replace("''!", "'!")
-                return out
-            return m.group(0)
-        s = re.sub(r"\[(\d+)\]([^!\]]+)!", repl_path_with_sheet, formula_str)
-        
+            else:
+                out = m.group(0)
+            self._sheet_repl[key] = out
+        return out
+
+    def _repl_annotate(self, m):
         # 2) 對其餘殘留的 [n] 標記（未帶 sheet 名）插入可讀提示
-        def repl_annotate(m):
-            n = int(m.group(1))
-            raw_path = ref_map.get(n, '')
-            norm_path = _normalize_path(raw_path)
-            if norm_path:
-                return f"[外部檔案{n}: {norm_path}]"
-            return m.group(0)
-        s = re.sub(r"\[(\d+)\]", repl_annotate, s)
+        key = m.group(1)
+        out = self._annotate.get(key)
+        if out is None:
+            n = int(key)
+            norm_path = self._norm_path(n)
+            out = f"[外部檔案{n}: {norm_path}]" if norm_path else m.group(0)
+            self._annotate[key] = out
+        return out
+
+    def pretty(self, formula_str):
+        if '[' not in formula_str and "''" not in formula_str:
+            return formula_str
+        s = self._memo.get(formula_str)
+        if s is not None:
+            return s
+        s = _RE_PRETTY_PATH_WITH_SHEET.sub(self._repl_path_with_sheet, formula_str)
+        s = _RE_PRETTY_INDEX.sub(self._repl_annotate, s)
         # 邊界清理：避免在等號後緊接本機/UNC 路徑時出現兩個單引號（="'"'C:\... → ='C:\...）
         try:
-            s = re.sub(r"=\s*''(?=(?:[A-Za-z]:\\|\\\\))", "='", s)
+            s = _RE_PRETTY_EQ_QUOTES.sub("='", s)
         except Exception:
             pass
+        if len(self._memo) >= _PRETTY_MEMO_MAX:
+            self._memo.clear()
+        self._memo[formula_str] = s
         return s
+
+
+_prettifiers = OrderedDict()
+_prettifiers_lock = threading.Lock()
+
+
+def _prettifier_for(ref_map):
+    """依 ref_map 內容取得（或建立）該活頁簿的美化器；同一活頁簿的多次解析共用記憶"""
+    key = tuple(sorted(ref_map.items(), key=lambda kv: str(kv[0])))
+    with _prettifiers_lock:
+        p = _prettifiers.get(key)
+        if p is None:
+            p = _prettifiers[key] = _FormulaPrettifier(ref_map)
+            while len(_prettifiers) > _PRETTIFIER_SLOTS:
+                _prettifiers.popitem(last=False)
+        else:
+            _prettifiers.move_to_end(key)
+        return p
+
+
+def pretty_formula(formula, ref_map=None):
+    """
+    將公式中的外部參照 [n]Sheet! 還原為 'full\\normalized\\path'!Sheet! 的可讀形式。
+    同時保留 Excel 語法結構，避免造成假差異。
+    同一 ref_map 的結果會記憶（見 _FormulaPrettifier）。
+    """
+    if formula is None:
+        return None
+    
+    # 修改：處理 ArrayFormula 物件
+    if isinstance(formula, ArrayFormula):
+        formula_str = formula.text if hasattr(formula, 'text') else str(formula)
+    else:
+        formula_str = str(formula)
+    
+    if ref_map:
+        return _prettifier_for(ref_map).pretty(formula_str)
     else:
         return formula_str
 
+# 外部參照偵測：三個樣式預先編譯；同一公式字串（整欄填滿的公式常重覆上千次）結果以 LRU 快取
+_RE_EXT_INDEXED = re.compile(r"\[(\d+)\][^!\]]+!")                 # [n]Sheet!A1
+_RE_EXT_QUOTED_PATH = re.compile(r"'[^']*\\\[[^\\\]]+\][^']*'!")   # '...\\[Book.xlsx]Sheet'!
+_RE_EXT_BOOK = re.compile(r"\[[^\]]+\][^!]+!")                     # 無引號 [Book.xlsx]Sheet!A1
+# 偵測邏輯版本：寫入 baseline，載入時據此判斷 external_ref 旗標可直接信任（比較時不必再掃公式）
+EXTERNAL_REF_DETECTOR_VERSION = 1
+
+
+@functools.lru_cache(maxsize=65536)
+def _external_ref_flags(s):
+    """返回 (含 [n]Sheet! 索引式外部參照, 含 [Book]Sheet! 具名外部參照)"""
+    return (_RE_EXT_INDEXED.search(s) is not None,
+            _RE_EXT_QUOTED_PATH.search(s) is not None or _RE_EXT_BOOK.search(s) is not None)
+
+
+def has_external_reference(formula):
+    """公式字串是否含外部參照（任一樣式命中即是）"""
+    if not formula:
+        return False
+    try:
+        indexed, named = _external_ref_flags(str(formula))
+        return indexed or named
+    except Exception:
+        return False
+
+
+def _prettify_and_detect_external(fstr, ref_map):
+    """
+    對公式做 pretty 並偵測外部參照，回傳 (formula, external_ref)。
+    openpyxl 與 XML 公式引擎共用，確保兩者輸出一致。
+    """
+    s_before = str(fstr)
+    try:
+        fstr = pretty_formula(fstr, ref_map=ref_map)
+    except Exception:
+        pass
+    # [n]Sheet!A1 看原始公式；[Book]Sheet! 兩種寫法看規範化後的公式
+    external_ref = _external_ref_flags(s_before)[0]
+    if not external_ref and isinstance(fstr, str):
+        external_ref = _external_ref_flags(fstr)[1]
+    return fstr, external_ref
+
 def get_cell_formula(cell):
     """
     取得 cell 公式（不論係普通 formula or array formula），一律回傳公式字串
@@ -207,6 +323,11 @@ def get_excel_last_author(path):
         local_path = copy_to_cache(path, silent=True)
         if not local_path or not os.path.exists(local_path):
             return None
+        # 同一快取副本（size/mtime 未變）直接重用上次讀到的作者
+        cache_key = make_parse_key('author', local_path)
+        cached = get_cached(cache_key)
+        if cached is not None:
+            return cached[0]
         try:
             with zipfile.ZipFile(local_path, 'r') as z:
                 core_xml = z.read('docProps/core.xml')
@@ -219,6 +340,7 @@ def get_excel_last_author(path):
                 if node is None:
                     node = root.find('dc:lastModifiedBy', ns)  # 極少數模板可能使用 dc
                 author = (node.text or '').strip() if node is not None else None
+                put_cached(cache_key, (author or None,), nbytes=256)
                 return author or None
         except (KeyError, zipfile.BadZipFile, ET.ParseError):
             # 結構異常或非 zip 格式（例如舊 xls），退回 openpyxl（仍用本地快取檔）
@@ -263,16 +385,107 @@ def safe_load_workbook(path, max_retry=5, delay=0.5, **kwargs):
             break
     raise last_err
 
-def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):  # noqa: C901
+def _iter_existing_cells(ws):
+    """
+    只產出 sheet XML 中實際存在的儲存格，略過 openpyxl 為補齊矩形而填入的 EmptyCell。
+    read-only worksheet 先 reset_dimensions()：缺少的 row 不再補齊成整列，
+    每列也只延伸到該列最後一個實際存在的 <c>，不受錯誤的 <dimension> 影響。
+    """
+    if hasattr(ws, 'reset_dimensions'):
+        try:
+            ws.reset_dimensions()
+        except Exception:
+            pass
+        rows = ws.iter_rows(values_only=False)
+    else:
+        rows = ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column, values_only=False)
+    for row in rows:
+        for cell in row:
+            # EmptyCell 無 coordinate；有公式的格 value 為公式字串，不會被略過
+            if getattr(cell, 'value', None) is None:
+                continue
+            yield cell
+
+def _warn_if_absurd_dimension(ws, silent=False):
+    """
+    檢查 worksheet 宣告的 <dimension>：觸及 Excel 上限（XFD / 1048576）或面積超過
+    SHEET_DIMENSION_WARN_CELLS 時發出警告。實際走訪為稀疏模式，不受此影響。
+    """
+    try:
+        max_row = int(ws.max_row or 0)
+        max_col = int(ws.max_column or 0)
+    except Exception:
+        return False
+    limit = int(getattr(settings, 'SHEET_DIMENSION_WARN_CELLS', 5000000) or 0)
+    at_excel_edge = max_row >= 1048576 or max_col >= 16384
+    too_large = limit > 0 and (max_row * max_col) > limit
+    if not (at_excel_edge or too_large):
+        return False
+    msg = f"工作表 '{ws.title}' 宣告範圍異常: {max_row} 列 x {max_col} 欄（{max_row * max_col:,} 格），可能有殘留格式；改用稀疏走訪只讀實際存在的儲存格"
+    logging.warning(msg)
+    if not silent:
+        print(f"   ⚠️  {msg}")
+    return True
+
+def _dump_cells_via_xml_engine(local_path, show_sheet_detail=True, silent=False, reuse_baseline=None, members_out=None,
+                               groups_out=None):
+    """
+    FORMULA_ENGINE='xml'：每個 worksheet XML 只串流一次，同時取得公式與 cached 值。
+    - 只輸出實際存在的 <c>，不走矩形範圍
+    - 支援 shared formula 展開與 array formula
+    - 值語意與 polars_xml 值引擎一致，cached_value 直接取自 <v>，無需 data_only 二次讀取
+    - 傳入 reuse_baseline 時，zip 成員 CRC 未變的工作表直接沿用 baseline cells
+    - groups_out 傳入 dict 時填入 shared formula 組（供欄式存放按組保存公式）
+    """
+    from utils.value_engines.xml_cells_reader import read_cells_from_xlsx_via_xml
+    ref_map = extract_external_refs(local_path)
+    if not silent:
+        print("   [formula-engine] XML (iterparse single pass -> formula + value)")
+    reuse = None
+    if reuse_baseline and reuse_baseline.get('zip_members') and isinstance(reuse_baseline.get('cells'), dict):
+        reuse = {'members': reuse_baseline['zip_members'], 'cells': reuse_baseline['cells']}
+    members = {}
+    cells_by_sheet = read_cells_from_xlsx_via_xml(
+        local_path,
+        formula_hook=functools.partial(_prettify_and_detect_external, ref_map=ref_map),
+        reuse=reuse,
+        members_out=members,
+        groups_out=groups_out,
+    )
+    # reused/parsed 只是本次統計，不寫入 baseline
+    reused, parsed = members.pop('reused', 0), members.pop('parsed', 0)
+    if members_out is not None:
+        members_out.update(members)
+    result = {}
+    worksheet_count = len(cells_by_sheet)
+    if not silent and show_sheet_detail:
+        print(f"   工作表數量: {worksheet_count}")
+    if not silent and reused:
+        print(f"   [formula-engine] 沿用未變工作表 {reused} 張，重新解析 {parsed} 張")
+    for idx, (sheet_name, ws_data) in enumerate(cells_by_sheet.items(), 1):
+        if show_sheet_detail and not silent:
+            print(f"      處理工作表 {idx}/{worksheet_count}: {sheet_name}（{len(ws_data)} 有資料 cell）")
+        if ws_data:
+            result[sheet_name] = ws_data
+    if not silent and show_sheet_detail:
+        print(f"   ✅ Excel 讀取完成")
+    return result
+
+def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False, reuse_baseline=None, members_out=None,  # noqa: C901
+                                  track_timeout=True):
     """
     提取 Excel 檔案中的所有儲存格數據（含公式）
     - 會先將來源檔複製到本地快取，再以 openpyxl 讀取（絕不直接讀原檔，視設定而定）
     - 值引擎優先用 polars（如不可用則自動回退到 XML）
     - 修正：external_ref 先安全初始化為 False，避免 UnboundLocalError
+    - FORMULA_ENGINE='xml' 時：reuse_baseline 提供舊 baseline（含 zip_members）以跳過未變工作表；
+      members_out 傳入 dict 時填入本次 zip 成員清單（供保存到 baseline）
+    - track_timeout=False 時不寫入 timeout_handler 監看的全局變數（並發建立 baseline 時使用）
     """
     # 更新全局變數
-    settings.current_processing_file = path
-    settings.processing_start_time = time.time()
+    if track_timeout:
+        settings.current_processing_file = path
+        settings.processing_start_time = time.time()
 
     wb = None
     try:
@@ -289,6 +502,41 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
                 print("   ❌ 無法使用快取副本（嚴格模式下不會讀取原檔），略過此檔案。")
             return None
 
+        # 解析結果快取：同一快取副本（size/mtime 未變）在輪詢窗口內重複事件直接重用
+        cache_key = make_parse_key('cells', local_path)
+        cached = get_cached(cache_key)
+        if cached is not None:
+            if members_out is not None:
+                members_out.update(get_cached(make_parse_key('zip_members', local_path)) or {})
+            if not silent:
+                st = get_parse_cache_stats()
+                print(f"   ♻️ 使用解析快取（副本未變；命中 {st['hits']}/{st['hits'] + st['misses']}）")
+            return cached
+
+        # 公式引擎：xml → 單次串流讀取公式與值，不經 openpyxl、不重覆解壓
+        if getattr(settings, 'FORMULA_ENGINE', 'openpyxl') == 'xml':
+            try:
+                members = {}
+                groups = {}
+                result = _dump_cells_via_xml_engine(local_path, show_sheet_detail=show_sheet_detail, silent=silent,
+                                                    reuse_baseline=reuse_baseline, members_out=members, groups_out=groups)
+                if compact_enabled():
+                    formula_groups = {}
+                    for name, g in groups.items():
+                        spec = groups_from_parser(g)
+                        if spec:
+                            formula_groups[name] = spec
+                    compact_workbook(result, ext_scanned=True, formula_groups=formula_groups)
+                put_cached(cache_key, result)
+                if members:
+                    put_cached(make_parse_key('zip_members', local_path), members, nbytes=64 * (len(members.get('sheets', {})) + 1))
+                if members_out is not None:
+                    members_out.update(members)
+                return result
+            except Exception as e:
+                if not silent:
+                    print(f"   [formula-engine] XML 引擎失敗，回退 openpyxl: {e}")
+
         read_only_mode = True
         if not silent:
             print(f"   🚀 讀取模式: read_only={read_only_mode}, data_only=False")
@@ -446,85 +694,73 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
                     show_keys = []
                 print(f"   [map] ws_index={idx} ws_title='{ws.title}' -> key='{selected_key or ''}' provided={p_count} keys={show_keys}")
 
-            if ws.max_row >= 1 and ws.max_column >= 1:
-                try:
-                    # 使用索引安全推導地址，避免 EmptyCell 無 coordinate 造成早退
-                    def _col_to_letters(n: int) -> str:
-                        s = ''
-                        while n > 0:
-                            n, r = divmod(n - 1, 26)
-                            s = chr(65 + r) + s
-                        return s
-
-                    for r_idx, row in enumerate(
-                        ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column, values_only=False),
-                        start=1
-                    ):
-                        for c_idx, cell in enumerate(row, start=1):
-                            addr = f"{_col_to_letters(c_idx)}{r_idx}"
-
-                            # 安全初始化，避免未賦值就使用
-                            external_ref = False
-
-                            # 讀公式：優先 cell.formula，再 fallback get_cell_formula
-                            try:
-                                if hasattr(cell, 'formula') and cell.formula:
-                                    fstr = cell.formula
-                                else:
-                                    fstr = get_cell_formula(cell)
-                            except Exception:
-                                fstr = None
+            # 稀疏走訪：只處理 sheet XML 中實際存在的 <c>，不再展開 max_row x max_column 矩形
+            _warn_if_absurd_dimension(ws, silent=silent)
+            try:
+                for cell in _iter_existing_cells(ws):
+                    addr = cell.coordinate
 
-                            # 如有公式，做 pretty 與外部參照偵測
-                            if fstr:
-                                try:
-                                    s_before = str(fstr)
-                                    try:
-                                        fstr = pretty_formula(fstr, ref_map=ref_map)
-                                    except Exception:
-                                        pass
-                                    import re as _re
-                                    # [n]Sheet!A1
-                                    if _re.search(r"\[(\d+)\][^!\]]+!", s_before):
-                                        external_ref = True
-                                    # 規範化後：'...\\[Book.xlsx]Sheet'!
-                                    elif isinstance(fstr, str) and _re.search(r"'[^']*\\\[[^\\\]]+\][^']*'!", fstr):
-                                        external_ref = True
-                                    # 無引號 [Book.xlsx]Sheet!A1
-                                    elif isinstance(fstr, str) and _re.search(r"\[[^\]]+\][^!]+!", fstr):
-                                        external_ref = True
-                                    formula_addrs.append(addr)
-                                    formula_cells_global += 1
-                                except Exception:
-                                    # 保持 external_ref = False
-                                    pass
-
-                            # 取值（由值引擎供應；失敗則退回 cell.value）
-                            try:
-                                vstr = sheet_vals.get(addr)
-                            except Exception as _e:
-                                if not silent:
-                                    print(f"   [read_error] sheet='{ws.title}' addr='{addr}' op='assemble' err={_e}")
-                                try:
-                                    vstr = serialize_cell_value(getattr(cell, 'value', None))
-                                except Exception:
-                                    vstr = None
-
-                            if fstr is not None or vstr is not None:
-                                # 若值引擎已提供顯示值，直接作為 cached_value 使用，避免後續二次 data_only pass
-                                cached_v = vstr if value_engine in ('polars', 'polars_xml', 'xml') else None
-                                ws_data[addr] = {
-                                    "formula": fstr,
-                                    "value": vstr,
-                                    "cached_value": cached_v,
-                                    "external_ref": bool(external_ref)
-                                }
-                                if fstr and (vstr is not None):
-                                    per_sheet_formula_provided[selected_key or ws.title] = per_sheet_formula_provided.get(selected_key or ws.title, 0) + 1
-                                cell_count += 1
-                except Exception as _e:
-                    if not silent:
-                        print(f"   [read_error] sheet='{ws.title}' op='iterate_rows' err={_e}")
+                    # 安全初始化，避免未賦值就使用
+                    external_ref = False
+
+                    # 讀公式：優先 cell.formula，再 fallback get_cell_formula
+                    try:
+                        if hasattr(cell, 'formula') and cell.formula:
+                            fstr = cell.formula
+                        else:
+                            fstr = get_cell_formula(cell)
+                    except Exception:
+                        fstr = None
+
+                    # 如有公式，做 pretty 與外部參照偵測
+                    if fstr:
+                        try:
+                            fstr, external_ref = _prettify_and_detect_external(fstr, ref_map)
+                            formula_addrs.append(addr)
+                            formula_cells_global += 1
+                        except Exception:
+                            # 保持 external_ref = False
+                            pass
+
+                    # 取值（由值引擎供應；失敗則退回 cell.value）
+                    try:
+                        vstr = sheet_vals.get(addr)
+                    except Exception as _e:
+                        if not silent:
+                            print(f"   [read_error] sheet='{ws.title}' addr='{addr}' op='assemble' err={_e}")
+                        try:
+                            vstr = serialize_cell_value(getattr(cell, 'value', None))
+                        except Exception:
+                            vstr = None
+
+                    if fstr is not None or vstr is not None:
+                        # 若值引擎已提供顯示值，直接作為 cached_value 使用，避免後續二次 data_only pass
+                        cached_v = vstr if value_engine in ('polars', 'polars_xml', 'xml') else None
+                        ws_data[addr] = {
+                            "formula": fstr,
+                            "value": vstr,
+                            "cached_value": cached_v,
+                            "external_ref": bool(external_ref)
+                        }
+                        if fstr and (vstr is not None):
+                            per_sheet_formula_provided[selected_key or ws.title] = per_sheet_formula_provided.get(selected_key or ws.title, 0) + 1
+                        cell_count += 1
+
+                # openpyxl 視為空白、但值引擎有值的格（例如 inline 值或 dimension 宣告錯誤），仍以純值格記錄
+                if isinstance(sheet_vals, dict):
+                    for addr, vstr in sheet_vals.items():
+                        if vstr is None or addr in ws_data:
+                            continue
+                        ws_data[addr] = {
+                            "formula": None,
+                            "value": vstr,
+                            "cached_value": vstr if value_engine in ('polars', 'polars_xml', 'xml') else None,
+                            "external_ref": False
+                        }
+                        cell_count += 1
+            except Exception as _e:
+                if not silent:
+                    print(f"   [read_error] sheet='{ws.title}' op='iterate_rows' err={_e}")
 
             if show_sheet_detail and not silent:
                 print(f"      處理工作表 {idx}/{worksheet_count}: {ws.title}（{cell_count} 有資料 cell）")
@@ -627,6 +863,10 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
         if not silent and show_sheet_detail:
             print(f"   ✅ Excel 讀取完成")
 
+        # 欄式存放：每張表換成 SheetCells（唯讀 Mapping），大表記憶體約降一個數量級
+        if compact_enabled():
+            compact_workbook(result, ext_scanned=True)
+        put_cached(cache_key, result)
         return result
 
     except Exception as e:
@@ -642,8 +882,9 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
             del wb
 
         # 重置全局變數
-        settings.current_processing_file = None
-        settings.processing_start_time = None
+        if track_timeout:
+            settings.current_processing_file = None
+            settings.processing_start_time = None
 
 def hash_excel_content(cells_dict):
     """
@@ -653,7 +894,7 @@ def hash_excel_content(cells_dict):
         return None
     
     try:
-        content_str = json.dumps(cells_dict, sort_keys=True, ensure_ascii=False)
+        content_str = json.dumps(cells_dict, sort_keys=True, ensure_ascii=False, default=json_default)
         return hashlib.md5(content_str.encode('utf-8')).hexdigest()
     except (TypeError, json.JSONEncodeError) as e:
         logging.error(f"計算 Excel 內容雜湊值失敗: {e}")
@@ -0,0 +1,124 @@
+"""
+事件管線（asyncio）：watchdog 事件 / 輪詢穩定 → 等待來源穩定並複製到本地快取 → 交回比較工作
+
+- 一個背景執行緒跑 asyncio event loop；等待 mtime 穩定、複製重試退避全部是 await，
+  數百個檔案同時「等待穩定」也不佔用執行緒
+- stat 與實際複製交給有上限的 I/O 執行緒池（PIPELINE_IO_WORKERS）
+- 準備完成後呼叫 on_ready（在 loop 執行緒上，只應放入佇列/排程，不可做解析）；
+  無法複製（嚴格模式且來源鎖住）或準備失敗時改呼叫 on_failed（若有），讓呼叫方結束或重新排程自己的流程
+  解析與比較仍由 PriorityWorkQueue / PollScheduler 的工作執行緒處理
+- 同一檔案已在準備中時，新的請求直接合併
+"""
+import os
+import asyncio
+import functools
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import config.settings as settings
+from utils.cache import copy_to_cache_async
+
+
+class EventPipeline:
+    def __init__(self, name='pipeline'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._io = None
+        self._lock = threading.Lock()
+        self._inflight = {}         # file_path -> concurrent.futures.Future
+        self._stopped = False
+        self.coalesced = 0
+
+    def _ensure_loop(self):
+        # 呼叫方需持有 self._lock；設定可能在 import 後才由設定 UI 覆寫，因此延後到第一次使用才建立
+        if self._loop is None:
+            workers = max(1, int(getattr(settings, 'PIPELINE_IO_WORKERS', 4)))
+            self._io = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{self.name}-io')
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name=f'{self.name}-loop', daemon=True)
+            self._thread.start()
+        return self._loop
+
+    async def run_blocking(self, fn, *args):
+        """在 I/O 執行緒池執行阻塞呼叫並 await 結果"""
+        return await self._loop.run_in_executor(self._io, functools.partial(fn, *args))
+
+    def submit(self, file_path, on_ready, delay=0.0, silent=True, on_failed=None):
+        """
+        非阻塞：delay 秒後（await）等待來源穩定並複製到快取，完成後呼叫 on_ready()；
+        複製失敗時呼叫 on_failed()（管線停止時兩者皆不呼叫）。
+        返回 False 表示同一檔案已在準備中（本次合併）或管線已停止。
+        """
+        with self._lock:
+            if self._stopped:
+                return False
+            if file_path in self._inflight:
+                self.coalesced += 1
+                return False
+            loop = self._ensure_loop()
+            future = asyncio.run_coroutine_threadsafe(self._prepare(file_path, on_ready, delay, silent, on_failed), loop)
+            self._inflight[file_path] = future
+        future.add_done_callback(lambda _f: self._done(file_path))
+        return True
+
+    def _done(self, file_path):
+        with self._lock:
+            self._inflight.pop(file_path, None)
+
+    async def _prepare(self, file_path, on_ready, delay, silent, on_failed):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            if self._stopped or getattr(settings, 'force_stop', False):
+                return
+            local_path = await copy_to_cache_async(file_path, silent=silent, run_blocking=self.run_blocking)
+            if not local_path:
+                # 嚴格模式且複製失敗：比較階段同樣無法讀取，不再交給工作執行緒比較
+                print(f"    [管線] {os.path.basename(file_path)} 無法複製到快取，略過本次。")
+                self._callback(on_failed, file_path)
+                return
+            if self._stopped or getattr(settings, 'force_stop', False):
+                return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[{self.name}] 準備檔案失敗 {file_path}: {e}")
+            self._callback(on_failed, file_path)
+            return
+        self._callback(on_ready, file_path)
+
+    def _callback(self, fn, file_path):
+        if fn is None:
+            return
+        try:
+            fn()
+        except Exception as e:
+            logging.error(f"[{self.name}] 交付後續工作失敗 {file_path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {'preparing': len(self._inflight), 'coalesced': self.coalesced}
+
+    def stop(self):
+        """取消所有準備中的檔案並停止 event loop"""
+        with self._lock:
+            self._stopped = True
+            futures = list(self._inflight.values())
+            self._inflight.clear()
+            loop, io = self._loop, self._io
+        for f in futures:
+            f.cancel()
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if io is not None:
+            io.shutdown(wait=False, cancel_futures=True)
+
+
+def pipeline_enabled():
+    return bool(getattr(settings, 'ASYNC_PIPELINE_ENABLED', True))
+
+
+# 全局事件管線（watcher 的事件處理與輪詢共用）
+event_pipeline = EventPipeline()
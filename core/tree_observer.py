@@ -0,0 +1,394 @@
+"""
+大型目錄樹（磁碟根目錄 / UNC 共用）專用的輪詢 observer，取代 watchdog 的 PollingObserver
+
+PollingObserver 每個間隔都重新走訪並 stat 整棵樹；數十萬檔案的網路共用上會佔滿一個核心並持續轟炸 SMB 伺服器。
+本 observer：
+- 只追蹤 SUPPORTED_EXTS（排除 ~$ 暫存檔），其他檔案不 stat、不記錄
+- 每個目錄記錄 mtime：每次只 stat 目錄本身，mtime 未變的目錄不列出內容（Excel 存檔為「寫暫存檔 + 改名」，必定更新目錄 mtime）
+- 目錄索引保存在 LOG_FOLDER/tree_index，重啟後未變動的目錄同樣略過
+- 以 os.scandir 列出目錄（Windows/SMB 上檔案 stat 直接取自目錄列表），各子樹由執行緒池平行處理
+- 每個目錄各自的輪詢間隔：有變動 → 回到 TREE_POLL_MIN_INTERVAL_SEC 且之後每次都列出內容（捕捉原地寫入）；
+  無變動 → 逐次乘以 TREE_POLL_BACKOFF，最長 TREE_POLL_MAX_INTERVAL_SEC
+- 每隔 TREE_POLL_FULL_RESCAN_SEC 無論目錄 mtime 是否變動都重新列出一次，作為安全網
+- 介面與 watchdog observer 相同（schedule/start/stop/join），事件以 handler.dispatch 交給 ExcelFileEventHandler；
+  啟動後第一輪只建立/校正索引，不發出事件（同 PollingObserver 的初始快照）
+"""
+import os
+import time
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, FileDeletedEvent
+
+import config.settings as settings
+from utils.compression import save_compressed_file, load_compressed_file
+
+TREE_INDEX_VERSION = 1
+
+
+class _DirState:
+    __slots__ = ('mtime', 'files', 'subdirs', 'interval', 'due', 'last_listed', 'error')
+
+    def __init__(self, mtime=None, files=None, subdirs=None, interval=0.0):
+        self.mtime = mtime              # 目錄 st_mtime_ns；None = 尚未列出
+        self.files = files or {}        # 檔名 -> (st_mtime_ns, st_size)，只含 SUPPORTED_EXTS
+        self.subdirs = subdirs or []    # 子目錄名稱（已排除的不記錄）
+        self.interval = interval
+        self.due = 0.0                  # 下次檢查的 monotonic 時間
+        self.last_listed = 0.0
+        self.error = False
+
+
+def _setting_float(name, default):
+    try:
+        return float(getattr(settings, name, default))
+    except Exception:
+        return float(default)
+
+
+def _under(path, folders):
+    for folder in folders:
+        try:
+            if os.path.commonpath([path, folder]) == folder:
+                return True
+        except ValueError:
+            # 不同磁碟機
+            continue
+    return False
+
+
+def _norm_list(folders):
+    return [os.path.normcase(os.path.abspath(f)) for f in (folders or []) if f]
+
+
+class _ExcludeRules:
+    """目錄層級的過濾：與 ExcelFileEventHandler 的 WATCH/MONITOR_ONLY 範圍及排除清單一致，另忽略 log/cache 目錄"""
+
+    def __init__(self):
+        self.watch = _norm_list(getattr(settings, 'WATCH_FOLDERS', []))
+        self.watch_ex = _norm_list(getattr(settings, 'WATCH_EXCLUDE_FOLDERS', []))
+        self.monitor = _norm_list(getattr(settings, 'MONITOR_ONLY_FOLDERS', []))
+        self.monitor_ex = _norm_list(getattr(settings, 'MONITOR_ONLY_EXCLUDE_FOLDERS', []))
+        self.ignored = []
+        if getattr(settings, 'IGNORE_LOG_FOLDER', False) and getattr(settings, 'LOG_FOLDER', None):
+            self.ignored.append(os.path.normcase(os.path.abspath(settings.LOG_FOLDER)))
+        if getattr(settings, 'IGNORE_CACHE_FOLDER', False) and getattr(settings, 'CACHE_FOLDER', None):
+            self.ignored.append(os.path.normcase(os.path.abspath(settings.CACHE_FOLDER)))
+
+    def excluded(self, path):
+        p = os.path.normcase(os.path.abspath(path))
+        if _under(p, self.ignored):
+            return True
+        in_watch = _under(p, self.watch) and not _under(p, self.watch_ex)
+        in_monitor = _under(p, self.monitor) and not _under(p, self.monitor_ex)
+        return not (in_watch or in_monitor)
+
+
+def _check_dir(path, known_mtime, force_list):
+    """
+    I/O 執行緒：stat 目錄；mtime 未變且不強制時不列出。
+    返回 ('gone'|'error'|'same'|'listed', mtime, (files, subdirs) 或 None)
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 'gone', None, None
+    except OSError as e:
+        return 'error', str(e), None
+    # 先取目錄 mtime 再列出：列出期間若有變動，下次 stat 時 mtime 不同會再列一次
+    if known_mtime is not None and st.st_mtime_ns == known_mtime and not force_list:
+        return 'same', known_mtime, None
+    exts = settings.SUPPORTED_EXTS
+    files = {}
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(name)
+                    elif name.lower().endswith(exts) and not name.startswith('~$'):
+                        s = entry.stat(follow_symlinks=False)
+                        files[name] = (s.st_mtime_ns, s.st_size)
+                except OSError:
+                    continue
+    except FileNotFoundError:
+        return 'gone', None, None
+    except OSError as e:
+        return 'error', str(e), None
+    return 'listed', st.st_mtime_ns, (files, subdirs)
+
+
+class _WatchedTree:
+    def __init__(self, handler, root, recursive):
+        self.handler = handler
+        self.root = root
+        self.recursive = recursive
+        self.dirs = {}                  # 相對路徑（根 = ''）-> _DirState
+        self.dirty = False
+        self.primed = False             # 第一輪完成後才發出事件
+
+    def abspath(self, rel):
+        return os.path.join(self.root, rel) if rel else self.root
+
+    def index_path(self):
+        digest = hashlib.sha1(os.path.normcase(self.root).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(settings.LOG_FOLDER, 'tree_index', f'tree_{digest}.json')
+
+    def load_index(self, now, max_interval):
+        try:
+            data = load_compressed_file(self.index_path())
+        except Exception as e:
+            logging.warning(f"[tree-poll] 讀取目錄索引失敗 {self.root}: {e}")
+            return 0
+        if not isinstance(data, dict) or data.get('version') != TREE_INDEX_VERSION \
+                or os.path.normcase(data.get('root') or '') != os.path.normcase(self.root):
+            return 0
+        for rel, entry in (data.get('dirs') or {}).items():
+            try:
+                mtime, files, subdirs = entry[0], entry[1], entry[2]
+                # 視為冷目錄：啟動後第一輪只 stat 目錄，mtime 未變則不列出；強制重新列出仍按 TREE_POLL_FULL_RESCAN_SEC 計
+                state = _DirState(mtime, {n: (v[0], v[1]) for n, v in files.items()}, list(subdirs), max_interval)
+                state.last_listed = now
+                self.dirs[rel] = state
+            except Exception:
+                continue
+        return len(self.dirs)
+
+    def save_index(self):
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path()), exist_ok=True)
+            data = {
+                'version': TREE_INDEX_VERSION,
+                'root': self.root,
+                'dirs': {rel: [s.mtime, {n: list(v) for n, v in s.files.items()}, s.subdirs]
+                         for rel, s in self.dirs.items() if s.mtime is not None},
+            }
+            save_compressed_file(self.index_path(), data)
+            self.dirty = False
+        except Exception as e:
+            logging.warning(f"[tree-poll] 保存目錄索引失敗 {self.root}: {e}")
+
+
+class TreePollingObserver(threading.Thread):
+    def __init__(self, name='tree-poll'):
+        super().__init__(name=name, daemon=True)
+        self._trees = []
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.dirs_checked = 0
+        self.dirs_listed = 0
+        self.events = 0
+
+    def schedule(self, event_handler, path, recursive=True):
+        """同 watchdog observer.schedule；需在 start() 之前呼叫"""
+        tree = _WatchedTree(event_handler, os.path.abspath(path), recursive)
+        with self._lock:
+            self._trees.append(tree)
+        return tree
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        with self._lock:
+            trees = list(self._trees)
+        return {
+            'dirs': sum(len(t.dirs) for t in trees),
+            'files': sum(len(s.files) for t in trees for s in list(t.dirs.values())),
+            'checked': self.dirs_checked,
+            'listed': self.dirs_listed,
+            'events': self.events,
+        }
+
+    def _stopping(self):
+        return self._stop_event.is_set() or getattr(settings, 'force_stop', False)
+
+    def run(self):
+        workers = max(1, int(getattr(settings, 'TREE_POLL_WORKERS', 8)))
+        min_interval = max(0.5, _setting_float('TREE_POLL_MIN_INTERVAL_SEC', 5))
+        max_interval = max(min_interval, _setting_float('TREE_POLL_MAX_INTERVAL_SEC', 300))
+        save_every = _setting_float('TREE_POLL_INDEX_SAVE_SEC', 300)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{self.name}-io')
+        now = time.monotonic()
+        for tree in self._trees:
+            loaded = tree.load_index(now, max_interval)
+            if loaded:
+                print(f"   [tree-poll] 載入目錄索引: {tree.root}（{loaded} 個目錄）")
+        last_save = time.monotonic()
+        try:
+            while not self._stopping():
+                for tree in self._trees:
+                    if self._stopping():
+                        break
+                    try:
+                        self._poll_tree(tree)
+                    except Exception as e:
+                        logging.error(f"[tree-poll] 輪詢失敗 {tree.root}: {e}")
+                if save_every > 0 and time.monotonic() - last_save >= save_every:
+                    for tree in self._trees:
+                        tree.save_index()
+                    last_save = time.monotonic()
+                self._stop_event.wait(self._next_wait(min_interval))
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            for tree in self._trees:
+                tree.save_index()
+
+    def _next_wait(self, min_interval):
+        now = time.monotonic()
+        due = [s.due for t in self._trees for s in t.dirs.values()]
+        if not due:
+            return min_interval
+        return min(max(0.2, min(due) - now), min_interval)
+
+    def _poll_tree(self, tree):
+        """檢查所有到期的目錄；列出後新發現的子目錄在同一輪接著處理，各子樹平行進行"""
+        min_interval = max(0.5, _setting_float('TREE_POLL_MIN_INTERVAL_SEC', 5))
+        max_interval = max(min_interval, _setting_float('TREE_POLL_MAX_INTERVAL_SEC', 300))
+        backoff = max(1.0, _setting_float('TREE_POLL_BACKOFF', 2.0))
+        full_rescan = _setting_float('TREE_POLL_FULL_RESCAN_SEC', 3600)
+        rules = _ExcludeRules()
+        now = time.monotonic()
+        if '' not in tree.dirs:
+            tree.dirs[''] = _DirState(interval=min_interval)
+        events = []
+        pending = {}
+
+        def submit(rel):
+            state = tree.dirs[rel]
+            # 近期有變動的目錄（間隔在最短）每次都列出，其餘靠目錄 mtime 判斷
+            force = state.interval <= min_interval or (full_rescan > 0 and now - state.last_listed >= full_rescan)
+            fut = self._executor.submit(_check_dir, tree.abspath(rel), state.mtime, force)
+            pending[fut] = rel
+
+        for rel in [rel for rel, s in tree.dirs.items() if s.due <= now]:
+            submit(rel)
+        while pending and not self._stopping():
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel = pending.pop(fut)
+                if rel not in tree.dirs:
+                    continue  # 上層目錄已在本輪被移除
+                try:
+                    status, mtime, listing = fut.result()
+                except Exception as e:
+                    status, mtime, listing = 'error', str(e), None
+                for child in self._apply(tree, rel, status, mtime, listing, rules, events,
+                                         time.monotonic(), min_interval, max_interval, backoff):
+                    submit(child)
+        for fut in pending:
+            fut.cancel()
+        if not tree.primed and not pending:
+            tree.primed = True
+            events = []
+        for event in events:
+            if self._stopping():
+                break
+            try:
+                tree.handler.dispatch(event)
+                self.events += 1
+            except Exception as e:
+                logging.error(f"[tree-poll] 事件處理失敗 {event.src_path}: {e}")
+
+    def _apply(self, tree, rel, status, mtime, listing, rules, events, now, min_interval, max_interval, backoff):
+        """在 observer 執行緒更新索引並記下事件；返回需要接著檢查的新子目錄"""
+        state = tree.dirs[rel]
+        self.dirs_checked += 1
+        if status == 'gone':
+            if rel:
+                self._drop(tree, rel, events)
+                parent = tree.dirs.get(os.path.dirname(rel))
+                if parent is not None and os.path.basename(rel) in parent.subdirs:
+                    parent.subdirs.remove(os.path.basename(rel))
+            else:
+                self._forget_files(tree, rel, state, events)
+                state.mtime = None
+                state.subdirs = []
+                state.due = now + max_interval
+            tree.dirty = True
+            return []
+        if status == 'error':
+            if not state.error:
+                logging.warning(f"[tree-poll] 無法讀取目錄 {tree.abspath(rel)}: {mtime}")
+            state.error = True
+            state.interval = min(max_interval, max(state.interval, min_interval) * backoff)
+            state.due = now + state.interval
+            return []
+        state.error = False
+        if status == 'same':
+            state.interval = min(max_interval, max(state.interval, min_interval) * backoff)
+            state.due = now + state.interval
+            return []
+
+        self.dirs_listed += 1
+        files, subdirs = listing
+        changed = state.mtime != mtime
+        base = tree.abspath(rel)
+        for name, sig in files.items():
+            old = state.files.get(name)
+            if old is None:
+                events.append(FileCreatedEvent(os.path.join(base, name)))
+            elif tuple(old) != sig:
+                events.append(FileModifiedEvent(os.path.join(base, name)))
+            else:
+                continue
+            changed = True
+        for name in state.files:
+            if name not in files:
+                events.append(FileDeletedEvent(os.path.join(base, name)))
+                changed = True
+
+        new_children = []
+        kept = []
+        if tree.recursive:
+            for name in subdirs:
+                child = os.path.join(rel, name) if rel else name
+                if child in tree.dirs:
+                    kept.append(name)
+                elif not rules.excluded(os.path.join(base, name)):
+                    tree.dirs[child] = _DirState(interval=min_interval)
+                    kept.append(name)
+                    new_children.append(child)
+            for name in state.subdirs:
+                if name not in kept:
+                    self._drop(tree, os.path.join(rel, name) if rel else name, events)
+
+        state.mtime = mtime
+        state.files = files
+        state.subdirs = kept
+        state.last_listed = now
+        # 有變動 → 最短間隔（之後數輪持續列出）；否則逐步拉長
+        state.interval = min_interval if changed else min(max_interval, max(state.interval, min_interval) * backoff)
+        state.due = now + state.interval
+        if changed or new_children:
+            tree.dirty = True
+        return new_children
+
+    def _forget_files(self, tree, rel, state, events):
+        base = tree.abspath(rel)
+        for name in state.files:
+            events.append(FileDeletedEvent(os.path.join(base, name)))
+        state.files = {}
+
+    def _drop(self, tree, rel, events):
+        """移除目錄及其整個子樹的索引（已追蹤的檔案記為刪除）"""
+        stack = [rel]
+        while stack:
+            cur = stack.pop()
+            state = tree.dirs.pop(cur, None)
+            if state is None:
+                continue
+            self._forget_files(tree, cur, state, events)
+            stack.extend(os.path.join(cur, name) for name in state.subdirs)
+        tree.dirty = True
+
+
+def tree_polling_enabled():
+    return bool(getattr(settings, 'TREE_POLLING_ENABLED', True))
@@ -6,15 +6,31 @@ from watchdog.events import FileSystemEventHandler
 import config.settings as settings
 import logging
 from datetime import datetime
+from utils.scheduler import PollScheduler, PriorityWorkQueue
+from core.pipeline import event_pipeline, pipeline_enabled
+from utils.stat_cache import stat_path, path_exists, invalidate_stat_cache
+
+# 同一檔案的比較（事件觸發 / 輪詢）不並行
+_compare_locks = {}
+_compare_locks_guard = threading.Lock()
+
+def _compare_lock(file_path):
+    with _compare_locks_guard:
+        lock = _compare_locks.get(file_path)
+        if lock is None:
+            lock = _compare_locks[file_path] = threading.Lock()
+        return lock
 
 class ActivePollingHandler:
     """
     主動輪詢處理器，採用新的智慧輪詢邏輯 + 穩定窗口/冷靜期
     """
     def __init__(self):
+        # { file_path: {"event_number":int, "interval":float} }；實際排程由單一派發執行緒的 PollScheduler 負責
         self.polling_tasks = {}
         self.lock = threading.Lock()
         self.stop_event = threading.Event()
+        self.scheduler = PollScheduler(name='poll')
         # 狀態表（每檔案）
         # { file_path: {"last_mtime":float, "last_size":int, "stable":int, "cooldown_until":float} }
         self.state = {}
@@ -29,25 +45,21 @@ class ActivePollingHandler:
                 return
         except Exception:
             pass
-        try:
-            file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-        except (FileNotFoundError, PermissionError, OSError) as e:
-            logging.warning(f"獲取檔案大小失敗: {file_path}, 錯誤: {e}")
-            file_size_mb = 0
+        # 一次 stat（與本 tick 其他呼叫共用）取得大小與 mtime
+        st = stat_path(file_path)
+        if st is None:
+            logging.warning(f"獲取檔案大小失敗: {file_path}")
+        file_size_mb = st.st_size / (1024 * 1024) if st is not None else 0
 
         interval = settings.DENSE_POLLING_INTERVAL_SEC if file_size_mb < settings.POLLING_SIZE_THRESHOLD_MB else settings.SPARSE_POLLING_INTERVAL_SEC
         polling_type = "密集" if file_size_mb < settings.POLLING_SIZE_THRESHOLD_MB else "稀疏"
         
-        print(f"[輪詢] 檔案: {os.path.basename(file_path)}（{polling_type}輪詢，每 {interval}s 檢查一次；首次檢查 {interval}s 後）")
+        q = self.scheduler.stats()
+        print(f"[輪詢] 檔案: {os.path.basename(file_path)}（{polling_type}輪詢，每 {interval}s 檢查一次；首次檢查 {interval}s 後）"
+              f" [排程 {q['scheduled']} / 排隊 {q['queued']} / 比較中 {q['running']}]")
         # 初始化 last_mtime/size 與狀態
-        try:
-            last_mtime = os.path.getmtime(file_path)
-        except Exception:
-            last_mtime = 0
-        try:
-            last_size = os.path.getsize(file_path)
-        except Exception:
-            last_size = -1
+        last_mtime = st.st_mtime if st is not None else 0
+        last_size = st.st_size if st is not None else -1
         with self.lock:
             self.state[file_path] = {"last_mtime": last_mtime, "last_size": last_size, "stable": 0, "cooldown_until": 0.0}
         self._start_adaptive_polling(file_path, event_number, interval, last_mtime)
@@ -60,17 +72,22 @@ class ActivePollingHandler:
         if self.stop_event.is_set() or getattr(settings, 'force_stop', False):
             return
         with self.lock:
-            if file_path in self.polling_tasks:
-                self.polling_tasks[file_path]['timer'].cancel()
+            # 同一檔案的新排程直接取代尚未到期的舊排程
+            self._schedule_poll(file_path, event_number, interval, last_mtime)
 
-            def task_wrapper():
-                if self.stop_event.is_set() or getattr(settings, 'force_stop', False):
-                    return
-                self._poll_for_stability(file_path, event_number, interval, last_mtime)
+    def _schedule_poll(self, file_path, event_number, interval, last_mtime):
+        # 呼叫方需持有 self.lock
+        def task_wrapper():
+            if self.stop_event.is_set() or getattr(settings, 'force_stop', False):
+                return
+            self._poll_for_stability(file_path, event_number, interval, last_mtime)
+
+        self.polling_tasks[file_path] = {'event_number': event_number, 'interval': interval}
+        self.scheduler.schedule(file_path, interval, task_wrapper)
 
-            timer = threading.Timer(interval, task_wrapper)
-            self.polling_tasks[file_path] = {'timer': timer}
-            timer.start()
+    def queue_stats(self):
+        """輪詢排程器的佇列狀態：scheduled / queued / running / deferred / workers"""
+        return self.scheduler.stats()
 
     def _poll_for_stability(self, file_path, event_number, interval, last_mtime):
         """
@@ -87,37 +104,29 @@ class ActivePollingHandler:
             # 重新排程
             with self.lock:
                 if file_path in self.polling_tasks:
-                    new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                    self.polling_tasks[file_path]['timer'] = new_timer
-                    new_timer.start()
+                    self._schedule_poll(file_path, event_number, interval, last_mtime)
             return
 
         # 檢測暫存鎖檔 (~$)
         if getattr(settings, 'SKIP_WHEN_TEMP_LOCK_PRESENT', True):
             tmp_lock = os.path.join(os.path.dirname(file_path), "~$" + os.path.basename(file_path))
             try:
-                if os.path.exists(tmp_lock):
+                # 與下面的 mtime/size 共用同一次目錄掃描
+                if path_exists(tmp_lock):
                     print(f"    [鎖檔] 偵測到 {os.path.basename(tmp_lock)}，延後檢查。")
                     with self.lock:
                         if file_path in self.polling_tasks:
-                            new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                            self.polling_tasks[file_path]['timer'] = new_timer
-                            new_timer.start()
+                            self._schedule_poll(file_path, event_number, interval, last_mtime)
                     return
             except Exception:
                 pass
 
         print(f"    [輪詢檢查] 正在檢查 {os.path.basename(file_path)} 的變更...")
 
-        # 以 mtime/size 穩定判斷
-        try:
-            cur_mtime = os.path.getmtime(file_path)
-        except Exception:
-            cur_mtime = last_mtime
-        try:
-            cur_size = os.path.getsize(file_path)
-        except Exception:
-            cur_size = self.state.get(file_path, {}).get('last_size', -1)
+        # 以 mtime/size 穩定判斷（每個 tick 只 stat 一次）
+        fst = stat_path(file_path)
+        cur_mtime = fst.st_mtime if fst is not None else last_mtime
+        cur_size = fst.st_size if fst is not None else self.state.get(file_path, {}).get('last_size', -1)
 
         changed = False
         st = self.state.get(file_path, {})
@@ -131,39 +140,53 @@ class ActivePollingHandler:
             else:
                 st['stable'] = st.get('stable', 0) + 1
         
-        has_changes = False
         if st and st.get('stable', 0) >= getattr(settings, 'POLLING_STABLE_CHECKS', 3):
-            from core.comparison import compare_excel_changes, set_current_event_number
-            set_current_event_number(event_number)
-            print(f"    [輪詢] 已穩定，開始比較…")
+            if pipeline_enabled():
+                # 複製前穩定等待與複製重試在 asyncio 管線中 await，完成後才回到輪詢工作執行緒比較
+                def _ready():
+                    self.scheduler.schedule(file_path, 0, lambda: self._compare_and_reschedule(
+                        file_path, event_number, interval, last_mtime, changed))
+
+                def _failed():
+                    # 與比較階段讀取失敗相同：視為無變更，依穩定狀態重新排程或結束輪詢（不留下無排程的 polling_tasks）
+                    self.scheduler.schedule(file_path, 0, lambda: self._reschedule_after_poll(
+                        file_path, event_number, interval, last_mtime, changed, False))
+                if event_pipeline.submit(file_path, _ready, on_failed=_failed):
+                    return
+            self._compare_and_reschedule(file_path, event_number, interval, last_mtime, changed)
+            return
+
+        self._reschedule_after_poll(file_path, event_number, interval, last_mtime, changed, False)
+
+    def _compare_and_reschedule(self, file_path, event_number, interval, last_mtime, changed):
+        if self.stop_event.is_set() or getattr(settings, 'force_stop', False):
+            return
+        from core.comparison import compare_excel_changes, set_current_event_number
+        set_current_event_number(event_number)
+        print(f"    [輪詢] 已穩定，開始比較…")
+        with _compare_lock(file_path):
             has_changes = compare_excel_changes(file_path, silent=False, event_number=event_number, is_polling=True)
+        self._reschedule_after_poll(file_path, event_number, interval, last_mtime, changed, has_changes)
 
+    def _reschedule_after_poll(self, file_path, event_number, interval, last_mtime, changed, has_changes):
         with self.lock:
             if file_path not in self.polling_tasks:
                 return
+            st = self.state.get(file_path, {})
 
             if has_changes:
-                try:
-                    _sz_mb = os.path.getsize(file_path)/(1024*1024)
-                    _sz_str = f"{_sz_mb:.2f}MB"
-                except Exception:
-                    _sz_str = "N/A"
+                _st = stat_path(file_path)
+                _sz_str = f"{_st.st_size/(1024*1024):.2f}MB" if _st is not None else "N/A"
                 print(f"    [輪詢] 變更仍持續（事件 #{event_number}，大小 {_sz_str}），啟動冷靜期，{getattr(settings,'POLLING_COOLDOWN_SEC',20)} 秒後再次檢查。")
                 st['cooldown_until'] = time.time() + float(getattr(settings, 'POLLING_COOLDOWN_SEC', 20))
                 st['stable'] = 0
-                new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                self.polling_tasks[file_path]['timer'] = new_timer
-                new_timer.start()
+                self._schedule_poll(file_path, event_number, interval, last_mtime)
             else:
                 # 若尚未達穩定次數，或剛檢測到變動，繼續等待；若已穩定且無變更，結束輪詢
                 if st and st.get('stable', 0) < getattr(settings, 'POLLING_STABLE_CHECKS', 3):
-                    new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                    self.polling_tasks[file_path]['timer'] = new_timer
-                    new_timer.start()
+                    self._schedule_poll(file_path, event_number, interval, last_mtime)
                 elif changed:
-                    new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                    self.polling_tasks[file_path]['timer'] = new_timer
-                    new_timer.start()
+                    self._schedule_poll(file_path, event_number, interval, last_mtime)
                 else:
                     print(f"    [輪詢結束] {os.path.basename(file_path)} 檔案已穩定。")
                     self.polling_tasks.pop(file_path, None)
@@ -174,19 +197,50 @@ class ActivePollingHandler:
         停止所有輪詢任務
         """
         self.stop_event.set()
+        self.scheduler.stop()
         with self.lock:
-            for task in self.polling_tasks.values():
-                task['timer'].cancel()
             self.polling_tasks.clear()
 
 class ExcelFileEventHandler(FileSystemEventHandler):
     """
     Excel 檔案事件處理器
     """
-    def __init__(self, polling_handler):
+    def __init__(self, polling_handler, work_queue=None):
         self.polling_handler = polling_handler
         self.last_event_times = {}
         self.event_counter = 0
+        self._counter_lock = threading.Lock()
+        # observer 執行緒只做過濾/防抖並放入佇列；解析與比較由佇列的工作執行緒處理
+        self.work_queue = work_queue if work_queue is not None else compare_queue
+
+    def _next_event_number(self):
+        with self._counter_lock:
+            self.event_counter += 1
+            return self.event_counter
+
+    def _submit(self, file_path, job, delay=0.0):
+        """
+        非阻塞交付：啟用 asyncio 管線時先在管線中等待來源穩定並複製到快取（await，不佔執行緒），
+        完成後才放入比較佇列；未啟用時直接放入佇列
+        """
+        if pipeline_enabled():
+            if event_pipeline.submit(file_path, lambda: self._enqueue(file_path, job), delay=delay):
+                return True
+            print(f"    [管線] {os.path.basename(file_path)} 正在等待穩定/複製中，合併本次事件。")
+            return False
+        self._enqueue(file_path, job)
+        return True
+
+    def _enqueue(self, file_path, job):
+        """
+        放入比較佇列（不阻塞 observer 執行緒）。優先序：小檔（< POLLING_SIZE_THRESHOLD_MB）先於大檔，
+        同級中最近發生事件者先處理；同一檔案尚未處理的事件合併為一個。
+        """
+        st = stat_path(file_path)
+        size_mb = st.st_size / (1024 * 1024) if st is not None else 0
+        priority = (0 if size_mb < settings.POLLING_SIZE_THRESHOLD_MB else 1, -time.time())
+        if not self.work_queue.put(file_path, job, priority):
+            print(f"    [佇列] {os.path.basename(file_path)} 已有待處理的比較，合併本次事件。")
         
     def _is_cache_ignored(self, path: str) -> bool:
         try:
@@ -240,10 +294,17 @@ class ExcelFileEventHandler(FileSystemEventHandler):
             return
 
         print(f"\n✨ 發現新檔案: {os.path.basename(file_path)}")
-        print(f"📊 正在建立基準線...")
+        invalidate_stat_cache(file_path)
+        self._submit(file_path, lambda: self._handle_created(file_path))
+
+    def _handle_created(self, file_path):
+        if getattr(settings, 'force_stop', False):
+            return
+        print(f"📊 正在建立基準線: {os.path.basename(file_path)}")
 
         from core.baseline import create_baseline_for_files_robust
-        create_baseline_for_files_robust([file_path])
+        with _compare_lock(file_path):
+            create_baseline_for_files_robust([file_path])
 
         print(f"✅ 基準線建立完成，已納入監控: {os.path.basename(file_path)}")
 
@@ -316,8 +377,24 @@ class ExcelFileEventHandler(FileSystemEventHandler):
                 return
                 
         self.last_event_times[file_path] = current_time
-        self.event_counter += 1
-        
+        # 事件表示目錄內容已變，丟棄該目錄本 tick 的 stat 快取
+        invalidate_stat_cache(file_path)
+        self._submit(file_path, lambda: self._handle_modified(file_path))
+
+    def _handle_modified(self, file_path, event_number=None):
+        """
+        佇列工作執行緒：讀取作者、monitor-only 初始化、比較並顯示，之後啟動輪詢
+        event_number 不為 None 時為讀取失敗後的重試，沿用原事件編號
+        """
+        if getattr(settings, 'force_stop', False):
+            return
+        with _compare_lock(file_path):
+            retry = event_number is not None
+            if event_number is None:
+                event_number = self._next_event_number()
+            self._process_modified(file_path, event_number, retry)
+
+    def _process_modified(self, file_path, event_number, is_retry=False):
         # 獲取檔案最後作者
         try:
             from core.excel_parser import get_excel_last_author
@@ -358,13 +435,20 @@ class ExcelFileEventHandler(FileSystemEventHandler):
                 logging.warning(f"monitor-only 初始化失敗: {e}")
                 return
         
-        # 先做一次靜默比對，若無變更則不噪音輸出（仍可後續輪詢）
-        from core.comparison import compare_excel_changes, set_current_event_number
-        set_current_event_number(self.event_counter)
-        has_changes_preview = compare_excel_changes(file_path, silent=True, event_number=self.event_counter, is_polling=False)
+        # 只讀取比對一次：先以結果決定是否輸出標頭，之後直接用同一結果顯示（不再重複解析）
+        from core.comparison import diff_excel_changes, render_excel_changes, set_current_event_number
+        set_current_event_number(event_number)
+        use_pipeline = pipeline_enabled() and not is_retry
+        diff_result = diff_excel_changes(file_path, is_polling=False, retry_read=not use_pipeline)
+        if use_pipeline and diff_result.get('status') == 'read_error':
+            # 讀取失敗：1 秒後經管線重新準備再比較一次（await 等待，不佔用工作執行緒）
+            print(f"    [管線] {os.path.basename(file_path)} 讀取失敗，1 秒後重試（事件 #{event_number}）")
+            if self._submit(file_path, lambda: self._handle_modified(file_path, event_number), delay=1.0):
+                return
+            diff_result = diff_excel_changes(file_path, is_polling=False)
         
-        if has_changes_preview:
-            print(f"\n🔔 檔案變更偵測: {os.path.basename(file_path)} (事件 #{self.event_counter}){author_info}")
+        if render_excel_changes(diff_result, silent=True):
+            print(f"\n🔔 檔案變更偵測: {os.path.basename(file_path)} (事件 #{event_number}){author_info}")
         
         # 監控但不預先 baseline 的區域：首次變更只紀錄資訊並建立 baseline，之後才比較
         if self._is_monitor_only(file_path):
@@ -389,16 +473,15 @@ class ExcelFileEventHandler(FileSystemEventHandler):
                 logging.warning(f"monitor-only 初始化失敗: {e}")
                 return
         
-        # 🔥 設定事件編號並立即執行一次比較
-        from core.comparison import compare_excel_changes, set_current_event_number
-        set_current_event_number(self.event_counter)
+        # 🔥 設定事件編號並輸出上面已完成的比較結果
+        set_current_event_number(event_number)
         
         # 允許在輪詢中也顯示一次即時比較表（本輪只顯示一次），滿足「detect 即顯示」
         if file_path in self.polling_handler.polling_tasks:
             st = self.polling_handler.state.get(file_path, {})
             if not st.get('has_shown_initial_compare', False):
                 print(f"📊 立即檢查變更（輪詢中首次）...")
-                has_changes = compare_excel_changes(file_path, silent=False, event_number=self.event_counter, is_polling=False)
+                has_changes = render_excel_changes(diff_result, silent=False, event_number=event_number, is_polling=False)
                 st['has_shown_initial_compare'] = True
                 self.polling_handler.state[file_path] = st
             else:
@@ -406,7 +489,7 @@ class ExcelFileEventHandler(FileSystemEventHandler):
                 return
         else:
             print(f"📊 立即檢查變更...")
-            has_changes = compare_excel_changes(file_path, silent=False, event_number=self.event_counter, is_polling=False)
+            has_changes = render_excel_changes(diff_result, silent=False, event_number=event_number, is_polling=False)
         
         if has_changes:
             print(f"✅ 偵測到變更，啟動輪詢以監控後續活動...")
@@ -414,8 +497,10 @@ class ExcelFileEventHandler(FileSystemEventHandler):
             print(f"ℹ️  未發現即時變更，啟動輪詢以監控後續活動...")
         
         # 開始輪詢
-        self.polling_handler.start_polling(file_path, self.event_counter)
+        self.polling_handler.start_polling(file_path, event_number)
 
 # 創建全局輪詢處理器實例
 active_polling_handler = ActivePollingHandler()
+# 檔案事件的比較佇列（停止時與輪詢處理器一併停止）
+compare_queue = PriorityWorkQueue(name='compare')
 
@@ -22,7 +22,9 @@ from utils.helpers import get_all_excel_files, timeout_handler
 from utils.compression import CompressionFormat, test_compression_support  # 新增
 from ui.console import init_console
 from core.baseline import create_baseline_for_files_robust
-from core.watcher import active_polling_handler, ExcelFileEventHandler
+from core.watcher import active_polling_handler, compare_queue, ExcelFileEventHandler
+from core.pipeline import event_pipeline
+from core.tree_observer import TreePollingObserver, tree_polling_enabled
 from core.comparison import set_current_event_number
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
@@ -41,6 +43,8 @@ def signal_handler(signum, frame):
         if settings.current_processing_file: 
             print(f"   目前處理檔案: {settings.current_processing_file}")
         active_polling_handler.stop()
+        compare_queue.stop()
+        event_pipeline.stop()
         # 清理控制台
         _cleanup_console()
         print("   (再按一次 Ctrl+C 強制退出)")
@@ -218,7 +222,8 @@ def main():
 
     # 根據路徑自動選擇 Watchdog 後端：
     # - 若設定 WATCHDOG_FORCE_POLLING=1/true → 強制使用 PollingObserver
-    # - 若包含磁碟根目錄（例如 C:\）或 UNC 路徑（\\server\share）→ 使用 PollingObserver（更穩定）
+    # - 若包含磁碟根目錄（例如 C:\）或 UNC 路徑（\\server\share）→ 使用輪詢後端（更穩定）
+    # - 輪詢後端預設為 TreePollingObserver（只追蹤 Excel 檔、目錄 mtime 索引、平行掃描）；TREE_POLLING_ENABLED=False 時退回 PollingObserver
     def _is_drive_root_or_unc(p: str) -> bool:
         try:
             if not p:
@@ -240,9 +245,13 @@ def main():
     needs_polling = any(_is_drive_root_or_unc(f) for f in (watch_roots or []))
 
     if force_polling or needs_polling:
-        observer = PollingObserver()
         reason = '環境變數強制' if force_polling else '偵測到磁碟根目錄/UNC 路徑'
-        print(f"   使用輪詢後端 PollingObserver（{reason}）。")
+        if tree_polling_enabled():
+            observer = TreePollingObserver()
+            print(f"   使用輪詢後端 TreePollingObserver（{reason}）。")
+        else:
+            observer = PollingObserver()
+            print(f"   使用輪詢後端 PollingObserver（{reason}）。")
     else:
         observer = Observer()
         print("   使用原生後端 Observer（效能較佳）。")
@@ -277,6 +286,8 @@ def main():
         observer.stop()
         observer.join()
         active_polling_handler.stop()
+        compare_queue.stop()
+        event_pipeline.stop()
         _cleanup_console()
         print("✅ 監控已停止")
 
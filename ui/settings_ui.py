@@ -124,6 +124,12 @@ PARAMS_SPEC = [
         'help': '超過此數值時會嘗試釋放記憶體並提示。',
         'type': 'int',
     },
+    {
+        'key': 'BASELINE_WORKERS',
+        'label': '並發建立 Baseline 檔案數',
+        'help': '1 為逐檔建立；大於 1 時多個檔案同時複製/解析/保存，每個 worker 的記憶體預算為 MEMORY_LIMIT_MB / N，進度仍可續跑。',
+        'type': 'int',
+    },
     {
         'key': 'ENABLE_RESUME',
         'label': '啟用進度恢復',
@@ -220,9 +226,9 @@ PARAMS_SPEC = [
     {
         'key': 'FORMULA_ENGINE',
         'label': '公式讀取引擎（openpyxl/xml）',
-        'help': '目前預設 openpyxl 讀取公式；未來可提供 xml 讀公式以進一步提速。',
+        'help': 'openpyxl：以 openpyxl 讀公式，值由值引擎補上（預設）。xml：每個 worksheet XML 只串流一次，同時取得公式與 cached 值（含 shared/array formula），省去 openpyxl 與二次解壓，大檔明顯更快。',
         'type': 'choice',
-        'choices': ['openpyxl']
+        'choices': ['openpyxl','xml']
     },
     {
         'key': 'CSV_PERSIST',
@@ -322,12 +328,73 @@ PARAMS_SPEC = [
         'help': '高壓縮比通用首選：1-3 偏速度；4-9 折衝（常用 3-6）；10-18 更高壓縮但寫入耗時；19-22 極致壓縮、CPU時間很長（僅限空間極度敏感）。',
         'type': 'int',
     },
+    {
+        'key': 'ZSTD_DICTIONARY_ENABLED',
+        'label': '使用 zstd 字典',
+        'help': '以現有基準線與歷史快照訓練 zstd 共用字典（建立基準線後自動訓練），對每張表/每段 delta 這類小區塊壓縮率與解壓速度改善明顯；只影響 zstd 格式。',
+        'type': 'bool',
+    },
+    {
+        'key': 'ZSTD_DICTIONARY_DIR',
+        'label': 'zstd 字典目錄',
+        'help': '字典與版本清單的存放目錄；留空則為 LOG_FOLDER/zstd_dict。舊版字典會保留以讀取舊檔，請勿刪除。',
+        'type': 'path',
+    },
+    {
+        'key': 'ZSTD_DICTIONARY_SIZE_KB',
+        'label': 'zstd 字典大小 (KB)',
+        'help': '常用 64-128KB；字典越大可涵蓋越多共通結構，但訓練需要更多樣本。',
+        'type': 'int',
+    },
+    {
+        'key': 'ZSTD_DICTIONARY_RETRAIN_DAYS',
+        'label': 'zstd 字典重新訓練天數',
+        'help': '建立基準線後，目前字典超過此天數即以最新樣本重新訓練（0 = 只訓練一次）。',
+        'type': 'int',
+    },
     {
         'key': 'GZIP_COMPRESSION_LEVEL',
         'label': 'gzip 壓縮等級 (1-9)',
         'help': '兼容性最佳：1-3 較快、壓縮一般；4-6 折衝（6 常用）；7-9 壓縮略升但耗時顯著，除非相容性/可攜性為先。',
         'type': 'int',
     },
+    {
+        'key': 'BASELINE_FILE_FORMAT',
+        'label': '基準線檔案格式',
+        'help': 'binary：版本化二進位容器（各工作表獨立壓縮，安裝 msgpack 時序列化更快）；json：舊版壓縮 JSON。兩種都可讀取，下次保存時轉為所選格式。',
+        'type': 'choice',
+        'choices': ['binary','json']
+    },
+    {
+        'key': 'BASELINE_LAZY_LOAD',
+        'label': '延遲載入基準線工作表',
+        'help': '二進位基準線只在比對用到某工作表時才解壓該表；未變更而直接沿用的工作表不解壓，降低大檔的載入時間與記憶體。',
+        'type': 'bool',
+    },
+    {
+        'key': 'BASELINE_DELTA_ENABLED',
+        'label': '增量更新基準線',
+        'help': '比較後自動更新基準線時，只把變更的儲存格追加為 delta 段；delta 累積過多時於背景壓實成全量基準線。',
+        'type': 'bool',
+    },
+    {
+        'key': 'BASELINE_DELTA_MAX_RATIO',
+        'label': '增量更新的最大變更比例',
+        'help': '本次變更格數超過總格數此比例（0-1，可輸入小數）時改為直接全量保存。',
+        'type': 'text',
+    },
+    {
+        'key': 'BASELINE_DELTA_MAX_SEGMENTS',
+        'label': '壓實前最多 delta 段數',
+        'help': 'delta 段數達此值即於背景把基準線與 delta 合併重寫。',
+        'type': 'int',
+    },
+    {
+        'key': 'BASELINE_DELTA_MAX_MB',
+        'label': '壓實前 delta 檔上限 (MB)',
+        'help': 'delta 檔大小達此值即於背景壓實（可輸入小數）。',
+        'type': 'text',
+    },
     {
         'key': 'ENABLE_ARCHIVE_MODE',
         'label': '啟用歸檔模式',
@@ -592,6 +659,84 @@ PARAMS_SPEC = [
         'help': '小於此大小的檔案採用較密集的輪詢間隔；大於則採用較稀疏的間隔。',
         'type': 'int',
     },
+    {
+        'key': 'POLLING_MAX_WORKERS',
+        'label': '輪詢比較並行數',
+        'help': '所有檔案的輪詢由單一排程執行緒派發；同時最多這麼多個檔案在讀取/比較，其餘排隊（同一檔案不會同時比較）。數值越大越快清空佇列，但同時解析的活頁簿越多、記憶體越高。',
+        'type': 'int',
+    },
+    {
+        'key': 'COMPARE_WORKERS',
+        'label': '事件比較並行數',
+        'help': '檔案變更事件先放入佇列（同一檔案未處理的事件會合併；小檔與最近變更者優先），由這麼多個執行緒解析比較，不會卡住檔案監控本身。',
+        'type': 'int',
+    },
+    {
+        'key': 'ASYNC_PIPELINE_ENABLED',
+        'label': '非阻塞事件管線 (asyncio)',
+        'help': '事件與輪詢比較前的「等待來源穩定 / 複製到快取 / 重試退避」改在 asyncio 管線中等待，大量檔案同時等待穩定時不會各自佔住一個執行緒；準備完成後才交給比較執行緒解析。',
+        'type': 'bool',
+    },
+    {
+        'key': 'PIPELINE_IO_WORKERS',
+        'label': '管線 I/O 執行緒數',
+        'help': '管線中檢查 mtime 與實際複製到快取時使用的執行緒數（網路磁碟較慢時可調高）。',
+        'type': 'int',
+    },
+    {
+        'key': 'STAT_CACHE_TTL_SEC',
+        'label': 'stat 快取有效時間 (秒)',
+        'help': '輪詢、複製到快取與快速跳過在這段時間內共用同一次目錄掃描（含 ~$ 鎖檔判斷），網路磁碟上可大幅減少中繼資料往返；0 = 停用（可輸入小數）。',
+        'type': 'text',
+    },
+    {
+        'key': 'STAT_CACHE_MAX_DIR_ENTRIES',
+        'label': 'stat 快取目錄項目上限',
+        'help': '目錄內項目超過此數時不整目錄掃描，改為逐檔 stat（同樣快取）。',
+        'type': 'int',
+    },
+    {
+        'key': 'TREE_POLLING_ENABLED',
+        'label': '大型目錄樹輪詢後端',
+        'help': '監控磁碟根目錄或 UNC 路徑時使用專用輪詢：只追蹤 Excel 檔、目錄未變動則不列出內容（索引保存於 LOG_FOLDER/tree_index）、平行掃描子樹。關閉則使用 watchdog PollingObserver。',
+        'type': 'bool',
+    },
+    {
+        'key': 'TREE_POLL_WORKERS',
+        'label': '目錄樹輪詢執行緒數',
+        'help': '平行檢查/列出目錄的執行緒數（網路共用延遲高時可調高）。',
+        'type': 'int',
+    },
+    {
+        'key': 'TREE_POLL_MIN_INTERVAL_SEC',
+        'label': '目錄最短輪詢間隔 (秒)',
+        'help': '近期有變動的目錄每隔這段時間檢查一次（可輸入小數）。',
+        'type': 'text',
+    },
+    {
+        'key': 'TREE_POLL_MAX_INTERVAL_SEC',
+        'label': '目錄最長輪詢間隔 (秒)',
+        'help': '長期無變動的目錄間隔逐步拉長，最長到此值（可輸入小數）。',
+        'type': 'text',
+    },
+    {
+        'key': 'TREE_POLL_BACKOFF',
+        'label': '目錄輪詢間隔倍增係數',
+        'help': '目錄每次檢查無變動時，間隔乘以此係數（1 = 固定間隔）。',
+        'type': 'text',
+    },
+    {
+        'key': 'TREE_POLL_FULL_RESCAN_SEC',
+        'label': '目錄強制重新列出間隔 (秒)',
+        'help': '無論目錄修改時間是否變動，每隔這段時間重新列出一次，捕捉不經改名的原地寫入；0 = 不強制。',
+        'type': 'int',
+    },
+    {
+        'key': 'TREE_POLL_INDEX_SAVE_SEC',
+        'label': '目錄索引保存間隔 (秒)',
+        'help': '定期保存目錄索引，重啟後未變動的目錄不需重新列出；停止時一定保存。',
+        'type': 'int',
+    },
     {
         'key': 'DENSE_POLLING_INTERVAL_SEC',
         'label': '密集輪詢間隔 (秒)',
@@ -691,7 +836,9 @@ class SettingsDialog(tk.Toplevel):
                 'SCAN_TARGET_FOLDERS','AUTO_SYNC_SCAN_TARGETS','SCAN_ALL_MODE','SUPPORTED_EXTS','MANUAL_BASELINE_TARGET'
             ]),
             ('輪巡與事件控制', [
-                'DEBOUNCE_INTERVAL_SEC','POLLING_SIZE_THRESHOLD_MB','DENSE_POLLING_INTERVAL_SEC','DENSE_POLLING_DURATION_SEC',
+                'DEBOUNCE_INTERVAL_SEC','POLLING_SIZE_THRESHOLD_MB','POLLING_MAX_WORKERS','COMPARE_WORKERS','ASYNC_PIPELINE_ENABLED','PIPELINE_IO_WORKERS','STAT_CACHE_TTL_SEC','STAT_CACHE_MAX_DIR_ENTRIES',
+                'TREE_POLLING_ENABLED','TREE_POLL_WORKERS','TREE_POLL_MIN_INTERVAL_SEC','TREE_POLL_MAX_INTERVAL_SEC','TREE_POLL_BACKOFF',
+                'TREE_POLL_FULL_RESCAN_SEC','TREE_POLL_INDEX_SAVE_SEC','DENSE_POLLING_INTERVAL_SEC','DENSE_POLLING_DURATION_SEC',
                 'SPARSE_POLLING_INTERVAL_SEC','SPARSE_POLLING_DURATION_SEC','QUICK_SKIP_BY_STAT','MTIME_TOLERANCE_SEC',
                 'SKIP_WHEN_TEMP_LOCK_PRESENT','POLLING_STABLE_CHECKS','POLLING_COOLDOWN_SEC'
             ]),
@@ -707,6 +854,8 @@ class SettingsDialog(tk.Toplevel):
             ]),
             ('基準線與壓縮/歸檔', [
                 'DEFAULT_COMPRESSION_FORMAT','LZ4_COMPRESSION_LEVEL','ZSTD_COMPRESSION_LEVEL','GZIP_COMPRESSION_LEVEL',
+                'ZSTD_DICTIONARY_ENABLED','ZSTD_DICTIONARY_DIR','ZSTD_DICTIONARY_SIZE_KB','ZSTD_DICTIONARY_RETRAIN_DAYS',
+                'BASELINE_FILE_FORMAT','BASELINE_LAZY_LOAD','BASELINE_DELTA_ENABLED','BASELINE_DELTA_MAX_RATIO','BASELINE_DELTA_MAX_SEGMENTS','BASELINE_DELTA_MAX_MB',
                 'ENABLE_ARCHIVE_MODE','ARCHIVE_AFTER_DAYS','ARCHIVE_COMPRESSION_FORMAT','SHOW_COMPRESSION_STATS'
             ]),
             ('日誌與輸出', [
@@ -725,7 +874,7 @@ class SettingsDialog(tk.Toplevel):
                'UI_TIMELINE_GROUP_BY_BASEKEY','PATH_MAPPINGS','ENABLE_TIMELINE_SERVER','TIMELINE_SERVER_HOST','TIMELINE_SERVER_PORT','OPEN_TIMELINE_ON_START','DISABLE_GIT_INTEGRATION'
             ]),
             ('可靠性與資源', [
-                'ENABLE_TIMEOUT','FILE_TIMEOUT_SECONDS','ENABLE_MEMORY_MONITOR','MEMORY_LIMIT_MB','ENABLE_RESUME','RESUME_LOG_FILE',
+                'ENABLE_TIMEOUT','FILE_TIMEOUT_SECONDS','ENABLE_MEMORY_MONITOR','MEMORY_LIMIT_MB','BASELINE_WORKERS','ENABLE_RESUME','RESUME_LOG_FILE',
                 'MAX_RETRY','RETRY_INTERVAL_SEC','WHITELIST_USERS','LOG_WHITELIST_USER_CHANGE','FORCE_BASELINE_ON_FIRST_SEEN','SHOW_DEBUG_MESSAGES'
             ]),
         ]
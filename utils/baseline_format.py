@@ -0,0 +1,279 @@
+"""
+二進位基準線格式（版本化容器），取代 .baseline.json.* 的「整份 JSON 再壓縮」
+
+檔案結構：
+    前導區  struct '<4sHBBI'：magic b'XLBL'、格式版本、編碼（0=json, 1=msgpack）、壓縮格式碼、檔頭長度
+    檔頭    以同一編碼序列化、不壓縮：
+            {'meta': cells 以外的頂層欄位（source_mtime/source_size/last_author/zip_members...）,
+             'sheets': [[sheet, 位移, 長度, 原始長度, 儲存格數], ...]}      # 位移自資料區起算
+    資料區  每張表一個獨立壓縮的區塊；只讀檔頭即可取得中繼資料，也可只解壓需要的表
+
+表區塊（欄式，順序同 SheetCells 的列優先位址鍵）：
+    {'keys': [位址鍵...], 'formula': [...], 'value': [...],
+     'cached_idx': [...], 'cached': [...],     # 只記 cached_value 與 value 不同的位置
+     'ext': [...],                             # external_ref 為 True 的位置
+     'groups': [[master 原文, master 鍵, [起點, 長度, ...]], ...]}   # shared formula 組，組員 formula 記為 None
+    無法轉為欄式的表退回 {'cells': {addr: cell}}。
+
+msgpack 可用時以 msgpack 編碼，否則用 JSON；讀取依前導區記錄的編碼（msgpack 檔需有 msgpack 才能讀）。
+"""
+import os
+import json
+import struct
+from datetime import datetime
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+import config.settings as settings
+from utils.cell_store import SheetCells, key_to_addr, json_default
+from utils.compression import CompressionFormat, compress_data, decompress_bytes
+
+BINARY_BASELINE_VERSION = 1
+BINARY_EXT = '.bin'
+
+_MAGIC = b'XLBL'
+_PREAMBLE = struct.Struct('<4sHBBI')
+_CODEC_JSON = 0
+_CODEC_MSGPACK = 1
+# 壓縮格式碼（寫在前導區）；None = 不壓縮
+_COMPRESSIONS = (None, CompressionFormat.GZIP, CompressionFormat.LZ4, CompressionFormat.ZSTD)
+
+
+def binary_baseline_path(base_path):
+    """'xxx.baseline.json'（不含壓縮副檔名的舊路徑）-> 'xxx.baseline.bin'"""
+    if base_path.endswith('.json'):
+        base_path = base_path[:-len('.json')]
+    return base_path + BINARY_EXT
+
+
+def is_binary_baseline(filepath):
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+    except OSError:
+        return False
+
+
+def _encode(obj, codec):
+    if codec == _CODEC_MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+
+def _decode(raw, codec):
+    if codec == _CODEC_MSGPACK:
+        if not HAS_MSGPACK:
+            raise ValueError("此基準線以 msgpack 編碼，請執行: pip install msgpack")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    return json.loads(raw.decode('utf-8'))
+
+
+def _same_value(a, b):
+    # 型別也要相同（1 / 1.0 / True 互相 == 但不可互換）
+    return a is b or (type(a) is type(b) and a == b)
+
+
+def _sheet_block(ws):
+    """單張表 -> 區塊 dict（欄式；無法轉為欄式時退回逐格 dict）"""
+    sc = ws if isinstance(ws, SheetCells) else SheetCells.from_dict(ws)
+    if sc is None:
+        return {'cells': dict(ws)}
+    f_col, v_col, c_col, e_col = sc.columns(expand_formulas=False)
+    cached_idx = [i for i, (v, c) in enumerate(zip(v_col, c_col)) if not _same_value(v, c)]
+    return {
+        'keys': list(sc.key_array),
+        # 組員以組標記表示，檔案中記為 None，由 groups 還原
+        'formula': [None if type(t) is tuple else t for t in f_col],
+        'value': v_col,
+        'cached_idx': cached_idx,
+        'cached': [c_col[i] for i in cached_idx],
+        'ext': [i for i, e in enumerate(e_col) if e],
+        'groups': sc.formula_groups() if sc.has_formula_groups else [],
+    }
+
+
+def _cells_from_block(block):
+    """區塊 -> ({addr: cell}, shared formula 組表或 None)；格式與舊版 JSON 基準線載入結果相同"""
+    if 'cells' in block:
+        return block['cells'], None
+    keys, formulas, values = block['keys'], block['formula'], block['value']
+    cached = list(values)
+    for i, c in zip(block.get('cached_idx') or (), block.get('cached') or ()):
+        cached[i] = c
+    ext = [False] * len(keys)
+    for i in block.get('ext') or ():
+        ext[i] = True
+    cells = {
+        key_to_addr(k): {'formula': f, 'value': v, 'cached_value': c, 'external_ref': e}
+        for k, f, v, c, e in zip(keys, formulas, values, cached, ext)
+    }
+    return cells, (block.get('groups') or None)
+
+
+def write_binary_baseline(filepath, data, format_type=None, level=None):
+    """
+    一次寫出整份基準線：各表區塊各自序列化+壓縮一次，之後依序寫出前導區、檔頭與資料區。
+    先寫暫存檔再替換，讀取方不會看到寫到一半的檔案。返回壓縮統計（同 get_compression_stats）。
+    """
+    if format_type is None:
+        format_type = settings.DEFAULT_COMPRESSION_FORMAT
+    format_type = CompressionFormat.validate_format(format_type)
+    codec = _CODEC_MSGPACK if HAS_MSGPACK else _CODEC_JSON
+
+    meta = {k: v for k, v in data.items() if k not in ('cells', 'formula_groups')}
+    meta['timestamp'] = datetime.now().isoformat()
+    meta['compression_format'] = format_type
+    meta['binary_version'] = BINARY_BASELINE_VERSION
+
+    index = []
+    blocks = []
+    offset = 0
+    original = 0
+    for name, ws in (data.get('cells') or {}).items():
+        raw = _encode(_sheet_block(ws), codec)
+        packed = compress_data(raw, format_type, level)
+        index.append([name, offset, len(packed), len(raw), len(ws)])
+        blocks.append(packed)
+        offset += len(packed)
+        original += len(raw)
+
+    header = _encode({'meta': meta, 'sheets': index}, codec)
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(_MAGIC, BINARY_BASELINE_VERSION, codec, _COMPRESSIONS.index(format_type), len(header)))
+        f.write(header)
+        for packed in blocks:
+            f.write(packed)
+        size = f.tell()
+    os.replace(tmp_path, filepath)
+
+    original += _PREAMBLE.size + len(header)
+    return {
+        'format': format_type,
+        'compressed_size': size,
+        'original_size': original,
+        'compression_ratio': (1 - size / original) * 100 if original > 0 else 0,
+        'savings_bytes': original - size,
+    }
+
+
+class BinaryBaselineHeader:
+    """檔頭：meta、表索引與資料區位置；由 read_binary_header / load_binary_file 產生"""
+    __slots__ = ('path', 'version', 'codec', 'format_type', 'meta', 'sheets', 'data_offset')
+
+    def __init__(self, path, version, codec, format_type, meta, sheets, data_offset):
+        self.path = path
+        self.version = version
+        self.codec = codec
+        self.format_type = format_type
+        self.meta = meta
+        self.sheets = sheets            # [[sheet, 位移, 長度, 原始長度, 儲存格數], ...]
+        self.data_offset = data_offset
+
+    @property
+    def sheet_names(self):
+        return [entry[0] for entry in self.sheets]
+
+
+def _parse_preamble(pre):
+    if len(pre) < _PREAMBLE.size:
+        raise ValueError("二進位基準線檔頭不完整")
+    magic, version, codec, comp, header_len = _PREAMBLE.unpack_from(pre)
+    if magic != _MAGIC:
+        raise ValueError("不是二進位基準線檔案")
+    if version > BINARY_BASELINE_VERSION:
+        raise ValueError(f"不支援的二進位基準線版本: {version}")
+    return version, codec, comp, header_len
+
+
+def _make_header(filepath, version, codec, comp, header_len, raw_header):
+    header = _decode(raw_header, codec)
+    return BinaryBaselineHeader(filepath, version, codec, _COMPRESSIONS[comp], header.get('meta') or {},
+                                header.get('sheets') or [], _PREAMBLE.size + header_len)
+
+
+def read_binary_header(filepath):
+    """只讀前導區與檔頭（不讀取、不解壓任何表）"""
+    with open(filepath, 'rb') as f:
+        version, codec, comp, header_len = _parse_preamble(f.read(_PREAMBLE.size))
+        return _make_header(filepath, version, codec, comp, header_len, f.read(header_len))
+
+
+def load_binary_file(filepath):
+    """
+    一次讀入整個檔案（仍為壓縮狀態），返回 (header, blob)。
+    之後以 decode_sheet_block 逐表解壓；檔案稍後被替換（背景壓實/重新保存）也不影響已讀入的內容。
+    """
+    with open(filepath, 'rb') as f:
+        blob = f.read()
+    version, codec, comp, header_len = _parse_preamble(blob[:_PREAMBLE.size])
+    header = _make_header(filepath, version, codec, comp, header_len, blob[_PREAMBLE.size:_PREAMBLE.size + header_len])
+    return header, blob
+
+
+def decode_sheet_block(header, blob, entry):
+    """解壓並解碼一張表：entry 為 header.sheets 的條目；返回 ({addr: cell}, 組表或 None)"""
+    _name, offset, length = entry[0], entry[1], entry[2]
+    start = header.data_offset + offset
+    packed = blob[start:start + length]
+    if len(packed) != length:
+        raise ValueError(f"二進位基準線資料不完整: {_name}")
+    raw = packed if header.format_type is None else decompress_bytes(packed, header.format_type)
+    return _cells_from_block(_decode(raw, header.codec))
+
+
+def read_binary_sheets(header, names=None, blob=None):
+    """
+    讀出指定表（None = 全部），返回 { sheet: ({addr: cell}, 組表或 None) }，按檔案中的順序。
+    """
+    if blob is None:
+        _, blob = load_binary_file(header.path)
+    wanted = None if names is None else set(names)
+    return {entry[0]: decode_sheet_block(header, blob, entry)
+            for entry in header.sheets if wanted is None or entry[0] in wanted}
+
+
+def iter_raw_sheet_blocks(filepath):
+    """逐表返回解壓後、尚未解碼的區塊 bytes（zstd 字典訓練的樣本）"""
+    header, blob = load_binary_file(filepath)
+    for entry in header.sheets:
+        start = header.data_offset + entry[1]
+        packed = blob[start:start + entry[2]]
+        yield packed if header.format_type is None else decompress_bytes(packed, header.format_type)
+
+
+def read_binary_baseline(filepath):
+    """
+    讀出整份基準線，結構與舊版 JSON 基準線相同：
+    meta 欄位 + 'cells' + （有 shared formula 組時）'formula_groups'
+    """
+    header, blob = load_binary_file(filepath)
+    data = dict(header.meta)
+    cells = {}
+    groups = {}
+    for name, (ws, g) in read_binary_sheets(header, blob=blob).items():
+        cells[name] = ws
+        if g:
+            groups[name] = g
+    data['cells'] = cells
+    if groups:
+        data['formula_groups'] = groups
+    return data
+
+
+def binary_baseline_stats(filepath):
+    """壓縮統計：原始大小取自檔頭的表索引，不需解壓"""
+    header = read_binary_header(filepath)
+    size = os.path.getsize(filepath)
+    original = header.data_offset + sum(entry[3] for entry in header.sheets)
+    return {
+        'format': header.format_type,
+        'compressed_size': size,
+        'original_size': original,
+        'compression_ratio': (1 - size / original) * 100 if original > 0 else 0,
+        'savings_bytes': original - size,
+    }
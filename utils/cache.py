@@ -1,5 +1,7 @@
 import os
 import time
+import asyncio
+import functools
 import hashlib
 import shutil
 import logging
@@ -8,6 +10,7 @@ import io
 import csv
 from datetime import datetime
 import config.settings as settings
+from utils.stat_cache import stat_path, get_mtime
 
 _MAX_WIN_FILENAME = 240  # conservative cap to avoid MAX_PATH issues
 _HASH_LEN = 16
@@ -125,7 +128,8 @@ def _wait_for_stable_mtime(path: str, checks: int, interval: float, max_wait: fl
             except Exception:
                 pass
             try:
-                cur = os.path.getmtime(path)
+                # fresh：每次檢查都重新掃描，結果同時更新共用的 stat 快取
+                cur = get_mtime(path, fresh=True)
             except Exception:
                 return False
             if last is None:
@@ -275,51 +279,148 @@ def _run_subprocess_copy(src: str, dst: str, engine: str = 'robocopy'):
         raise ValueError(f"Unknown subprocess copy engine: {engine}")
 
 
-def copy_to_cache(network_path, silent=False):
+def _strict_result(network_path):
+    return None if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False) else network_path
+
+
+def _cache_preflight(network_path, silent):
+    """
+    複製前檢查，返回 (result, cache_file)：
+    cache_file 為 None 時不需複製，result 即 copy_to_cache 的返回值；否則需複製到 cache_file
+    """
     # 嚴格模式下，如果不使用本地快取，直接返回 None（不讀原檔）
     if not settings.USE_LOCAL_CACHE:
         if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False):
             if not silent:
                 print("   ⚠️ 嚴格模式啟用且未啟用本地快取：跳過讀取原檔。")
-            return None
-        return network_path
+            return None, None
+        return network_path, None
 
-    try:
-        os.makedirs(settings.CACHE_FOLDER, exist_ok=True)
+    os.makedirs(settings.CACHE_FOLDER, exist_ok=True)
 
-        # If the source already under cache root, return as-is to avoid prefix duplication
-        if _is_in_cache(network_path):
-            return network_path
+    # If the source already under cache root, return as-is to avoid prefix duplication
+    if _is_in_cache(network_path):
+        return network_path, None
 
-        if not os.path.exists(network_path):
-            raise FileNotFoundError(f"網絡檔案不存在: {network_path}")
-        if not os.access(network_path, os.R_OK):
-            raise PermissionError(f"無法讀取網絡檔案: {network_path}")
+    # 來源的存在/mtime/size 取自同一次 stat（與輪詢、quick-skip 共用本 tick 的結果）
+    src_stat = stat_path(network_path)
+    if src_stat is None:
+        raise FileNotFoundError(f"網絡檔案不存在: {network_path}")
+    if not os.access(network_path, os.R_OK):
+        raise PermissionError(f"無法讀取網絡檔案: {network_path}")
 
-        cache_file = os.path.join(settings.CACHE_FOLDER, _safe_cache_basename(network_path))
+    cache_file = os.path.join(settings.CACHE_FOLDER, _safe_cache_basename(network_path))
 
-        # 若快取已新於來源，直接用快取檔
-        if os.path.exists(cache_file):
-            try:
-                if os.path.getmtime(cache_file) >= os.path.getmtime(network_path):
-                    return cache_file
-            except OSError as e:
-                logging.warning(f"獲取緩存檔案時間失敗: {e}")
+    # 若快取已新於來源，直接用快取檔
+    if os.path.exists(cache_file):
+        try:
+            cache_mtime = os.path.getmtime(cache_file)
+            # 沿用快取副本前以最新 stat 再確認一次（tick 內來源可能剛被改寫），需要複製時則不必
+            if cache_mtime >= src_stat.st_mtime:
+                src_stat = stat_path(network_path, fresh=True)
+                if src_stat is None:
+                    raise FileNotFoundError(f"網絡檔案不存在: {network_path}")
+                if cache_mtime >= src_stat.st_mtime:
+                    return cache_file, None
+        except OSError as e:
+            logging.warning(f"獲取緩存檔案時間失敗: {e}")
+
+    network_size = src_stat.st_size
+    if not silent:
+        sz = f" ({network_size/(1024*1024):.1f} MB)" if network_size else ""
+        print(f"   📥 複製到緩存: {os.path.basename(network_path)}{sz}")
+    return None, cache_file
+
+
+def _copy_retry_settings():
+    retry = max(1, int(getattr(settings, 'COPY_RETRY_COUNT', 3)))
+    backoff = max(0.0, float(getattr(settings, 'COPY_RETRY_BACKOFF_SEC', 0.5)))
+    chunk_mb = max(0, int(getattr(settings, 'COPY_CHUNK_SIZE_MB', 0)))
+    return retry, backoff, chunk_mb
+
+
+def _copy_stability_settings():
+    st_checks = max(1, int(getattr(settings, 'COPY_STABILITY_CHECKS', 2)))
+    st_interval = max(0.0, float(getattr(settings, 'COPY_STABILITY_INTERVAL_SEC', 1.0)))
+    st_maxwait = float(getattr(settings, 'COPY_STABILITY_MAX_WAIT_SEC', 3.0))
+    return st_checks, st_interval, st_maxwait
+
+
+def _copy_once(network_path, cache_file, chunk_mb):
+    """單次複製（不含重試與等待），返回實際使用的複製引擎；失敗時拋出 OSError"""
+    # 子程序複製策略：.xlsm 或設定指定時優先
+    use_sub = False
+    sub_engine = getattr(settings, 'COPY_ENGINE', 'python')
+    prefer_xlsm = bool(getattr(settings, 'PREFER_SUBPROCESS_FOR_XLSM', False))
+    if sub_engine in ('robocopy', 'powershell'):
+        use_sub = True
+    elif prefer_xlsm and str(network_path).lower().endswith('.xlsm'):
+        sub_engine = getattr(settings, 'SUBPROCESS_ENGINE_FOR_XLSM', 'robocopy')
+        use_sub = True
+
+    if use_sub:
+        _run_subprocess_copy(network_path, cache_file, engine=sub_engine)
+        return sub_engine
+    if chunk_mb > 0:
+        _chunked_copy(network_path, cache_file, chunk_mb=chunk_mb)
+    else:
+        shutil.copy2(network_path, cache_file)
+    return 'python'
+
+
+def _copy_succeeded(network_path, duration, attempt, retry, engine, chunk_mb, silent):
+    if not silent:
+        print(f"      複製完成，耗時 {duration:.1f} 秒（第 {attempt}/{retry} 次嘗試）")
+    try:
+        _ops_log_copy_success(network_path, duration, attempt, engine=engine, chunk_mb=chunk_mb)
+    except Exception:
+        pass
 
-        network_size = None
+
+def _copy_failed(network_path, last_err, attempt, silent):
+    # 若最終複製失敗
+    if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False):
+        logging.error(f"嚴格模式：無法複製到緩存，跳過原檔讀取：{last_err}")
+        try:
+            _ops_log_copy_failure(network_path, last_err, attempt, True)
+        except Exception:
+            pass
+        if not silent:
+            print("   ❌ 複製到快取失敗（嚴格模式：不讀原檔），略過。")
+        return None
+    else:
+        logging.error(f"緩存失敗 - 將回退為直接使用原檔（非嚴格模式）：{last_err}")
         try:
-            network_size = os.path.getsize(network_path)
+            _ops_log_copy_failure(network_path, last_err, attempt, False)
         except Exception:
             pass
         if not silent:
-            sz = f" ({network_size/(1024*1024):.1f} MB)" if network_size else ""
-            print(f"   📥 複製到緩存: {os.path.basename(network_path)}{sz}")
+            print("   ⚠️ 緩存失敗：回退為直接讀原檔（非嚴格模式）")
+        return network_path
+
+
+def _cache_error(network_path, e, silent):
+    if isinstance(e, FileNotFoundError):
+        logging.error(f"緩存失敗 - 檔案未找到: {e}")
+    elif isinstance(e, PermissionError):
+        logging.error(f"緩存失敗 - 權限不足: {e}")
+    else:
+        logging.error(f"緩存失敗 - 複製緩存檔案時發生 I/O 錯誤: {e}")
+    if not silent:
+        print(f"   ❌ 緩存失敗: {e}")
+    return _strict_result(network_path)
+
+
+def copy_to_cache(network_path, silent=False):
+    try:
+        result, cache_file = _cache_preflight(network_path, silent)
+        if cache_file is None:
+            return result
 
-        retry = max(1, int(getattr(settings, 'COPY_RETRY_COUNT', 3)))
-        backoff = max(0.0, float(getattr(settings, 'COPY_RETRY_BACKOFF_SEC', 0.5)))
-        chunk_mb = max(0, int(getattr(settings, 'COPY_CHUNK_SIZE_MB', 0)))
+        retry, backoff, chunk_mb = _copy_retry_settings()
 
         last_err = None
+        attempt = 0
         for attempt in range(1, retry + 1):
             # 若正在停止，立即中止循環
             try:
@@ -329,9 +430,7 @@ def copy_to_cache(network_path, silent=False):
             except Exception:
                 pass
             # 複製前穩定性預檢
-            st_checks = max(1, int(getattr(settings, 'COPY_STABILITY_CHECKS', 2)))
-            st_interval = max(0.0, float(getattr(settings, 'COPY_STABILITY_INTERVAL_SEC', 1.0)))
-            st_maxwait = float(getattr(settings, 'COPY_STABILITY_MAX_WAIT_SEC', 3.0))
+            st_checks, st_interval, st_maxwait = _copy_stability_settings()
             if st_checks > 1:
                 stable_ok = _wait_for_stable_mtime(network_path, st_checks, st_interval, st_maxwait)
                 if not stable_ok:
@@ -342,34 +441,10 @@ def copy_to_cache(network_path, silent=False):
 
             copy_start = time.time()
             try:
-                # 子程序複製策略：.xlsm 或設定指定時優先
-                use_sub = False
-                sub_engine = getattr(settings, 'COPY_ENGINE', 'python')
-                prefer_xlsm = bool(getattr(settings, 'PREFER_SUBPROCESS_FOR_XLSM', False))
-                if sub_engine in ('robocopy', 'powershell'):
-                    use_sub = True
-                elif prefer_xlsm and str(network_path).lower().endswith('.xlsm'):
-                    sub_engine = getattr(settings, 'SUBPROCESS_ENGINE_FOR_XLSM', 'robocopy')
-                    use_sub = True
-
-                used_engine = 'python'
-                if use_sub:
-                    _run_subprocess_copy(network_path, cache_file, engine=sub_engine)
-                    used_engine = sub_engine
-                else:
-                    if chunk_mb > 0:
-                        _chunked_copy(network_path, cache_file, chunk_mb=chunk_mb)
-                    else:
-                        shutil.copy2(network_path, cache_file)
+                used_engine = _copy_once(network_path, cache_file, chunk_mb)
                 # 短暫等待，給檔案系統穩定
                 time.sleep(getattr(settings, 'COPY_POST_SLEEP_SEC', 0.2))
-                duration = time.time() - copy_start
-                if not silent:
-                    print(f"      複製完成，耗時 {duration:.1f} 秒（第 {attempt}/{retry} 次嘗試）")
-                try:
-                    _ops_log_copy_success(network_path, duration, attempt, engine=used_engine, chunk_mb=chunk_mb)
-                except Exception:
-                    pass
+                _copy_succeeded(network_path, time.time() - copy_start, attempt, retry, used_engine, chunk_mb, silent)
                 return cache_file
             except (PermissionError, OSError) as e:
                 last_err = e
@@ -380,38 +455,86 @@ def copy_to_cache(network_path, silent=False):
                 else:
                     break
 
-        # 若最終複製失敗
-        if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False):
-            logging.error(f"嚴格模式：無法複製到緩存，跳過原檔讀取：{last_err}")
-            try:
-                _ops_log_copy_failure(network_path, last_err, attempt, True)
-            except Exception:
-                pass
-            if not silent:
-                print("   ❌ 複製到快取失敗（嚴格模式：不讀原檔），略過。")
-            return None
+        return _copy_failed(network_path, last_err, attempt, silent)
+
+    except (FileNotFoundError, PermissionError, OSError) as e:
+        return _cache_error(network_path, e, silent)
+
+
+async def _wait_for_stable_mtime_async(path, checks, interval, max_wait, run_blocking):
+    """_wait_for_stable_mtime 的 asyncio 版本：等待以 await asyncio.sleep 進行，不佔用執行緒"""
+    if checks <= 1:
+        return True
+    last = None
+    same = 0
+    start = time.time()
+    while True:
+        if getattr(settings, 'force_stop', False):
+            return False
+        try:
+            cur = await run_blocking(get_mtime, path, True)
+        except Exception:
+            return False
+        if last is not None and cur == last:
+            same += 1
         else:
-            logging.error(f"緩存失敗 - 將回退為直接使用原檔（非嚴格模式）：{last_err}")
+            same = 1
+            last = cur
+        if same >= checks:
+            return True
+        if max_wait is not None and (time.time() - start) >= max_wait:
+            return False
+        await asyncio.sleep(max(0.0, interval))
+
+
+async def copy_to_cache_async(network_path, silent=False, run_blocking=None):
+    """
+    copy_to_cache 的 asyncio 版本（結果相同）：穩定性預檢、重試退避與複製後等待都是 await，
+    等待中的檔案不佔用任何執行緒；stat 與實際複製交給 run_blocking（預設為 loop 的預設 executor）
+    """
+    if run_blocking is None:
+        loop = asyncio.get_running_loop()
+
+        async def run_blocking(fn, *args):
+            return await loop.run_in_executor(None, functools.partial(fn, *args))
+
+    try:
+        result, cache_file = await run_blocking(_cache_preflight, network_path, silent)
+        if cache_file is None:
+            return result
+
+        retry, backoff, chunk_mb = _copy_retry_settings()
+
+        last_err = None
+        attempt = 0
+        for attempt in range(1, retry + 1):
+            if getattr(settings, 'force_stop', False):
+                last_err = OSError('Operation cancelled: stopping')
+                break
+            st_checks, st_interval, st_maxwait = _copy_stability_settings()
+            if st_checks > 1:
+                if not await _wait_for_stable_mtime_async(network_path, st_checks, st_interval, st_maxwait, run_blocking):
+                    if not silent:
+                        print(f"      ⏳ 源檔案仍在變動，延後複製（第 {attempt}/{retry} 次）")
+                    await asyncio.sleep(backoff * attempt)
+                    continue
+
+            copy_start = time.time()
             try:
-                _ops_log_copy_failure(network_path, last_err, attempt, False)
-            except Exception:
-                pass
-            if not silent:
-                print("   ⚠️ 緩存失敗：回退為直接讀原檔（非嚴格模式）")
-            return network_path
+                used_engine = await run_blocking(_copy_once, network_path, cache_file, chunk_mb)
+                await asyncio.sleep(getattr(settings, 'COPY_POST_SLEEP_SEC', 0.2))
+                _copy_succeeded(network_path, time.time() - copy_start, attempt, retry, used_engine, chunk_mb, silent)
+                return cache_file
+            except (PermissionError, OSError) as e:
+                last_err = e
+                if not silent:
+                    print(f"      ↻ 第 {attempt}/{retry} 次複製失敗：{e}")
+                if attempt < retry:
+                    await asyncio.sleep(backoff * attempt)
+                else:
+                    break
 
-    except FileNotFoundError as e:
-        logging.error(f"緩存失敗 - 檔案未找到: {e}")
-        if not silent:
-            print(f"   ❌ 緩存失敗: {e}")
-        return None if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False) else network_path
-    except PermissionError as e:
-        logging.error(f"緩存失敗 - 權限不足: {e}")
-        if not silent:
-            print(f"   ❌ 緩存失敗: {e}")
-        return None if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False) else network_path
-    except OSError as e:
-        logging.error(f"緩存失敗 - 複製緩存檔案時發生 I/O 錯誤: {e}")
-        if not silent:
-            print(f"   ❌ 緩存失敗: {e}")
-        return None if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False) else network_path
\ No newline at end of file
+        return _copy_failed(network_path, last_err, attempt, silent)
+
+    except (FileNotFoundError, PermissionError, OSError) as e:
+        return _cache_error(network_path, e, silent)
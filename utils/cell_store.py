@@ -0,0 +1,557 @@
+"""
+欄式儲存格存放（columnar cell store）
+- 每張工作表一個 SheetCells，取代 { addr: {formula, value, cached_value, external_ref} } 的巢狀 dict
+- 位址以 row * 16384 + col 排序存成 array('q')；公式字串/字串值各自 intern 成表，只存索引
+- value / cached_value 為型別欄（kind + payload），cached_value 與 value 相同時只記一個標記；external_ref 為位元遮罩
+- 每格約 30 bytes（原本 dict + 4 欄位約 400+ bytes）
+- shared formula（整欄填滿的公式）可按組存放：master 原文 + master 位置，組員只記組號，
+  讀取時才以 shift_formula 展開成完整公式字串（比較時同組同位置即視為相同，不必展開）
+- 介面為唯讀 Mapping：ws[addr] / ws.get(addr) / ws.keys() / items() / len() / == 與原 dict 版本一致，
+  ws[addr] 每次返回新的 4 欄位 dict（呼叫方改了也不影響存放內容）
+"""
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from utils.value_engines.addressing import column_letters
+from utils.value_engines.xml_cells_reader import shift_formula
+
+_COL_SPAN = 16384
+_ADDR_RE = re.compile(r'([A-Z]{1,3})([1-9][0-9]*)')
+_CELL_KEYS = ('formula', 'value', 'cached_value', 'external_ref')
+
+# value / cached_value 的型別代碼
+K_NONE, K_STR, K_INT, K_FLOAT, K_TRUE, K_FALSE, K_OTHER, K_SAME = range(8)
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+_col_index = {}
+
+
+def _letters_to_col(letters):
+    n = _col_index.get(letters)
+    if n is None:
+        n = 0
+        for ch in letters:
+            n = n * 26 + (ord(ch) - 64)
+        _col_index[letters] = n
+    return n
+
+
+def addr_to_key(addr):
+    """'B3' -> 3 * 16384 + 1（欄號 0 起算）；不是標準 A1 位址時返回 None"""
+    m = _ADDR_RE.fullmatch(addr) if isinstance(addr, str) else None
+    if m is None:
+        return None
+    col = _letters_to_col(m.group(1))
+    if col > _COL_SPAN:
+        return None
+    return int(m.group(2)) * _COL_SPAN + (col - 1)
+
+
+_letters_table = []
+
+
+def key_to_addr(key):
+    row, col0 = divmod(key, _COL_SPAN)
+    if not _letters_table:
+        _letters_table.extend(column_letters(_COL_SPAN))
+    return _letters_table[col0] + str(row)
+
+
+def formula_text(token, key):
+    """
+    columns(expand_formulas=False) 的公式欄元素 -> 公式字串：
+    str/None 原樣返回；(master 原文, master 鍵) 的組標記按 key 與 master 的行列差展開
+    """
+    if type(token) is not tuple:
+        return token
+    raw, master_key = token
+    r0, c0 = divmod(master_key, _COL_SPAN)
+    r1, c1 = divmod(key, _COL_SPAN)
+    return '=' + shift_formula(raw, r1 - r0, c1 - c0)
+
+
+def groups_from_parser(groups):
+    """解析器輸出的 [[master 原文, master 位址, [組員位址...]], ...] -> [(原文, master 鍵, [組員鍵...])]"""
+    out = []
+    for raw, master_addr, addrs in groups or ():
+        keys = [addr_to_key(a) for a in addrs]
+        master_key = addr_to_key(master_addr)
+        if master_key is None or any(k is None for k in keys):
+            return None
+        out.append((raw, master_key, keys))
+    return out
+
+
+def _encode_runs(keys):
+    # 鍵 -> 扁平 [起點, 長度, ...]；按欄優先排序後，同欄連續列（鍵差 16384）合成一段
+    runs = []
+    start = prev = None
+    n = 0
+    for k in sorted(keys, key=lambda k: (k % _COL_SPAN, k)):
+        if prev is not None and k == prev + _COL_SPAN:
+            n += 1
+        else:
+            if start is not None:
+                runs += [start, n]
+            start, n = k, 1
+        prev = k
+    if start is not None:
+        runs += [start, n]
+    return runs
+
+
+def groups_from_json(groups):
+    """baseline 內的 [[原文, master 鍵, [起點, 長度, ...]], ...] -> [(原文, master 鍵, [組員鍵...])]"""
+    out = []
+    for raw, master_key, runs in groups or ():
+        keys = []
+        for s in range(0, len(runs) - 1, 2):
+            start, n = int(runs[s]), int(runs[s + 1])
+            keys.extend(range(start, start + n * _COL_SPAN, _COL_SPAN))
+        out.append((str(raw), int(master_key), keys))
+    return out
+
+
+class _Builder:
+    """逐格寫入用的暫存表（intern 表 + 各欄 array），build 完成後交給 SheetCells"""
+
+    def __init__(self):
+        self.keys = array('q')
+        self.formula_idx = array('i')
+        self.vkind = array('B')
+        self.vdata = array('q')
+        self.ckind = array('B')
+        self.cdata = array('q')
+        self.ext = bytearray()
+        self.formulas = []
+        self.strings = []
+        self.floats = array('d')
+        self.objects = []
+        self._formula_ids = {}
+        self._string_ids = {}
+
+    def _intern(self, s, table, ids):
+        i = ids.get(s)
+        if i is None:
+            i = len(table)
+            table.append(s)
+            ids[s] = i
+        return i
+
+    def _encode(self, v):
+        t = type(v)
+        if v is None:
+            return K_NONE, 0
+        if t is str:
+            return K_STR, self._intern(v, self.strings, self._string_ids)
+        if t is bool:
+            return (K_TRUE if v else K_FALSE), 0
+        if t is int and _INT64_MIN <= v <= _INT64_MAX:
+            return K_INT, v
+        if t is float:
+            self.floats.append(v)
+            return K_FLOAT, len(self.floats) - 1
+        self.objects.append(v)
+        return K_OTHER, len(self.objects) - 1
+
+    def add(self, key, cell, group=None):
+        f = cell['formula']
+        if group is not None:
+            # shared formula 組員：只記組號（-2 起算往下），公式字串讀取時再展開
+            self.formula_idx.append(-2 - group)
+        elif f is None:
+            self.formula_idx.append(-1)
+        elif type(f) is str:
+            self.formula_idx.append(self._intern(f, self.formulas, self._formula_ids))
+        else:
+            return False
+        ext = cell['external_ref']
+        if type(ext) is not bool:
+            return False
+        v, c = cell['value'], cell['cached_value']
+        vk, vd = self._encode(v)
+        if type(c) is type(v) and (c is v or c == v) and vk != K_OTHER:
+            ck, cd = K_SAME, 0
+        else:
+            ck, cd = self._encode(c)
+        self.keys.append(key)
+        self.vkind.append(vk)
+        self.vdata.append(vd)
+        self.ckind.append(ck)
+        self.cdata.append(cd)
+        self.ext.append(1 if ext else 0)
+        return True
+
+
+class SheetCells(Mapping):
+    """
+    單張工作表的欄式儲存；唯讀 Mapping，介面與 { addr: cell_dict } 相容。
+    以 SheetCells.from_dict() 建立，無法無損轉換時返回 None（呼叫方保留原 dict）。
+    """
+    __slots__ = ('_keys', '_formula_idx', '_vkind', '_vdata', '_ckind', '_cdata', '_ext_bits',
+                 '_formulas', '_strings', '_floats', '_objects', '_groups', 'ext_scanned')
+
+    @classmethod
+    def from_dict(cls, ws, groups=None):
+        """
+        groups：[(master 原文, master 鍵, [組員鍵...])]；組員格的公式改按組存放（dict 內的公式字串不再使用，
+        baseline 載入時可為 None）。只應傳入解析器確認「展開結果即為該格公式」的組。
+        """
+        if isinstance(ws, LazySheet):
+            ws = ws.load()
+        if isinstance(ws, SheetCells):
+            return ws
+        if not isinstance(ws, dict):
+            return None
+        group_tokens = []
+        member = {}
+        for gid, (raw, master_key, keys) in enumerate(groups or ()):
+            group_tokens.append((raw, master_key))
+            for k in keys:
+                member[k] = gid
+        rows = []
+        for addr, cell in ws.items():
+            key = addr_to_key(addr)
+            # 只收標準 4 欄位 dict；位址須能原樣還原（排除 'A01' 之類）
+            if key is None or type(cell) is not dict or len(cell) != 4 or any(k not in cell for k in _CELL_KEYS):
+                return None
+            rows.append((key, cell))
+        rows.sort(key=lambda r: r[0])
+        b = _Builder()
+        for key, cell in rows:
+            if not b.add(key, cell, member.get(key) if member else None):
+                return None
+        self = cls.__new__(cls)
+        self._keys = b.keys
+        self._formula_idx = b.formula_idx
+        self._vkind, self._vdata = b.vkind, b.vdata
+        self._ckind, self._cdata = b.ckind, b.cdata
+        # external_ref 壓成位元遮罩（每 8 格 1 byte）
+        bits = bytearray((len(b.ext) + 7) // 8)
+        for i, e in enumerate(b.ext):
+            if e:
+                bits[i >> 3] |= 1 << (i & 7)
+        self._ext_bits = bytes(bits)
+        self._formulas = b.formulas
+        self._strings = b.strings
+        self._floats = b.floats
+        self._objects = b.objects
+        self._groups = group_tokens
+        # external_ref 是否由目前的解析器偵測（是則比較時不必再掃公式）
+        self.ext_scanned = False
+        return self
+
+    # ---- 單格解碼 ----
+    def _decode(self, kind, data):
+        if kind == K_NONE:
+            return None
+        if kind == K_STR:
+            return self._strings[data]
+        if kind == K_INT:
+            return data
+        if kind == K_FLOAT:
+            return self._floats[data]
+        if kind == K_TRUE:
+            return True
+        if kind == K_FALSE:
+            return False
+        return self._objects[data]
+
+    def _formula_at(self, i):
+        fi = self._formula_idx[i]
+        if fi >= 0:
+            return self._formulas[fi]
+        if fi == -1:
+            return None
+        return formula_text(self._groups[-2 - fi], self._keys[i])
+
+    def _cell_at(self, i):
+        value = self._decode(self._vkind[i], self._vdata[i])
+        ck = self._ckind[i]
+        return {
+            'formula': self._formula_at(i),
+            'value': value,
+            'cached_value': value if ck == K_SAME else self._decode(ck, self._cdata[i]),
+            'external_ref': bool(self._ext_bits[i >> 3] & (1 << (i & 7))),
+        }
+
+    def _index_of(self, addr):
+        key = addr_to_key(addr)
+        if key is None:
+            return -1
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return -1
+
+    # ---- Mapping 介面 ----
+    def __getitem__(self, addr):
+        i = self._index_of(addr)
+        if i < 0:
+            raise KeyError(addr)
+        return self._cell_at(i)
+
+    def __contains__(self, addr):
+        return self._index_of(addr) >= 0
+
+    def __iter__(self):
+        for key in self._keys:
+            yield key_to_addr(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def items(self):
+        # 順序遍歷不需 bisect，逐格解碼
+        return [(key_to_addr(k), self._cell_at(i)) for i, k in enumerate(self._keys)]
+
+    def values(self):
+        return [self._cell_at(i) for i in range(len(self._keys))]
+
+    @property
+    def key_array(self):
+        """已排序的位址鍵 array('q')（row * 16384 + 欄號 0 起算），與 columns() 逐位對應"""
+        return self._keys
+
+    def _decode_column(self, kinds, data):
+        strings, floats, objects = self._strings, self._floats, self._objects
+        out = []
+        append = out.append
+        for k, d in zip(kinds, data):
+            if k == K_STR:
+                append(strings[d])
+            elif k == K_INT:
+                append(d)
+            elif k == K_NONE or k == K_SAME:
+                append(None)
+            elif k == K_FLOAT:
+                append(floats[d])
+            elif k == K_TRUE:
+                append(True)
+            elif k == K_FALSE:
+                append(False)
+            else:
+                append(objects[d])
+        return out
+
+    def columns(self, expand_formulas=True):
+        """
+        解碼為四個平行 list：(formula, value, cached_value, external_ref)，順序與 key_array 一致。
+        供整欄比較/合併比對使用，不建立每格 dict；返回的是臨時 list，不作快取。
+        expand_formulas=False 時 shared formula 組員以組標記 (master 原文, master 鍵) 代替公式字串
+        （同組同位置必然同公式；需要字串時用 formula_text(token, key) 展開）。
+        """
+        formulas, groups = self._formulas, self._groups
+        f_col = [formulas[i] if i >= 0 else (None if i == -1 else groups[-2 - i]) for i in self._formula_idx]
+        if expand_formulas and groups:
+            f_col = [formula_text(t, k) if type(t) is tuple else t for t, k in zip(f_col, self._keys)]
+        v_col = self._decode_column(self._vkind, self._vdata)
+        c_col = self._decode_column(self._ckind, self._cdata)
+        # K_SAME：cached_value 與 value 相同
+        c_col = [v if k == K_SAME else c for k, v, c in zip(self._ckind, v_col, c_col)]
+        bits = self._ext_bits
+        e_col = [bool(bits[i >> 3] & (1 << (i & 7))) for i in range(len(self._keys))]
+        return f_col, v_col, c_col, e_col
+
+    def __eq__(self, other):
+        if isinstance(other, LazySheet):
+            other = other.load()
+        if isinstance(other, SheetCells):
+            if self is other:
+                return True
+            if self._keys != other._keys or self._ext_bits != other._ext_bits:
+                return False
+            a = self.columns(expand_formulas=False)
+            b = other.columns(expand_formulas=False)
+            if a[1:] != b[1:]:
+                return False
+            if a[0] == b[0]:
+                return True
+            # 公式欄有組標記/字串不同的位置才展開比較
+            keys = self._keys
+            return all(fa == fb or formula_text(fa, k) == formula_text(fb, k)
+                       for fa, fb, k in zip(a[0], b[0], keys))
+        if isinstance(other, Mapping):
+            if len(other) != len(self):
+                return False
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def to_dict(self, expand_formulas=True):
+        """
+        還原為 { addr: {formula, value, cached_value, external_ref} }（列優先順序）。
+        expand_formulas=False：shared formula 組員的 formula 記為 None（配合 formula_groups() 一起保存）
+        """
+        if expand_formulas or not self._groups:
+            return dict(self.items())
+        fidx = self._formula_idx
+        return {key_to_addr(k): (self._cell_at(i) if fidx[i] > -2 else self._cell_at_raw(i))
+                for i, k in enumerate(self._keys)}
+
+    def _cell_at_raw(self, i):
+        # 同 _cell_at，但不展開公式（formula 記為 None）
+        value = self._decode(self._vkind[i], self._vdata[i])
+        ck = self._ckind[i]
+        return {
+            'formula': None,
+            'value': value,
+            'cached_value': value if ck == K_SAME else self._decode(ck, self._cdata[i]),
+            'external_ref': bool(self._ext_bits[i >> 3] & (1 << (i & 7))),
+        }
+
+    @property
+    def has_formula_groups(self):
+        return bool(self._groups)
+
+    def formula_groups(self):
+        """可寫入 JSON 的組表：[[master 原文, master 鍵, [起點, 長度, ...]], ...]（groups_from_json 的反向）"""
+        members = [[] for _ in self._groups]
+        for fi, k in zip(self._formula_idx, self._keys):
+            if fi <= -2:
+                members[-2 - fi].append(k)
+        return [[raw, master_key, _encode_runs(keys)] for (raw, master_key), keys in zip(self._groups, members)]
+
+    def __repr__(self):
+        return f"<SheetCells cells={len(self)} formulas={len(self._formulas)} strings={len(self._strings)}>"
+
+    def __reduce__(self):
+        # pickle（行程池傳遞）時以 dict 形式往返
+        return (_sheet_from_dict, (self.to_dict(),))
+
+    @property
+    def nbytes(self):
+        """近似記憶體佔用（arrays + intern 表的字串）"""
+        total = sum(a.itemsize * len(a) for a in (self._keys, self._formula_idx, self._vkind, self._vdata,
+                                                   self._ckind, self._cdata, self._floats))
+        total += len(self._ext_bits)
+        total += sum(sys.getsizeof(s) for s in self._formulas)
+        total += sum(sys.getsizeof(s) for s in self._strings)
+        total += sum(sys.getsizeof(o) for o in self._objects)
+        total += sum(sys.getsizeof(raw) + 64 for raw, _ in self._groups)
+        return total
+
+
+class LazySheet(Mapping):
+    """
+    延遲載入的工作表（baseline 逐表載入用）：第一次讀取內容時才呼叫 loader() 解碼，返回 SheetCells 或 dict。
+    len() 與 nbytes 取自建立時的統計，不觸發載入；與自身比較（沿用未變工作表）也不載入。
+    """
+    __slots__ = ('_loader', '_sheet', '_count', '_nbytes', '_lock')
+
+    def __init__(self, loader, count, nbytes=0):
+        self._loader = loader
+        self._sheet = None
+        self._count = int(count)
+        self._nbytes = int(nbytes or 0)
+        self._lock = threading.Lock()
+
+    def load(self):
+        sheet = self._sheet
+        if sheet is None:
+            with self._lock:
+                if self._sheet is None:
+                    self._sheet = self._loader()
+                    self._loader = None
+                sheet = self._sheet
+        return sheet
+
+    @property
+    def loaded(self):
+        return self._sheet is not None
+
+    def __getitem__(self, addr):
+        return self.load()[addr]
+
+    def __contains__(self, addr):
+        return addr in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        sheet = self._sheet
+        return self._count if sheet is None else len(sheet)
+
+    def __eq__(self, other):
+        if other is self:
+            return True
+        if isinstance(other, LazySheet):
+            other = other.load()
+        return self.load() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"<LazySheet cells={len(self)} loaded={self.loaded}>"
+
+    def __reduce__(self):
+        sheet = self.load()
+        return (_sheet_from_dict, (sheet.to_dict() if isinstance(sheet, SheetCells) else dict(sheet),))
+
+    @property
+    def nbytes(self):
+        sheet = self._sheet
+        if sheet is None:
+            return self._nbytes
+        return getattr(sheet, 'nbytes', None) or 400 * len(sheet)
+
+
+def _sheet_from_dict(ws):
+    return SheetCells.from_dict(ws) or ws
+
+
+def compact_workbook(cells_by_sheet, ext_scanned=False, formula_groups=None):
+    """
+    將 { sheet: { addr: cell } } 的每張表原地換成 SheetCells；無法無損轉換的表保留原 dict。
+    ext_scanned=True 表示 external_ref 由目前的解析器偵測（解析結果、或帶偵測版本的 baseline）。
+    formula_groups：{ sheet: [(master 原文, master 鍵, [組員鍵...])] }，該表的 shared formula 按組存放。
+    返回同一個 dict（None/非 dict 原樣返回）。
+    """
+    if not isinstance(cells_by_sheet, dict):
+        return cells_by_sheet
+    for name, ws in list(cells_by_sheet.items()):
+        if isinstance(ws, dict) and ws:
+            packed = SheetCells.from_dict(ws, groups=(formula_groups or {}).get(name))
+            if packed is not None:
+                packed.ext_scanned = bool(ext_scanned)
+                cells_by_sheet[name] = packed
+    return cells_by_sheet
+
+
+def expand_formula_groups(cells_by_sheet, formula_groups):
+    """不走欄式存放時，把 baseline 中按組保存（formula 為 None）的組員公式原地展開回字串"""
+    for name, groups in (formula_groups or {}).items():
+        ws = cells_by_sheet.get(name)
+        if not isinstance(ws, dict):
+            continue
+        for raw, master_key, keys in groups:
+            token = (raw, master_key)
+            for k in keys:
+                cell = ws.get(key_to_addr(k))
+                if isinstance(cell, dict):
+                    cell['formula'] = formula_text(token, k)
+    return cells_by_sheet
+
+
+def compact_enabled():
+    try:
+        import config.settings as settings
+        return str(getattr(settings, 'CELL_STORE', 'columnar')).lower() == 'columnar'
+    except Exception:
+        return False
+
+
+def json_default(o):
+    """json.dumps(default=...) 用：SheetCells 轉回 dict，輸出與原 dict 版本逐字相同（sort_keys 時）"""
+    if isinstance(o, LazySheet):
+        o = o.load()
+        return o.to_dict() if isinstance(o, SheetCells) else dict(o)
+    if isinstance(o, SheetCells):
+        return o.to_dict()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
@@ -5,6 +5,8 @@ import os
 import json
 import gzip
 import time
+import random
+import threading
 from datetime import datetime
 import logging
 
@@ -28,6 +30,7 @@ except ImportError as e:
     print("[WARNING] 請執行: pip install zstandard")
 
 import config.settings as settings
+from utils.cell_store import json_default as _json_default
 
 class CompressionFormat:
     """壓縮格式枚舉"""
@@ -105,8 +108,7 @@ def compress_data(data, format_type=None, level=None):
         compression_level = level or settings.ZSTD_COMPRESSION_LEVEL
         # 🔥 移除這行 - 過於詳細的調試訊息
         # print(f"[DEBUG] 使用 Zstd 壓縮，級別: {compression_level}")
-        compressor = zstd.ZstdCompressor(level=compression_level)
-        return compressor.compress(data)
+        return _zstd_compressor(compression_level).compress(data)
     
     else:
         # 降級到 gzip
@@ -126,40 +128,257 @@ def decompress_data(compressed_data, format_type=None):
     Returns:
         解壓縮後的字符串
     """
+    return decompress_bytes(compressed_data, format_type).decode('utf-8')
+
+def decompress_bytes(compressed_data, format_type=None):
+    """
+    解壓縮數據，返回原始 bytes（二進位基準線等非文字內容使用）
+    """
     if format_type == CompressionFormat.LZ4 and HAS_LZ4:
-        return lz4.frame.decompress(compressed_data).decode('utf-8')
+        return lz4.frame.decompress(compressed_data)
     
     elif format_type == CompressionFormat.ZSTD and HAS_ZSTD:
-        decompressor = zstd.ZstdDecompressor()
-        return decompressor.decompress(compressed_data).decode('utf-8')
+        return _zstd_decompress(compressed_data)
     
     else:
         # 嘗試 gzip 解壓
         try:
-            return gzip.decompress(compressed_data).decode('utf-8')
+            return gzip.decompress(compressed_data)
         except gzip.BadGzipFile as e:
             logging.error(f"gzip 解壓縮失敗: {e}")
             # 如果 gzip 失敗，嘗試其他格式
             if HAS_LZ4:
                 try:
-                    return lz4.frame.decompress(compressed_data).decode('utf-8')
+                    return lz4.frame.decompress(compressed_data)
                 except lz4.frame.LZ4FrameError as e:
                     logging.error(f"LZ4 解壓縮失敗: {e}")
                     pass
             
             if HAS_ZSTD:
                 try:
-                    decompressor = zstd.ZstdDecompressor()
-                    return decompressor.decompress(compressed_data).decode('utf-8')
-                except zstd.ZstdError as e:
+                    return _zstd_decompress(compressed_data)
+                except (zstd.ZstdError, ValueError) as e:
                     logging.error(f"Zstandard 解壓縮失敗: {e}")
                     pass
             
             raise ValueError("無法解壓縮數據，未知的壓縮格式")
 
+# =========== zstd 字典 ============
+# 字典以 dict_id 區分版本，寫在 zstd frame 的檔頭；解壓時依 frame 的 dict_id 取回對應字典，
+# 因此舊字典一律保留，重新訓練不影響已寫出的檔案。
+_DICT_MANIFEST = 'manifest.json'
+_dict_lock = threading.Lock()
+_dict_cache = {}            # (目錄, dict_id) -> ZstdCompressionDict
+_dict_current = {}          # 目錄 -> 目前使用的 dict_id（0 = 沒有字典）
+_dict_precomputed = {}      # (目錄, dict_id, 等級) -> 已 precompute 的壓縮用字典（各等級獨立一份，不改動解壓共用的字典物件）
+_dctx_local = threading.local()   # 每執行緒的 {dict_id: ZstdDecompressor}（decompressor 不可跨執行緒共用）
+
+def zstd_dictionary_dir():
+    """字典目錄：ZSTD_DICTIONARY_DIR，未設定時為 LOG_FOLDER/zstd_dict"""
+    return getattr(settings, 'ZSTD_DICTIONARY_DIR', '') or os.path.join(settings.LOG_FOLDER, 'zstd_dict')
+
+def _read_dict_manifest(dict_dir):
+    try:
+        with open(os.path.join(dict_dir, _DICT_MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'current': 0, 'dicts': {}}
+
+def _load_dictionary(dict_dir, dict_id):
+    # 呼叫方需持有 _dict_lock
+    key = (dict_dir, dict_id)
+    d = _dict_cache.get(key)
+    if d is None:
+        entry = _read_dict_manifest(dict_dir).get('dicts', {}).get(str(dict_id))
+        if not entry:
+            return None
+        try:
+            with open(os.path.join(dict_dir, entry['file']), 'rb') as f:
+                d = zstd.ZstdCompressionDict(f.read())
+        except OSError as e:
+            logging.error(f"讀取 zstd 字典失敗 {entry.get('file')}: {e}")
+            return None
+        _dict_cache[key] = d
+    return d
+
+def _current_dictionary():
+    """目前用於壓縮的字典；未啟用或尚未訓練時為 None"""
+    if not getattr(settings, 'ZSTD_DICTIONARY_ENABLED', False):
+        return None
+    dict_dir = zstd_dictionary_dir()
+    with _dict_lock:
+        if dict_dir not in _dict_current:
+            _dict_current[dict_dir] = int(_read_dict_manifest(dict_dir).get('current') or 0)
+        dict_id = _dict_current[dict_dir]
+        return _load_dictionary(dict_dir, dict_id) if dict_id else None
+
+def _zstd_compressor(level):
+    d = _current_dictionary()
+    if d is None:
+        return zstd.ZstdCompressor(level=level)
+    # 每個 (字典, 等級) 只 precompute 一次並快取；之後各執行緒建立 compressor 共用同一份（唯讀）
+    key = (zstd_dictionary_dir(), d.dict_id(), level)
+    with _dict_lock:
+        cdict = _dict_precomputed.get(key)
+        if cdict is None:
+            cdict = zstd.ZstdCompressionDict(d.as_bytes())
+            cdict.precompute_compress(level=level)
+            _dict_precomputed[key] = cdict
+    return zstd.ZstdCompressor(level=level, dict_data=cdict)
+
+def _zstd_decompress(compressed_data):
+    """
+    依 frame 檔頭的 dict_id 選字典解壓；以 decompressobj 解壓，串流寫出（frame 未記原始大小）的檔案也能讀
+    """
+    dict_id = zstd.get_frame_parameters(compressed_data).dict_id
+    cache = getattr(_dctx_local, 'decompressors', None)
+    if cache is None:
+        cache = _dctx_local.decompressors = {}
+    key = (zstd_dictionary_dir(), dict_id) if dict_id else None
+    decompressor = cache.get(key)
+    if decompressor is None:
+        if dict_id:
+            with _dict_lock:
+                d = _load_dictionary(zstd_dictionary_dir(), dict_id)
+            if d is None:
+                raise ValueError(f"缺少 zstd 字典 (dict_id={dict_id})，請確認 {zstd_dictionary_dir()} 內的字典檔")
+            decompressor = zstd.ZstdDecompressor(dict_data=d)
+        else:
+            decompressor = zstd.ZstdDecompressor()
+        cache[key] = decompressor
+    return decompressor.decompressobj().decompress(compressed_data)
+
+def _iter_dictionary_samples(max_bytes):
+    """
+    訓練樣本：二進位基準線的各表區塊、舊版 JSON 基準線與歷史快照（皆為解壓後的原始內容）。
+    檔案隨機抽樣；大內容切成 64KB 片段，總量達 max_bytes 為止。
+    """
+    from utils.baseline_format import is_binary_baseline, iter_raw_sheet_blocks
+    log_folder = settings.LOG_FOLDER
+    candidates = []
+    try:
+        for name in os.listdir(log_folder):
+            if '.baseline.' in name and not name.endswith(('.delta', '.tmp')):
+                candidates.append(os.path.join(log_folder, name))
+    except OSError:
+        pass
+    history_root = os.path.join(log_folder, 'history')
+    if os.path.isdir(history_root):
+        for root, _dirs, files in os.walk(history_root):
+            candidates.extend(os.path.join(root, f) for f in files if '.cells.json' in f)
+    random.shuffle(candidates)
+
+    piece = 64 * 1024
+    total = 0
+    for path in candidates:
+        try:
+            if is_binary_baseline(path):
+                raws = list(iter_raw_sheet_blocks(path))
+            else:
+                with open(path, 'rb') as f:
+                    raws = [decompress_bytes(f.read(), CompressionFormat.detect_format(path))]
+        except (OSError, ValueError) as e:
+            logging.warning(f"略過字典訓練樣本 {os.path.basename(path)}: {e}")
+            continue
+        for raw in raws:
+            for i in range(0, len(raw), piece):
+                sample = raw[i:i + piece]
+                yield sample
+                total += len(sample)
+                if total >= max_bytes:
+                    return
+
+def train_zstd_dictionary():
+    """
+    以現有基準線與歷史快照訓練新版本字典並設為目前字典。返回字典資訊，樣本不足或 zstd 不可用時返回 None。
+    """
+    if not HAS_ZSTD:
+        print("[WARNING] Zstandard 不可用，無法訓練字典")
+        return None
+    dict_size = int(getattr(settings, 'ZSTD_DICTIONARY_SIZE_KB', 112)) * 1024
+    # zstd 建議樣本總量約為字典大小的 100 倍
+    samples = list(_iter_dictionary_samples(dict_size * 100))
+    sample_bytes = sum(len(s) for s in samples)
+    if len(samples) < 10 or sample_bytes < dict_size * 4:
+        print(f"[zstd-dict] 樣本不足（{len(samples)} 個, {sample_bytes/1024:.0f}KB），暫不訓練字典")
+        return None
+    start = time.time()
+    try:
+        d = zstd.train_dictionary(dict_size, samples, level=settings.ZSTD_COMPRESSION_LEVEL)
+    except zstd.ZstdError as e:
+        logging.error(f"zstd 字典訓練失敗: {e}")
+        return None
+    dict_dir = zstd_dictionary_dir()
+    with _dict_lock:
+        manifest = _read_dict_manifest(dict_dir)
+        version = max([int(e.get('version', 0)) for e in manifest['dicts'].values()] or [0]) + 1
+        entry = {
+            'version': version,
+            'file': f"baseline-v{version}-{d.dict_id()}.zdict",
+            'created': datetime.now().isoformat(),
+            'samples': len(samples),
+            'sample_bytes': sample_bytes,
+            'size': len(d.as_bytes()),
+        }
+        os.makedirs(dict_dir, exist_ok=True)
+        with open(os.path.join(dict_dir, entry['file']), 'wb') as f:
+            f.write(d.as_bytes())
+        manifest['dicts'][str(d.dict_id())] = entry
+        manifest['current'] = d.dict_id()
+        tmp_path = os.path.join(dict_dir, _DICT_MANIFEST + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(dict_dir, _DICT_MANIFEST))
+        _dict_cache[(dict_dir, d.dict_id())] = d
+        _dict_current[dict_dir] = d.dict_id()
+    print(f"[zstd-dict] 已訓練字典 v{version} (dict_id={d.dict_id()}, {entry['size']/1024:.0f}KB, "
+          f"{len(samples)} 個樣本, 耗時 {time.time() - start:.2f}s)")
+    return entry
+
+def maybe_train_zstd_dictionary():
+    """啟用字典時：尚無字典或目前字典超過 ZSTD_DICTIONARY_RETRAIN_DAYS 天才重新訓練"""
+    if not getattr(settings, 'ZSTD_DICTIONARY_ENABLED', False) or not HAS_ZSTD:
+        return None
+    manifest = _read_dict_manifest(zstd_dictionary_dir())
+    current = manifest['dicts'].get(str(manifest.get('current') or 0))
+    if current:
+        try:
+            age_days = (datetime.now() - datetime.fromisoformat(current['created'])).days
+        except (KeyError, ValueError):
+            age_days = None
+        retrain_days = int(getattr(settings, 'ZSTD_DICTIONARY_RETRAIN_DAYS', 30))
+        if age_days is not None and (retrain_days <= 0 or age_days < retrain_days):
+            return None
+    return train_zstd_dictionary()
+
+# =========== 串流壓縮寫檔 ============
+def _open_compressed_writer(f, format_type, level=None):
+    """在已開啟的檔案上包一層串流壓縮（關閉時不關閉底層檔案）"""
+    if format_type == CompressionFormat.LZ4 and HAS_LZ4:
+        return lz4.frame.LZ4FrameFile(f, mode='wb', compression_level=level or settings.LZ4_COMPRESSION_LEVEL)
+    if format_type == CompressionFormat.ZSTD and HAS_ZSTD:
+        return _zstd_compressor(level or settings.ZSTD_COMPRESSION_LEVEL).stream_writer(f, closefd=False)
+    return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=level or settings.GZIP_COMPRESSION_LEVEL)
+
+def _iter_json_chunks(obj, depth=2):
+    """
+    逐段序列化：頂層與 cells 層的 dict 逐個鍵輸出，每張表各自 json.dumps 一次（仍用 C 編碼器），
+    整份工作簿的 JSON 字串不會同時存在於記憶體。輸出與 json.dumps(separators=(',', ':')) 相同。
+    """
+    if depth > 0 and isinstance(obj, dict):
+        yield '{'
+        first = True
+        for key, value in obj.items():
+            yield ('' if first else ',') + json.dumps(str(key), ensure_ascii=False) + ':'
+            first = False
+            yield from _iter_json_chunks(value, depth - 1)
+        yield '}'
+    else:
+        yield json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
 def save_compressed_file(filepath, data, format_type=None, level=None):
     """
-    保存壓縮檔案
+    保存壓縮檔案：逐段序列化並串流壓縮寫出（不先組出整份 JSON / 壓縮結果），先寫暫存檔再替換
     """
     if format_type is None:
         format_type = settings.DEFAULT_COMPRESSION_FORMAT
@@ -167,32 +386,26 @@ def save_compressed_file(filepath, data, format_type=None, level=None):
     # 驗證格式可用性
     format_type = CompressionFormat.validate_format(format_type)
     
-    # 準備數據
-    if isinstance(data, dict):
-        json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-    else:
-        json_data = str(data)
-    
-    # 添加時間戳
+    # 準備數據（dict 先加上時間戳與格式標記）
     if isinstance(data, dict):
         data_with_timestamp = data.copy()
         data_with_timestamp['timestamp'] = datetime.now().isoformat()
         data_with_timestamp['compression_format'] = format_type
-        json_data = json.dumps(data_with_timestamp, ensure_ascii=False, separators=(',', ':'))
-    
-    # 壓縮數據
-    compressed_data = compress_data(json_data, format_type, level)
+        chunks = _iter_json_chunks(data_with_timestamp)
+    else:
+        chunks = (str(data),)
     
     # 確定最終檔案路徑
     extension = CompressionFormat.get_extension(format_type)
     final_filepath = filepath + extension
     
-    # 🔥 移除這行 - 過於詳細的調試訊息
-    # print(f"[DEBUG] 保存壓縮檔案: {final_filepath}")
-    
     # 寫入檔案
-    with open(final_filepath, 'wb') as f:
-        f.write(compressed_data)
+    tmp_path = final_filepath + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        with _open_compressed_writer(f, format_type, level) as writer:
+            for chunk in chunks:
+                writer.write(chunk.encode('utf-8'))
+    os.replace(tmp_path, final_filepath)
     
     return final_filepath
 
@@ -244,8 +457,8 @@ def load_compressed_file(filepath):
     try:
         with open(latest_file, 'rb') as f:
             compressed_data = f.read()
-        json_data = decompress_data(compressed_data, format_type)
-        return json.loads(json_data)
+        # json.loads 直接接受 UTF-8 bytes，省去整份字串解碼的複本
+        return json.loads(decompress_bytes(compressed_data, format_type))
     except (FileNotFoundError, PermissionError, OSError) as e:
         logging.error(f"載入壓縮檔案失敗 {latest_file}: {e}")
         return None
@@ -267,6 +480,11 @@ def get_compression_stats(filepath):
     format_type = CompressionFormat.detect_format(filepath)
     file_size = os.path.getsize(filepath)
     
+    # 二進位基準線：原始大小記在檔頭，不需整檔解壓
+    from utils.baseline_format import is_binary_baseline, binary_baseline_stats
+    if is_binary_baseline(filepath):
+        return binary_baseline_stats(filepath)
+    
     try:
         with open(filepath, 'rb') as f:
             compressed_data = f.read()
@@ -10,6 +10,7 @@ import json
 from datetime import datetime
 from typing import Dict, Any, Optional
 import config.settings as settings
+from utils.cell_store import json_default
 
 try:
     from utils.helpers import _baseline_key_for_path
@@ -79,40 +80,17 @@ def compute_change_counters(old_cells: Dict[str, Dict[str, Any]], new_cells: Dic
     """
     計算事件統計計數：dvc/fci/xrlc/xru/addc/delc/total_changes
     與 Compare_Logic 定義一致。
+    已有本次事件的 compute_event_diff 結果時，直接用其 'counters'，不必再呼叫此函式。
     """
-    from core.comparison import classify_change_type
-    counters = {k: 0 for k in ['dvc','fci','xrlc','xru','addc','delc']}
-    total = 0
-    sheets = set((old_cells or {}).keys()) | set((new_cells or {}).keys())
-    for s in sheets:
-        a = (old_cells or {}).get(s, {})
-        b = (new_cells or {}).get(s, {})
-        addrs = set(a.keys()) | set(b.keys())
-        for addr in addrs:
-            oa = a.get(addr, {})
-            nb = b.get(addr, {})
-            if oa == nb:
-                continue
-            total += 1
-            t = classify_change_type(oa, nb,
-                                     show_external_refresh=True,
-                                     suppress_internal_same_value=False,
-                                     formula_only_mode=False)
-            if t == 'CELL_ADDED': counters['addc'] += 1
-            elif t == 'CELL_DELETED': counters['delc'] += 1
-            elif t == 'DIRECT_VALUE_CHANGE': counters['dvc'] += 1
-            elif t == 'FORMULA_CHANGE_INTERNAL': counters['fci'] += 1
-            elif t == 'EXTERNAL_REF_LINK_CHANGE': counters['xrlc'] += 1
-            elif t == 'EXTERNAL_REFRESH_UPDATE': counters['xru'] += 1
-            # 其他（INDIRECT/NO_CHANGE）不計入上述細項，但 total 仍計
-    counters['total_changes'] = total
-    return counters
+    from core.comparison import compute_event_diff
+    return compute_event_diff(old_cells, new_cells)['counters']
 
 
 def insert_event_index(file_path: str,
                         *,
                         old_cells: Dict[str, Dict[str, Any]] = None,
                         new_cells: Dict[str, Dict[str, Any]] = None,
+                        counters: Optional[Dict[str, int]] = None,
                         last_author: Optional[str] = None,
                         event_number: Optional[int] = None,
                         snapshot_path: Optional[str] = None,
@@ -121,13 +99,15 @@ def insert_event_index(file_path: str,
                         db_path: Optional[str] = None) -> None:
     """
     根據 counters 與路徑資訊，插入一筆事件索引到 SQLite。
+    counters 未提供時才由 old_cells/new_cells 重新計算。
     """
     try:
         from utils.helpers import _baseline_key_for_path
         from utils.events_db import insert_event as _insert, ensure_db
         base_key = _baseline_key_for_path(file_path)
         ensure_db(db_path)
-        counters = compute_change_counters(old_cells or {}, new_cells or {})
+        if counters is None:
+            counters = compute_change_counters(old_cells or {}, new_cells or {})
         # 檔案 stat
         try:
             excel_mtime = os.path.getmtime(file_path)
@@ -185,7 +165,7 @@ def sync_history_to_git_repo(file_path: str,
         out_name = f"{_now_stamp()}.cells.json"
         out_path = os.path.join(target_dir, out_name)
         with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+            json.dump(payload, f, ensure_ascii=False, indent=2, default=json_default)
         # 若已禁用 Git 整合，僅落地 JSON，不嘗試提交
         if getattr(settings, 'DISABLE_GIT_INTEGRATION', False):
             return out_path
@@ -34,6 +34,12 @@ def check_memory_limit():
     if current_memory > settings.MEMORY_LIMIT_MB:
         print(f"⚠️ 記憶體使用量過高: {current_memory:.1f} MB > {settings.MEMORY_LIMIT_MB} MB")
         print("   正在執行垃圾回收...")
+        # 先釋放解析結果快取，再回收
+        try:
+            from utils.parse_cache import clear_parse_cache
+            clear_parse_cache()
+        except Exception:
+            pass
         gc.collect()
         new_memory = get_memory_usage()
         print(f"   垃圾回收後: {new_memory:.1f} MB")
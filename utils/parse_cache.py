@@ -0,0 +1,160 @@
+"""
+解析結果快取（行程內 LRU）
+- key：(快取副本路徑, size, mtime_ns, 公式/值引擎設定)；副本內容一變 key 即變，不會拿到舊結果
+- 容量以估算位元組計，預算 = MEMORY_LIMIT_MB × PARSE_CACHE_MEMORY_RATIO，超出時淘汰最久未用
+- 返回的是共用物件，呼叫方不得原地修改
+"""
+import os
+import sys
+import threading
+import logging
+from collections import OrderedDict
+
+import config.settings as settings
+
+# 單格估算：dict 本體 + 4 個欄位 + 位址字串（CPython 64-bit 約略值）
+_CELL_OVERHEAD_BYTES = 420
+
+
+def _estimate_cells_bytes(cells_by_sheet):
+    """估算 { sheet: { addr: {formula, value, ...} } } 的記憶體佔用（不求精確，只求量級正確）"""
+    total = 0
+    try:
+        for ws in cells_by_sheet.values():
+            if hasattr(ws, 'nbytes'):
+                # 欄式存放（SheetCells）自帶精確佔用
+                total += ws.nbytes
+                continue
+            total += sys.getsizeof(ws)
+            for cell in ws.values():
+                total += _CELL_OVERHEAD_BYTES
+                f = cell.get('formula') if isinstance(cell, dict) else None
+                v = cell.get('value') if isinstance(cell, dict) else cell
+                if isinstance(f, str):
+                    total += len(f)
+                if isinstance(v, str):
+                    total += len(v)
+    except Exception:
+        pass
+    return total
+
+
+class ParseResultCache:
+    def __init__(self):
+        self._entries = OrderedDict()   # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def budget_bytes():
+        if not getattr(settings, 'PARSE_CACHE_ENABLED', True):
+            return 0
+        try:
+            ratio = float(getattr(settings, 'PARSE_CACHE_MEMORY_RATIO', 0.25) or 0)
+            return int(float(settings.MEMORY_LIMIT_MB) * ratio * 1024 * 1024)
+        except Exception:
+            return 0
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes=None):
+        if key is None or value is None:
+            return
+        budget = self.budget_bytes()
+        if nbytes is None:
+            nbytes = _estimate_cells_bytes(value) if isinstance(value, dict) else sys.getsizeof(value)
+        # 單一結果超過預算就不收，避免把其他條目全部擠掉
+        if budget <= 0 or nbytes > budget:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > budget and self._entries:
+                _, (_, nb) = self._entries.popitem(last=False)
+                self._bytes -= nb
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'budget_bytes': self.budget_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache = ParseResultCache()
+
+
+# 會改變解析結果的設定（皆可由設定 UI 於執行中修改）；任一變更後舊結果自然失效
+_OUTPUT_SETTINGS = (
+    ('FORMULA_ENGINE', 'openpyxl'),
+    ('VALUE_ENGINE', 'polars'),
+    ('ENABLE_FORMULA_VALUE_CHECK', False),
+    ('MAX_FORMULA_VALUE_CELLS', 50000),
+    ('ALWAYS_FETCH_VALUE_FOR_EXTERNAL_REFS', True),
+    ('EXTERNAL_REF_VALUE_FETCH_CAP', 0),
+)
+
+
+def make_parse_key(kind, local_path):
+    """
+    依快取副本的 stat 與影響輸出的設定組成 key；stat 失敗時返回 None（不走快取）
+    """
+    if not getattr(settings, 'PARSE_CACHE_ENABLED', True):
+        return None
+    try:
+        st = os.stat(local_path)
+    except OSError:
+        return None
+    return (
+        kind,
+        os.path.abspath(local_path),
+        st.st_size,
+        st.st_mtime_ns,
+    ) + tuple(getattr(settings, name, default) for name, default in _OUTPUT_SETTINGS)
+
+
+def get_cached(key):
+    return _cache.get(key)
+
+
+def put_cached(key, value, nbytes=None):
+    try:
+        _cache.put(key, value, nbytes)
+    except Exception as e:
+        logging.warning(f"解析快取寫入失敗: {e}")
+
+
+def clear_parse_cache():
+    _cache.clear()
+
+
+def get_parse_cache_stats():
+    return _cache.stats()
@@ -0,0 +1,264 @@
+"""
+輪詢排程器：單一派發執行緒 + 到期時間 heap，取代「每檔案每次輪詢一個 threading.Timer」
+
+- schedule(key, delay, fn)：同一 key 只保留最新一次排程（舊的 heap 項目到期時直接丟棄）
+- 到期工作交給有上限的執行緒池（POLLING_MAX_WORKERS），同時解析的活頁簿數量受控
+- 同一 key 的工作不會同時執行：到期時若前一次仍在執行，待其結束後立即接著執行（只保留最新一個）
+- stats() 返回排程/排隊/執行中數量，供 console 與日誌觀察積壓情況
+
+PriorityWorkQueue：檔案事件的比較工作佇列（watchdog observer 執行緒只負責放入，不做解析）
+- 以 key（檔案路徑）合併：同一檔案尚未開始的工作只保留一個（最新事件的工作與優先序）
+- 優先序小者先做；同一 key 執行中再有事件，待其結束後才取出（同一檔案不並行）
+"""
+import time
+import heapq
+import itertools
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import config.settings as settings
+
+
+class PollScheduler:
+    def __init__(self, max_workers=None, name='poll'):
+        self.name = name
+        self._max_workers = max_workers
+        self._heap = []                 # (到期 monotonic 時間, seq, key, fn)
+        self._seq = itertools.count()
+        self._tokens = {}               # key -> 最新排程的 seq；不符者視為已取消
+        self._cond = threading.Condition()
+        self._running = set()           # 已交給執行緒池（排隊中或執行中）的 key
+        self._deferred = {}             # key -> fn：等同 key 前一個工作結束後執行
+        self._queued = 0                # 已交給執行緒池、尚未開始執行
+        self._executor = None
+        self._thread = None
+        self._stopped = False
+        self._last_backlog_warn = 0.0
+
+    @property
+    def max_workers(self):
+        if self._max_workers is None:
+            self._max_workers = max(1, int(getattr(settings, 'POLLING_MAX_WORKERS', 2)))
+        return self._max_workers
+
+    def _ensure_started(self):
+        # 呼叫方需持有 self._cond；設定可能在 import 後才由設定 UI 覆寫，因此延後到第一次排程才建立
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f'{self.name}-worker')
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._dispatch_loop, name=f'{self.name}-dispatcher', daemon=True)
+            self._thread.start()
+
+    def schedule(self, key, delay, fn):
+        """delay 秒後執行 fn；同 key 之前尚未到期的排程會被取代"""
+        with self._cond:
+            if self._stopped:
+                return False
+            seq = next(self._seq)
+            self._tokens[key] = seq
+            heapq.heappush(self._heap, (time.monotonic() + max(0.0, float(delay)), seq, key, fn))
+            self._ensure_started()
+            self._cond.notify()
+            return True
+
+    def cancel(self, key):
+        with self._cond:
+            self._tokens.pop(key, None)
+            self._deferred.pop(key, None)
+
+    def is_scheduled(self, key):
+        with self._cond:
+            return key in self._tokens or key in self._running or key in self._deferred
+
+    def stats(self):
+        with self._cond:
+            return {
+                'scheduled': len(self._tokens),
+                'queued': self._queued,
+                'running': len(self._running) - self._queued,
+                'deferred': len(self._deferred),
+                'workers': self.max_workers,
+            }
+
+    @property
+    def queue_depth(self):
+        """已到期、等待工作執行緒的數量（含等同檔案前一次結束的）"""
+        with self._cond:
+            return self._queued + len(self._deferred)
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, seq, key, fn = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                if self._tokens.get(key) != seq:
+                    continue  # 已取消或已被較新的排程取代
+                del self._tokens[key]
+                self._submit(key, fn)
+
+    def _submit(self, key, fn):
+        # 呼叫方需持有 self._cond
+        if key in self._running:
+            self._deferred[key] = fn
+            return
+        self._running.add(key)
+        self._queued += 1
+        try:
+            self._executor.submit(self._run, key, fn)
+        except RuntimeError:
+            # 執行緒池已關閉（停止中）
+            self._running.discard(key)
+            self._queued -= 1
+            return
+        if self._queued > self.max_workers and time.monotonic() - self._last_backlog_warn > 30:
+            self._last_backlog_warn = time.monotonic()
+            logging.warning(f"[{self.name}] 工作積壓：排隊 {self._queued}，執行緒 {self.max_workers}，"
+                            f"等待排程 {len(self._tokens)}")
+
+    def _run(self, key, fn):
+        with self._cond:
+            self._queued -= 1
+        try:
+            fn()
+        except Exception as e:
+            logging.error(f"[{self.name}] 排程工作失敗 {key}: {e}")
+        finally:
+            with self._cond:
+                self._running.discard(key)
+                nxt = self._deferred.pop(key, None)
+                if nxt is not None and not self._stopped:
+                    self._submit(key, nxt)
+
+    def stop(self):
+        """停止派發並丟棄所有尚未開始的工作；執行中的工作不強制中斷"""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._tokens.clear()
+            self._deferred.clear()
+            self._cond.notify_all()
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PriorityWorkQueue:
+    def __init__(self, max_workers=None, name='compare', workers_setting='COMPARE_WORKERS'):
+        self.name = name
+        self._max_workers = max_workers
+        self._workers_setting = workers_setting
+        self._heap = []                 # (priority, seq, key)
+        self._seq = itertools.count()
+        self._pending = {}              # key -> (seq, fn)；heap 中 seq 不符者為已被合併的舊項目
+        self._waiting = {}              # key -> (priority, fn)：同 key 執行中時到達的工作
+        self._running = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+        self.coalesced = 0              # 被合併掉的重複事件數
+
+    @property
+    def max_workers(self):
+        if self._max_workers is None:
+            self._max_workers = max(1, int(getattr(settings, self._workers_setting, 2)))
+        return self._max_workers
+
+    def _ensure_started(self):
+        # 呼叫方需持有 self._cond
+        self._threads = [t for t in self._threads if t.is_alive()]
+        for i in range(len(self._threads), self.max_workers):
+            t = threading.Thread(target=self._worker_loop, name=f'{self.name}-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def put(self, key, fn, priority=0):
+        """放入工作（不阻塞）；同 key 已有未開始的工作時合併為一個。返回 True 表示是新工作、False 表示被合併"""
+        with self._cond:
+            if self._stopped:
+                return False
+            if key in self._running:
+                merged = key in self._waiting
+                self._waiting[key] = (priority, fn)
+                if merged:
+                    self.coalesced += 1
+                return not merged
+            merged = key in self._pending
+            self._push(key, fn, priority)
+            if merged:
+                self.coalesced += 1
+            self._ensure_started()
+            self._cond.notify()
+            return not merged
+
+    def _push(self, key, fn, priority):
+        # 呼叫方需持有 self._cond
+        seq = next(self._seq)
+        self._pending[key] = (seq, fn)
+        heapq.heappush(self._heap, (priority, seq, key))
+
+    def _take(self):
+        # 呼叫方需持有 self._cond；取出優先序最高且仍有效的工作
+        while self._heap:
+            _priority, seq, key = heapq.heappop(self._heap)
+            entry = self._pending.get(key)
+            if entry is None or entry[0] != seq:
+                continue
+            del self._pending[key]
+            self._running.add(key)
+            return key, entry[1]
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopped:
+                    job = self._take()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            key, fn = job
+            try:
+                fn()
+            except Exception as e:
+                logging.error(f"[{self.name}] 工作失敗 {key}: {e}")
+            finally:
+                with self._cond:
+                    self._running.discard(key)
+                    waiting = self._waiting.pop(key, None)
+                    if waiting is not None and not self._stopped:
+                        self._push(key, waiting[1], waiting[0])
+                        self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending) + len(self._waiting),
+                'running': len(self._running),
+                'coalesced': self.coalesced,
+                'workers': self.max_workers,
+            }
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending) + len(self._waiting)
+
+    def stop(self):
+        """丟棄所有未開始的工作並讓工作執行緒在目前工作結束後退出"""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._pending.clear()
+            self._waiting.clear()
+            self._cond.notify_all()
@@ -0,0 +1,171 @@
+"""
+檔案 stat 快取（每個「tick」共用一次目錄掃描）
+- 以 os.scandir 掃描檔案所在目錄一次，同一 tick（STAT_CACHE_TTL_SEC）內該目錄所有檔案的
+  存在判斷（如 ~$ 鎖檔）與 stat 都由這次掃描提供；Windows/SMB 上 DirEntry.stat() 直接取自目錄列表，不再額外往返
+- 輪詢、copy_to_cache 與 quick-skip 共用，避免同一 tick 對同一檔案分別 getmtime/getsize/exists
+- 目錄項目超過 STAT_CACHE_MAX_DIR_ENTRIES 時該目錄改為逐檔 os.stat（同樣按 tick 快取）
+- fresh=True 強制重新掃描（穩定性檢查等需要最新 mtime 的地方），結果同樣回填給其他呼叫方
+"""
+import os
+import time
+import threading
+
+import config.settings as settings
+
+# 目錄過大時，多久內不再嘗試整目錄掃描（秒）
+_LARGE_DIR_RETRY_SEC = 60.0
+
+
+def _split(path):
+    full = os.path.normcase(os.path.abspath(path))
+    return os.path.dirname(full), os.path.basename(full), full
+
+
+class StatCache:
+    def __init__(self):
+        self._dirs = {}         # 目錄 -> (掃描時間, {normcase 檔名: DirEntry} 或 None=目錄過大/無法掃描)
+        self._paths = {}        # 完整路徑 -> (stat 時間, stat_result 或 None)；只用於無法整目錄掃描的目錄
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.scans = 0
+        self.stats_calls = 0
+
+    @staticmethod
+    def ttl():
+        try:
+            return float(getattr(settings, 'STAT_CACHE_TTL_SEC', 1.0) or 0)
+        except Exception:
+            return 0.0
+
+    def _scan(self, dirpath):
+        limit = int(getattr(settings, 'STAT_CACHE_MAX_DIR_ENTRIES', 5000) or 0)
+        entries = {}
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    entries[os.path.normcase(entry.name)] = entry
+                    if limit and len(entries) > limit:
+                        return None
+        except OSError:
+            return None
+        return entries
+
+    def _dir_entries(self, dirpath, fresh, now, ttl):
+        with self._lock:
+            cached = self._dirs.get(dirpath)
+        if cached is not None:
+            scanned_at, entries = cached
+            if entries is None and now - scanned_at < _LARGE_DIR_RETRY_SEC:
+                return None
+            if entries is not None and not fresh and now - scanned_at <= ttl:
+                with self._lock:
+                    self.hits += 1
+                return entries
+        entries = self._scan(dirpath)
+        with self._lock:
+            self.scans += 1
+            self._dirs[dirpath] = (now, entries)
+            if len(self._dirs) > 1024:
+                self._prune(now, ttl)
+        return entries
+
+    def _prune(self, now, ttl):
+        # 呼叫方需持有 self._lock
+        keep = max(ttl * 10, _LARGE_DIR_RETRY_SEC)
+        for d in [d for d, (t, _) in self._dirs.items() if now - t > keep]:
+            del self._dirs[d]
+        for p in [p for p, (t, _) in self._paths.items() if now - t > keep]:
+            del self._paths[p]
+
+    def stat(self, path, fresh=False):
+        """返回 os.stat_result；檔案不存在或無法存取時返回 None"""
+        ttl = self.ttl()
+        if ttl <= 0:
+            return _os_stat(path)
+        dirpath, name, full = _split(path)
+        now = time.monotonic()
+        entries = self._dir_entries(dirpath, fresh, now, ttl)
+        if entries is not None:
+            entry = entries.get(name)
+            if entry is None:
+                return None
+            try:
+                # DirEntry 會保留第一次 stat 的結果，同一 tick 的重覆查詢不再往返
+                return entry.stat()
+            except OSError:
+                return None
+        with self._lock:
+            cached = self._paths.get(full)
+        if cached is not None and not fresh and now - cached[0] <= ttl:
+            with self._lock:
+                self.hits += 1
+            return cached[1]
+        st = _os_stat(path)
+        with self._lock:
+            self.stats_calls += 1
+            self._paths[full] = (now, st)
+        return st
+
+    def invalidate(self, path=None):
+        """丟棄 path 所在目錄（None = 全部）的快取；本程式自己改動了檔案時使用"""
+        with self._lock:
+            if path is None:
+                self._dirs.clear()
+                self._paths.clear()
+                return
+            dirpath, _name, full = _split(path)
+            self._dirs.pop(dirpath, None)
+            self._paths.pop(full, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'dirs': len(self._dirs),
+                'paths': len(self._paths),
+                'hits': self.hits,
+                'scans': self.scans,
+                'stat_calls': self.stats_calls,
+            }
+
+
+def _os_stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+_cache = StatCache()
+
+
+def stat_path(path, fresh=False):
+    """本 tick 的 os.stat_result（不存在時為 None）"""
+    return _cache.stat(path, fresh=fresh)
+
+
+def path_exists(path):
+    return _cache.stat(path) is not None
+
+
+def get_mtime(path, fresh=False):
+    """同 os.path.getmtime，但取自 stat 快取；不存在時拋出 FileNotFoundError"""
+    st = _cache.stat(path, fresh=fresh)
+    if st is None:
+        raise FileNotFoundError(path)
+    return st.st_mtime
+
+
+def get_size(path):
+    """同 os.path.getsize，但取自 stat 快取；不存在時拋出 FileNotFoundError"""
+    st = _cache.stat(path)
+    if st is None:
+        raise FileNotFoundError(path)
+    return st.st_size
+
+
+def invalidate_stat_cache(path=None):
+    _cache.invalidate(path)
+
+
+def get_stat_cache_stats():
+    return _cache.stats()
@@ -0,0 +1,23 @@
+from typing import List
+
+# 欄號 -> 欄字母查表（1 -> 'A'，28 -> 'AB'）；表格按需增長，全程只計算一次。
+# 供 polars/pandas 值引擎在寬表轉長表時直接以欄索引查出字母，避免逐格 divmod。
+
+_MAX_COL = 16384
+_letters: List[str] = []
+
+
+def _col_to_letters(n: int) -> str:
+    s = ''
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def column_letters(width: int) -> List[str]:
+    """返回前 width 欄的字母列表 ['A', 'B', ...]（width 上限為 Excel 的 16384 欄）"""
+    width = max(0, min(int(width), _MAX_COL))
+    if len(_letters) < width:
+        _letters.extend(_col_to_letters(i) for i in range(len(_letters) + 1, width + 1))
+    return _letters[:width]
@@ -4,6 +4,8 @@ import subprocess
 import sys
 import os
 
+from utils.value_engines.addressing import column_letters
+
 # Pandas-based value reader via xlsx2csv -> CSV in-memory (fallback-friendly)
 
 def _xlsx2csv_to_bytes(xlsx_path: str, sheet_count: int | None = None) -> Dict[str, bytes]:
@@ -42,7 +44,34 @@ def _xlsx2csv_to_bytes(xlsx_path: str, sheet_count: int | None = None) -> Dict[s
     return sheets
 
 
-def read_values_from_xlsx_via_pandas(xlsx_path: str, persist_csv: bool=False, persist_dir: Optional[str]=None, sheet_count: int | None = None) -> Dict[str, Dict[str, Optional[str]]]:
+def _melt_sheet(pd, df):
+    """
+    寬表 -> 長表 (address, value)：欄名換成欄字母後按 dtype 分組 melt（同組型別一致），
+    dropna 與空字串過濾後，位址 = 欄字母 + 行號；整張表只做向量化運算。
+    """
+    letters = column_letters(df.shape[1])
+    df = df.set_axis(letters, axis=1)
+    df = df.reset_index(drop=True)
+    parts = []
+    for _, cols in df.columns.to_series().groupby(df.dtypes.astype(str)):
+        # ignore_index=False：保留原列索引（0 起算）作為行號來源
+        long = df[list(cols)].melt(var_name='__col', value_name='value', ignore_index=False).dropna(subset=['value'])
+        if long.empty:
+            continue
+        if not pd.api.types.is_numeric_dtype(long['value']):
+            long = long[long['value'] != '']
+        rows = (long.index.to_series(index=long.index) + 1).astype(str)
+        parts.append(pd.DataFrame({'address': long['__col'] + rows, 'value': long['value']}).reset_index(drop=True))
+    if not parts:
+        return pd.DataFrame({'address': [], 'value': []})
+    return pd.concat(parts, ignore_index=True)
+
+
+def read_values_from_xlsx_via_pandas(xlsx_path: str, persist_csv: bool=False, persist_dir: Optional[str]=None, sheet_count: int | None = None, as_frame: bool = False) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Returns: { sheet_name: { 'A1': value, ... }, ... }
+    as_frame=True returns { sheet_name: pd.DataFrame(address, value) } for callers that work on columns directly.
+    """
     import pandas as pd
     try:
         from utils.helpers import _baseline_key_for_path
@@ -51,46 +80,29 @@ def read_values_from_xlsx_via_pandas(xlsx_path: str, persist_csv: bool=False, pe
 
     out: Dict[str, Dict[str, Optional[str]]] = {}
     sheets = _xlsx2csv_to_bytes(xlsx_path, sheet_count=sheet_count)
-    combined_rows = []  # (sheet, address, value)
-
-    def col_to_letters(n: int) -> str:
-        s = ''
-        while n > 0:
-            n, r = divmod(n-1, 26)
-            s = chr(65 + r) + s
-        return s
+    combined = []  # 每張表的 (sheet, address, value) 長表
 
     for name, csv_bytes in (sheets or {}).items():
         try:
             df = pd.read_csv(BytesIO(csv_bytes), header=None)
             if df.shape[0] == 0 or df.shape[1] == 0:
-                out[name] = {}
+                out[name] = pd.DataFrame({'address': [], 'value': []}) if as_frame else {}
                 continue
-            vals: Dict[str, Optional[str]] = {}
-            for r in range(df.shape[0]):
-                row = df.iloc[r]
-                for c in range(len(row)):
-                    v = row.iloc[c]
-                    if pd.isna(v) or (isinstance(v, str) and v == ''):
-                        continue
-                    addr = f"{col_to_letters(c+1)}{r+1}"
-                    vals[addr] = v
-                    combined_rows.append((name, addr, '' if v is None else str(v)))
-            out[name] = vals
+            long = _melt_sheet(pd, df)
+            # tolist() 轉回 Python 原生型別（int/float/str）
+            out[name] = long if as_frame else dict(zip(long['address'].tolist(), long['value'].tolist()))
+            if persist_csv and persist_dir and not long.empty:
+                combined.append(long.assign(sheet=name))
         except Exception:
             out[name] = {}
 
-    if persist_csv and persist_dir and combined_rows:
+    if persist_csv and persist_dir and combined:
         try:
             base_key = _baseline_key_for_path(xlsx_path)
             values_dir = os.path.join(persist_dir, 'values')
             os.makedirs(values_dir, exist_ok=True)
             out_path = os.path.join(values_dir, f"{base_key}.values.csv")
-            with open(out_path, 'w', encoding='utf-8', newline='') as f:
-                f.write('sheet,address,value\n')
-                for sheet, addr, val in combined_rows:
-                    v = '' if val is None else str(val).replace('"','""')
-                    f.write(f'"{sheet}","{addr}","{v}"\n')
+            pd.concat(combined, ignore_index=True)[['sheet', 'address', 'value']].to_csv(out_path, index=False, encoding='utf-8')
         except Exception:
             pass
 
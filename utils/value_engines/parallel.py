@@ -0,0 +1,147 @@
+import os
+import atexit
+import logging
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+import config.settings as settings
+
+# 以 ProcessPoolExecutor 將 worksheet XML 解析分派到多個行程（一張表一個 task），繞過 GIL。
+# - 行程池為模組層級、跨活頁簿重用，避免每個檔案都付出行程啟動成本（Windows spawn 尤其昂貴）
+# - 任務函式必須是模組層級函式（可 pickle）；池失效時返回 None，由呼叫方回退單行程
+# - 多個執行緒（基準線/比較/輪詢工作執行緒）共用同一個池：只有 BrokenProcessPool 才丟棄池；
+#   池重建（設定變更或失效）以世代號區分，舊池在背景 shutdown(wait=True) 排空，不取消其他執行緒已提交的任務
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_generation = 0
+_pool_lock = threading.Lock()
+
+# 行程內的 sharedStrings 快取：同一活頁簿的多張表（以及主行程內先後執行的值/公式引擎）共用一份，只保留最近一本
+# 主行程內有多個工作執行緒（基準線/比較/輪詢）同時讀不同活頁簿：(key, sst) 以單一 tuple 在鎖內讀寫，
+# 載入後一律返回本次載入的物件，不再回讀全局（避免 key=B 卻拿到 A 的字串表）
+_worker_sst: Optional[Tuple[tuple, object]] = None
+_worker_sst_lock = threading.Lock()
+
+
+def _configured_workers() -> int:
+    try:
+        cap = int(getattr(settings, 'MAX_SHEET_WORKERS', 1) or 1)
+    except Exception:
+        cap = 1
+    return max(1, min(cap, os.cpu_count() or 1))
+
+
+def resolve_sheet_workers(z: zipfile.ZipFile, parts: List[Tuple[str, str]]) -> int:
+    """
+    依 MAX_SHEET_WORKERS、CPU 數、工作表數與未壓縮 XML 總量決定並發數；小檔案維持單行程。
+    """
+    cap = min(_configured_workers(), len(parts))
+    if cap <= 1:
+        return 1
+    try:
+        min_mb = float(getattr(settings, 'PARALLEL_SHEET_MIN_MB', 8) or 0)
+        total = sum(z.getinfo(part).file_size for _, part in parts)
+        if total < min_mb * 1024 * 1024:
+            return 1
+    except Exception:
+        return 1
+    return cap
+
+
+def _retire_pool(pool: ProcessPoolExecutor) -> None:
+    # 已提交的任務照常完成後才關閉；在背景執行緒等待，不阻塞呼叫方
+    def _drain():
+        try:
+            pool.shutdown(wait=True)
+        except Exception:
+            pass
+    threading.Thread(target=_drain, name='sheet-pool-retire', daemon=True).start()
+
+
+def _get_pool() -> Tuple[ProcessPoolExecutor, int]:
+    # 池大小固定為設定值；單本活頁簿的任務數少於池大小時由池自行排程。返回 (池, 世代號)
+    global _pool, _pool_workers, _pool_generation
+    workers = _configured_workers()
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            old = _pool
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+            _pool_generation += 1
+            if old is not None:
+                _retire_pool(old)
+        return _pool, _pool_generation
+
+
+def _discard_pool(generation: int) -> None:
+    # 只丟棄失效的那一代；其他執行緒已換上新池時不動
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_generation != generation:
+            return
+        old = _pool
+        _pool = None
+        _pool_workers = 0
+    _retire_pool(old)
+
+
+def shutdown_sheet_pool() -> None:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            try:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            except Exception:
+                pass
+        _pool = None
+        _pool_workers = 0
+
+
+atexit.register(shutdown_sheet_pool)
+
+
+def map_sheet_parts(task: Callable, xlsx_path: str, parts: List[Tuple[str, str]], *args) -> Optional[Dict[str, object]]:
+    """
+    並發執行 task(xlsx_path, part, *args)，按 workbook 順序合併為 { sheet_name: result }。
+    任何失敗（BrokenProcessPool、pickle 失敗、任務例外等）返回 None；只有池本身失效才丟棄池。
+    """
+    generation = None
+    try:
+        pool, generation = _get_pool()
+        futures = [(name, pool.submit(task, xlsx_path, part, *args)) for name, part in parts]
+        return {name: fut.result() for name, fut in futures}
+    except BrokenProcessPool as e:
+        logging.warning(f"工作表並發解析的行程池失效，回退單行程: {e}")
+        if generation is not None:
+            _discard_pool(generation)
+        return None
+    except Exception as e:
+        logging.warning(f"工作表並發解析失敗，回退單行程: {e}")
+        return None
+
+
+def worker_shared_strings(xlsx_path: str, loader: Callable):
+    """
+    行程內取得 sharedStrings：以 (path, mtime, size) 為 key 快取最近一本活頁簿。
+    工作行程與主行程皆可用；同一事件中多個引擎讀同一副本時只載入一次。
+    """
+    global _worker_sst
+    try:
+        st = os.stat(xlsx_path)
+        key = (xlsx_path, st.st_mtime, st.st_size)
+    except OSError:
+        key = (xlsx_path, None, None)
+    with _worker_sst_lock:
+        cached = _worker_sst
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    # 在鎖外載入：不同活頁簿的執行緒不互相等待
+    with zipfile.ZipFile(xlsx_path, 'r') as z:
+        sst = loader(z)
+    with _worker_sst_lock:
+        _worker_sst = (key, sst)
+    return sst
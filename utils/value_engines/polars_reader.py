@@ -1,14 +1,61 @@
 from typing import Dict, Optional
-from io import BytesIO
+from io import BytesIO, StringIO
 import subprocess
 import sys
 import os
 
+from utils.value_engines.addressing import column_letters
+
 # Polars-based value reader via xlsx2csv -> CSV in-memory
 
+def _xlsx2csv_in_process(xlsx_path: str) -> Optional[Dict[str, bytes]]:
+    """
+    Convert each worksheet to CSV bytes by calling xlsx2csv in-process:
+    the zip / sharedStrings / styles are opened once for the whole workbook,
+    with no interpreter start-up per sheet. Sheet names come from workbook.xml.
+    Returns None when xlsx2csv cannot be imported (caller falls back to the subprocess path).
+    """
+    try:
+        from xlsx2csv import Xlsx2csv
+    except ImportError:
+        return None
+    sheets: Dict[str, bytes] = {}
+    conv = Xlsx2csv(xlsx_path, outputencoding='utf-8')
+    try:
+        for s in conv.workbook.sheets:
+            buf = StringIO()
+            try:
+                conv.convert(buf, sheetid=s['index'])
+            except Exception as e:
+                # chartsheet 等無法轉換的部件略過（與子程序 rc!=0 時一致）
+                print(f"   [polars-xlsx2csv] convert sheet#{s['index']} name='{s['name']}' err={str(e)[:200]}")
+                continue
+            sheets[s['name']] = buf.getvalue().encode('utf-8')
+    finally:
+        try:
+            conv.close()
+        except Exception:
+            pass
+    return sheets
+
+
 def _xlsx2csv_to_bytes(xlsx_path: str, sheet_count: int | None = None) -> Dict[str, bytes]:
     """
-    Convert each worksheet to CSV bytes via xlsx2csv.
+    Convert each worksheet to CSV bytes via xlsx2csv (in-process first, subprocess as fallback).
+    Returns: { sheet_name: csv_bytes }
+    """
+    try:
+        sheets = _xlsx2csv_in_process(xlsx_path)
+        if sheets is not None:
+            return sheets
+    except Exception as e:
+        print(f"   [polars-xlsx2csv] in-process failed, using subprocess: {e}")
+    return _xlsx2csv_to_bytes_subprocess(xlsx_path, sheet_count=sheet_count)
+
+
+def _xlsx2csv_to_bytes_subprocess(xlsx_path: str, sheet_count: int | None = None) -> Dict[str, bytes]:
+    """
+    Convert each worksheet to CSV bytes via `python -m xlsx2csv` subprocesses.
     Returns: { sheet_name: csv_bytes }
     Prints diagnostic info (rc/stdout/stderr) for troubleshooting.
     """
@@ -53,10 +100,42 @@ def _xlsx2csv_to_bytes(xlsx_path: str, sheet_count: int | None = None) -> Dict[s
     return sheets
 
 
-def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, persist_dir: Optional[str]=None, sheet_count: int | None = None) -> Dict[str, Dict[str, Optional[str]]]:
+def _unpivot_sheet(pl, df):
+    """
+    寬表 -> 長表 (address, value)：欄名換成欄字母後按 dtype 分組 unpivot（同組型別一致，保留原型別），
+    過濾 null 與空字串，位址 = 欄字母 + 行號；整張表只做向量化運算。
+    返回 [(dtype, long_df), ...]，每組 long_df 欄位為 address, value。
+    """
+    letters = column_letters(df.width)
+    df = df.rename(dict(zip(df.columns, letters)))
+    df = df.with_row_index('__row', offset=1) if hasattr(df, 'with_row_index') else df.with_row_count('__row', offset=1)
+    groups: Dict[object, list] = {}
+    for name, dtype in zip(letters, df.dtypes[1:]):
+        groups.setdefault(dtype, []).append(name)
+    out = []
+    for dtype, cols in groups.items():
+        if hasattr(df, 'unpivot'):
+            long = df.select(['__row'] + cols).unpivot(index='__row', on=cols, variable_name='__col', value_name='value')
+        else:
+            long = df.select(['__row'] + cols).melt(id_vars='__row', value_vars=cols, variable_name='__col', value_name='value')
+        keep = pl.col('value').is_not_null()
+        if dtype == pl.Utf8:
+            keep = keep & (pl.col('value') != '')  # skip blanks to align with openpyxl behaviour
+        long = long.filter(keep).select(
+            pl.concat_str([pl.col('__col'), pl.col('__row').cast(pl.Utf8)]).alias('address'),
+            pl.col('value'),
+        )
+        if long.height:
+            out.append((dtype, long))
+    return out
+
+
+def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, persist_dir: Optional[str]=None, sheet_count: int | None = None, as_frame: bool = False) -> Dict[str, Dict[str, Optional[str]]]:
     """
     Read display values using xlsx2csv + polars.
     Returns: { sheet_name: { 'A1': value, ... }, ... }
+    as_frame=True returns { sheet_name: pl.DataFrame(address, value) } instead (values cast to a common supertype),
+    for callers that can work on columns directly.
     If persist_csv=True and persist_dir provided, save ONE combined CSV per workbook at:
       <persist_dir>/values/<baseline_key>.values.csv
     CSV columns: sheet,address,value
@@ -69,52 +148,37 @@ def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, pe
 
     out: Dict[str, Dict[str, Optional[str]]] = {}
     sheets = _xlsx2csv_to_bytes(xlsx_path, sheet_count=sheet_count)
-    combined_rows = []  # (sheet, address, value)
+    long_frames = []  # 每張表的 (sheet, address, value) 長表，供合併 CSV
     for name, csv_bytes in (sheets or {}).items():
         try:
             # Read CSV into Polars (in-memory)
             df = pl.read_csv(BytesIO(csv_bytes), has_header=False)
             if df.height == 0 or df.width == 0:
-                out[name] = {}
+                out[name] = pl.DataFrame({'address': [], 'value': []}, schema={'address': pl.Utf8, 'value': pl.Utf8}) if as_frame else {}
                 continue
-            # wide -> long with addresses
-            # rows: 1..N ; cols: 1..M -> address like A1, B2
-            def col_to_letters(n: int) -> str:
-                s = ''
-                while n > 0:
-                    n, r = divmod(n-1, 26)
-                    s = chr(65 + r) + s
-                return s
-            long_rows = []
-            for r in range(df.height):
-                row = df.row(r)
-                for c in range(len(row)):
-                    v = row[c]
-                    if v is None or (isinstance(v, str) and v == ''):
-                        continue  # skip blanks to align with openpyxl behaviour
-                    addr = f"{col_to_letters(c+1)}{r+1}"
+            groups = _unpivot_sheet(pl, df)
+            if as_frame:
+                out[name] = pl.concat([g for _, g in groups], how='vertical_relaxed') if groups else \
+                    pl.DataFrame({'address': [], 'value': []}, schema={'address': pl.Utf8, 'value': pl.Utf8})
+            else:
+                vals: Dict[str, Optional[str]] = {}
+                for _, g in groups:
                     # 保留原型別避免假差異
-                    sval = v
-                    long_rows.append((addr, sval))
-                    # 合併 CSV 需字串化
-                    csv_v = '' if v is None else str(v).replace('"','""')
-                    combined_rows.append((name, addr, csv_v))
-            out[name] = {addr: val for addr, val in long_rows}
+                    vals.update(zip(g.get_column('address').to_list(), g.get_column('value').to_list()))
+                out[name] = vals
+            if persist_csv and persist_dir:
+                for _, g in groups:
+                    long_frames.append(g.select(pl.lit(name).alias('sheet'), 'address', pl.col('value').cast(pl.Utf8)))
         except Exception:
             out[name] = {}
     # Persist ONE combined CSV if requested
-    if persist_csv and persist_dir and combined_rows:
+    if persist_csv and persist_dir and long_frames:
         try:
             base_key = _baseline_key_for_path(xlsx_path)
             values_dir = os.path.join(persist_dir, 'values')
             os.makedirs(values_dir, exist_ok=True)
             out_path = os.path.join(values_dir, f"{base_key}.values.csv")
-            with open(out_path, 'w', encoding='utf-8', newline='') as f:
-                f.write('sheet,address,value\n')
-                for sheet, addr, val in combined_rows:
-                    # escape quotes and commas if necessary (basic CSV)
-                    v = '' if val is None else str(val).replace('"','""')
-                    f.write(f'"{sheet}","{addr}","{v}"\n')
+            pl.concat(long_frames).write_csv(out_path)
         except Exception:
             pass
     return out
@@ -0,0 +1,86 @@
+import zlib
+import zipfile
+import xml.etree.ElementTree as ET
+from array import array
+
+# sharedStrings 精簡儲存：以 iterparse 串流讀取 sharedStrings.xml，
+# 全部字串以 UTF-8 串接在一個 bytearray（每筆以 \x00 結尾，XML 不允許 NUL 所以不會衝突），
+# 另以 array('I') 記錄起點偏移；只有 cell 真的引用到某個索引時才解碼成 str。
+# 50 萬筆以上的 SST 不再一次建出整棵 DOM 與 list[str]，RSS 峰值大幅下降。
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_TAG_SI = f'{{{NS_MAIN}}}si'
+_TAG_T = f'{{{NS_MAIN}}}t'
+_SST_PART = 'xl/sharedStrings.xml'
+
+
+class SharedStrings:
+    """
+    唯讀、可索引的 sharedStrings 表；介面與 list[str] 相容（len()、sst[i]、sst[:n]）。
+    """
+    __slots__ = ('_buf', '_offsets')
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._offsets = array('I', [0])
+
+    def _append(self, text: str) -> None:
+        self._buf += text.encode('utf-8', 'surrogatepass')
+        self._buf += b'\x00'
+        end = len(self._buf)
+        if end > 0xFFFFFFFF and self._offsets.typecode == 'I':
+            # 超過 4GB 才升級為 64-bit 偏移
+            self._offsets = array('Q', self._offsets)
+        self._offsets.append(end)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        n = len(self)
+        if idx < 0:
+            idx += n
+        if idx < 0 or idx >= n:
+            raise IndexError('shared string index out of range')
+        return self._buf[self._offsets[idx]:self._offsets[idx + 1] - 1].decode('utf-8', 'surrogatepass')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def prefix_crc(self, n: int) -> int:
+        """前 n 筆字串（含 \\x00 結尾）的 CRC32，直接對緩衝區計算，不解碼"""
+        n = max(0, min(n, len(self)))
+        return zlib.crc32(memoryview(self._buf)[:self._offsets[n]])
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buf) + self._offsets.itemsize * len(self._offsets)
+
+
+def load_shared_strings(z: zipfile.ZipFile) -> SharedStrings:
+    """
+    串流讀取 sharedStrings.xml：每個 <si> 取其所有 <t>（含富文本 r/t）串接，處理完即從樹上清除。
+    解析中途失敗時保留已讀取的部分（與舊 list 版本一致）。
+    """
+    sst = SharedStrings()
+    try:
+        if _SST_PART not in z.namelist():
+            return sst
+        with z.open(_SST_PART) as stream:
+            root = None
+            for event, elem in ET.iterparse(stream, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    continue
+                if elem.tag != _TAG_SI:
+                    continue
+                sst._append(''.join((t.text or '') for t in elem.iter(_TAG_T)))
+                elem.clear()
+                root.clear()
+    except Exception:
+        pass
+    return sst
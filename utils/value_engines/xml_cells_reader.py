@@ -0,0 +1,416 @@
+import re
+import zlib
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.value_engines.polars_xml_reader import _load_shared_strings
+from utils.value_engines.parallel import map_sheet_parts, resolve_sheet_workers, worker_shared_strings
+
+# 單次串流（iterparse）讀取每個 worksheet XML，同時取得公式與 cached 值。
+# 只輸出實際存在於 XML 的 <c> 元素（不走 max_row x max_column 的矩形範圍）。
+# 返回結構：{ sheet_name: { 'A1': {formula, value, cached_value, external_ref}, ... } }
+# 成員清單（zip_members）：記錄每個 sheetN.xml 的 CRC32，下次只解析 CRC 有變的工作表，其餘沿用 baseline。
+
+# 成員清單格式版本；解析語意（prettify、值語意）有變時遞增，使舊清單全部失效
+ZIP_MEMBERS_VERSION = 1
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_TAG_C = f'{{{NS_MAIN}}}c'
+_TAG_F = f'{{{NS_MAIN}}}f'
+_TAG_V = f'{{{NS_MAIN}}}v'
+_TAG_IS = f'{{{NS_MAIN}}}is'
+_TAG_T = f'{{{NS_MAIN}}}t'
+_TAG_ROW = f'{{{NS_MAIN}}}row'
+_TAG_SHEETDATA = f'{{{NS_MAIN}}}sheetData'
+
+# 公式 token：字串常值、引號工作表名、[...] 區段（外部檔索引/結構化參照）不做位移
+_FORMULA_TOKEN_RE = re.compile(
+    r'"(?:[^"]|"")*"'                                   # 字串常值
+    r"|'(?:[^']|'')*'"                                  # 引號工作表名
+    r'|\[[^\]]*\]'                                      # [1] 或 Table[Col]
+    r'|(?<![A-Za-z0-9_.$])(\$?)([A-Za-z]{1,3})(\$?)(\d+)(?![A-Za-z0-9_(!])'   # A1 / $A$1
+    r'|(?<![A-Za-z0-9_.$])(\$?)([A-Za-z]{1,3}):(\$?)([A-Za-z]{1,3})(?![A-Za-z0-9_(!])'  # A:C
+    r'|(?<![A-Za-z0-9_.$:])(\$?)(\d+):(\$?)(\d+)(?![A-Za-z0-9_(!:.])'  # 1:3
+)
+
+_MAX_ROW = 1048576
+_MAX_COL = 16384
+
+
+def _col_letters_to_index(s: str) -> int:
+    n = 0
+    for ch in s.upper():
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def _col_index_to_letters(n: int) -> str:
+    s = ''
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def _split_ref(addr: str) -> Tuple[int, int]:
+    # 'AB12' -> (row=12, col=28)
+    i = 0
+    while i < len(addr) and addr[i].isalpha():
+        i += 1
+    return int(addr[i:] or 0), _col_letters_to_index(addr[:i])
+
+
+def shift_formula(formula: str, drow: int, dcol: int) -> str:
+    """
+    將 shared formula 的 master 公式平移到 follower 位置（相對參照位移，$ 絕對參照不變）。
+    行為對齊 openpyxl Translator：超出工作表邊界時以 #REF! 取代。
+    """
+    if not formula or (drow == 0 and dcol == 0):
+        return formula
+
+    def _shift_col(absolute: str, letters: str) -> Optional[str]:
+        if absolute:
+            return absolute + letters
+        n = _col_letters_to_index(letters) + dcol
+        if n < 1 or n > _MAX_COL:
+            return None
+        return _col_index_to_letters(n)
+
+    def _shift_row(absolute: str, digits: str) -> Optional[str]:
+        if absolute:
+            return absolute + digits
+        n = int(digits) + drow
+        if n < 1 or n > _MAX_ROW:
+            return None
+        return str(n)
+
+    def repl(m):
+        if m.group(2) is not None:
+            c = _shift_col(m.group(1), m.group(2))
+            r = _shift_row(m.group(3), m.group(4))
+            if c is None or r is None:
+                return '#REF!'
+            return f"{c}{r}"
+        if m.group(6) is not None:
+            c1 = _shift_col(m.group(5), m.group(6))
+            c2 = _shift_col(m.group(7), m.group(8))
+            if c1 is None or c2 is None:
+                return '#REF!'
+            return f"{c1}:{c2}"
+        if m.group(10) is not None:
+            r1 = _shift_row(m.group(9), m.group(10))
+            r2 = _shift_row(m.group(11), m.group(12))
+            if r1 is None or r2 is None:
+                return '#REF!'
+            return f"{r1}:{r2}"
+        return m.group(0)
+
+    return _FORMULA_TOKEN_RE.sub(repl, formula)
+
+
+def _workbook_sheet_parts(z: zipfile.ZipFile) -> list:
+    """
+    依 workbook.xml 順序返回 [(sheet_name, 'xl/worksheets/sheetN.xml'), ...]。
+    透過 workbook.xml.rels 解析 r:id；解析失敗時退回 sheet{i}.xml 命名慣例。
+    """
+    parts = []
+    try:
+        names = set(z.namelist())
+        rels = {}
+        try:
+            rroot = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+            for rel in rroot.findall(f'{{{NS_PKG_REL}}}Relationship'):
+                target = rel.attrib.get('Target', '')
+                if target.startswith('/'):
+                    target = target.lstrip('/')
+                else:
+                    target = posixpath.normpath(posixpath.join('xl', target))
+                rels[rel.attrib.get('Id')] = target
+        except Exception:
+            rels = {}
+        root = ET.fromstring(z.read('xl/workbook.xml'))
+        for i, s in enumerate(root.findall(f'.//{{{NS_MAIN}}}sheet'), start=1):
+            nm = s.attrib.get('name')
+            if not nm:
+                continue
+            target = rels.get(s.attrib.get(f'{{{NS_REL}}}id'))
+            if not target:
+                target = f'xl/worksheets/sheet{i}.xml'
+            # chartsheet 等非 worksheet 部件略過（與 openpyxl wb.worksheets 一致）
+            if '/worksheets/' not in target or target not in names:
+                continue
+            parts.append((nm, target))
+    except Exception:
+        pass
+    return parts
+
+
+def _read_sheet_cells(stream, sst, formula_hook: Optional[Callable], meta: Optional[dict] = None) -> Dict[str, dict]:
+    cells: Dict[str, dict] = {}
+    sst_max = -1
+    shared_masters: Dict[str, Tuple[str, int, int]] = {}
+    # shared formula 組：[master 原文, master 位址, [follower 位址...]]，僅在 meta 不為 None 時收集。
+    # 只收 master 原文不含 '[' 與 "''" 的組：此時 formula_hook 不改寫公式、不屬外部參照，
+    # follower 公式必等於 '=' + shift_formula(原文, 行差, 列差)，可由上層按組存放
+    formula_groups: list = []
+    group_of_si: Dict[str, int] = {}
+    sheet_data = None
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == _TAG_SHEETDATA:
+                sheet_data = elem
+            continue
+        if tag == _TAG_ROW:
+            # 已處理完的 row 從樹上移除，保持記憶體平穩
+            if sheet_data is not None:
+                sheet_data.clear()
+            continue
+        if tag != _TAG_C:
+            continue
+        addr = elem.attrib.get('r')
+        if not addr:
+            elem.clear()
+            continue
+        t = elem.attrib.get('t')
+
+        # ---- 公式 ----
+        fstr = None
+        gid = None
+        f_node = elem.find(_TAG_F)
+        if f_node is not None:
+            ftype = f_node.attrib.get('t')
+            text = f_node.text
+            if ftype == 'shared':
+                si = f_node.attrib.get('si')
+                if text:
+                    r0, c0 = _split_ref(addr)
+                    shared_masters[si] = (text, r0, c0)
+                    fstr = text
+                    if meta is not None:
+                        if '[' in text or "''" in text:
+                            group_of_si.pop(si, None)
+                        else:
+                            group_of_si[si] = len(formula_groups)
+                            formula_groups.append([text, addr, []])
+                elif si in shared_masters:
+                    mtext, r0, c0 = shared_masters[si]
+                    r1, c1 = _split_ref(addr)
+                    fstr = shift_formula(mtext, r1 - r0, c1 - c0)
+                    gid = group_of_si.get(si)
+            elif text:
+                # 一般公式與 array formula（master 格帶 ref），dataTable 無文字則略過
+                fstr = text
+            if fstr is not None:
+                fstr = '=' + fstr
+
+        # ---- 值（與 polars_xml 值引擎語意一致）----
+        has_value = False
+        val = None
+        v_node = elem.find(_TAG_V)
+        if v_node is not None:
+            has_value = True
+            raw = v_node.text
+            if raw is None:
+                val = None
+            elif t == 's':
+                try:
+                    idx = int(raw)
+                    if idx > sst_max:
+                        sst_max = idx
+                    val = sst[idx] if 0 <= idx < len(sst) else ''
+                except Exception:
+                    val = ''
+            elif t == 'b':
+                val = True if raw in ('1', 'true', 'TRUE') else False
+            else:
+                val = raw
+        elif t == 'inlineStr':
+            is_node = elem.find(_TAG_IS)
+            if is_node is not None:
+                has_value = True
+                val = ''.join((tn.text or '') for tn in is_node.iter(_TAG_T))
+
+        elem.clear()
+        if fstr is None and not (has_value and val is not None):
+            continue
+
+        external_ref = False
+        if gid is not None:
+            formula_groups[gid][2].append(addr)
+        elif fstr is not None and formula_hook is not None:
+            try:
+                fstr, external_ref = formula_hook(fstr)
+            except Exception:
+                pass
+        cells[addr] = {
+            "formula": fstr,
+            "value": val,
+            "cached_value": val,
+            "external_ref": bool(external_ref),
+        }
+    if meta is not None:
+        # 本表引用到的最大 sharedStrings 索引，供 sharedStrings 變更時判斷能否沿用
+        meta['sst_max'] = sst_max
+        meta['sst_prefix_crc'] = _sst_prefix_crc(sst, sst_max + 1)
+        meta['formula_groups'] = [g for g in formula_groups if g[2]]
+    return cells
+
+
+def _sst_prefix_crc(sst, n: int) -> int:
+    # sharedStrings 前 n 筆的 CRC32：前綴不變即表示該表引用到的字串都不變
+    if hasattr(sst, 'prefix_crc'):
+        return sst.prefix_crc(n)
+    crc = 0
+    for text in sst[:max(0, n)]:
+        crc = zlib.crc32(text.encode('utf-8', 'surrogatepass') + b'\x00', crc)
+    return crc
+
+
+def _member_crc(z: zipfile.ZipFile, name: str) -> Optional[Tuple[int, int]]:
+    # 直接取中央目錄的 CRC32/大小，不需解壓
+    try:
+        info = z.getinfo(name)
+        return info.CRC, info.file_size
+    except KeyError:
+        return None
+
+
+def _globals_crc(z: zipfile.ZipFile) -> int:
+    # 影響所有表輸出的共用部件：workbook rels（表→部件對應）與 externalLinks（公式 prettify 用的 [n] 映射）
+    crc = 0
+    for name in sorted(z.namelist()):
+        if name == 'xl/_rels/workbook.xml.rels' or name.startswith('xl/externalLinks/'):
+            info = z.getinfo(name)
+            crc = zlib.crc32(f"{name}:{info.CRC}:{info.file_size};".encode('utf-8'), crc)
+    return crc
+
+
+def _reusable_sheets(z: zipfile.ZipFile, parts: list, reuse: Optional[dict], load_sst: Callable) -> Dict[str, dict]:
+    """
+    比對 baseline 的成員清單，返回可直接沿用的 { sheet_name: 新清單條目 }。
+    條件：清單版本與共用部件一致、同名表對應同一部件且 CRC/大小不變；
+    sharedStrings 有變時，僅當本表引用範圍內的字串前綴 CRC 仍相同才沿用（等同索引重新對應後內容不變）。
+    """
+    if not reuse:
+        return {}
+    old = reuse.get('members') or {}
+    old_cells = reuse.get('cells')
+    if not isinstance(old_cells, dict) or old.get('version') != ZIP_MEMBERS_VERSION:
+        return {}
+    if old.get('globals_crc') != _globals_crc(z):
+        return {}
+    old_sheets = old.get('sheets') or {}
+    cur_sst = _member_crc(z, 'xl/sharedStrings.xml')
+    sst_same = old.get('sst_crc') == (list(cur_sst) if cur_sst else None)
+    keep = {}
+    for name, part in parts:
+        prev = old_sheets.get(name)
+        if not prev or prev.get('part') != part:
+            continue
+        cur = _member_crc(z, part)
+        if cur is None or [prev.get('crc'), prev.get('size')] != list(cur):
+            continue
+        sst_max = int(prev.get('sst_max', -1))
+        if not sst_same and sst_max >= 0 and _sst_prefix_crc(load_sst(), sst_max + 1) != prev.get('sst_prefix_crc'):
+            continue
+        keep[name] = dict(prev)
+    return keep
+
+
+def _parse_sheet_task(xlsx_path: str, part: str, formula_hook: Optional[Callable]) -> Tuple[Dict[str, dict], dict]:
+    # 行程池任務：各行程自行開 zip，sharedStrings 於行程內快取
+    sst = worker_shared_strings(xlsx_path, _load_shared_strings)
+    meta: dict = {}
+    try:
+        with zipfile.ZipFile(xlsx_path, 'r') as z, z.open(part) as stream:
+            return _read_sheet_cells(stream, sst, formula_hook, meta), meta
+    except Exception:
+        return {}, {}
+
+
+def read_cells_from_xlsx_via_xml(xlsx_path: str, formula_hook: Optional[Callable] = None,
+                                 reuse: Optional[dict] = None, members_out: Optional[dict] = None,
+                                 groups_out: Optional[dict] = None) -> Dict[str, Dict[str, dict]]:
+    """
+    單次解壓、單次串流解析每個 worksheet，產出公式 + 值。
+    formula_hook(formula) -> (display_formula, external_ref)：由上層注入 prettify 與外部參照偵測；
+    並發模式下 hook 需可 pickle（例如模組層級函式的 functools.partial）。
+    大型多表活頁簿依 MAX_SHEET_WORKERS 以行程池逐表並發解析。
+    reuse={'members': 舊成員清單, 'cells': 舊 cells}：CRC 未變的工作表直接沿用舊 cells，不解壓不解析。
+    members_out：傳入 dict 時填入本次的成員清單，供保存到 baseline。
+    groups_out：傳入 dict 時填入本次解析之工作表的 shared formula 組 { sheet: [[原文, master 位址, [follower 位址...]]] }
+    （沿用的舊表不在其中，其 cells 已是上次的存放形式）。
+    """
+    out: Dict[str, Dict[str, dict]] = {}
+    with zipfile.ZipFile(xlsx_path, 'r') as z:
+        parts = _workbook_sheet_parts(z)
+        sst_holder = []
+
+        def load_sst():
+            if not sst_holder:
+                sst_holder.append(worker_shared_strings(xlsx_path, _load_shared_strings))
+            return sst_holder[0]
+
+        try:
+            keep = _reusable_sheets(z, parts, reuse, load_sst)
+        except Exception:
+            keep = {}
+        todo = [(name, part) for name, part in parts if name not in keep]
+        metas: Dict[str, dict] = {}
+
+        merged = None
+        if todo and resolve_sheet_workers(z, todo) > 1:
+            merged = map_sheet_parts(_parse_sheet_task, xlsx_path, todo, formula_hook)
+        if merged is not None:
+            for name, (cells, meta) in merged.items():
+                out[name] = cells
+                metas[name] = meta
+        else:
+            for name, part in todo:
+                meta: dict = {}
+                try:
+                    with z.open(part) as stream:
+                        out[name] = _read_sheet_cells(stream, load_sst(), formula_hook, meta)
+                    metas[name] = meta
+                except Exception:
+                    # 單張表失敗不影響其他表
+                    out[name] = {}
+
+        old_cells = (reuse or {}).get('cells') or {}
+        ordered: Dict[str, Dict[str, dict]] = {}
+        for name, _ in parts:
+            ordered[name] = old_cells.get(name, {}) if name in keep else out.get(name, {})
+
+        if groups_out is not None:
+            for name, meta in metas.items():
+                if meta.get('formula_groups'):
+                    groups_out[name] = meta['formula_groups']
+
+        if members_out is not None:
+            sheets = {}
+            for name, part in parts:
+                if name in keep:
+                    sheets[name] = keep[name]
+                    continue
+                meta = metas.get(name)
+                crc = _member_crc(z, part)
+                if not meta or crc is None:
+                    continue   # 解析失敗的表不記錄，下次一定重新解析
+                sheets[name] = {'part': part, 'crc': crc[0], 'size': crc[1],
+                                'sst_max': meta.get('sst_max', -1), 'sst_prefix_crc': meta.get('sst_prefix_crc', 0)}
+            sst_crc = _member_crc(z, 'xl/sharedStrings.xml')
+            members_out.update({
+                'version': ZIP_MEMBERS_VERSION,
+                'globals_crc': _globals_crc(z),
+                'sst_crc': list(sst_crc) if sst_crc else None,
+                'sheets': sheets,
+                'reused': len(keep),
+                'parsed': len(todo),
+            })
+    return ordered
@@ -2,6 +2,8 @@ import zipfile
 import xml.etree.ElementTree as ET
 from typing import Dict, Optional
 
+from utils.value_engines.shared_strings import load_shared_strings
+
 # Minimal XML reader that maps sheet name -> { address: value }
 # Fast path for cached values (v) and formulas (f) if needed later.
 
@@ -12,21 +14,8 @@ def read_values_from_xlsx_via_xml(xlsx_path: str) -> Dict[str, Dict[str, Optiona
     Note: sharedStrings and basic types handled; dates kept as raw numbers for speed.
     """
     with zipfile.ZipFile(xlsx_path, 'r') as z:
-        # Build shared strings (if any)
-        shared_strings = []
-        try:
-            if 'xl/sharedStrings.xml' in z.namelist():
-                ss_xml = z.read('xl/sharedStrings.xml')
-                root = ET.fromstring(ss_xml)
-                ns = {'a': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-                for si in root.findall('a:si', ns):
-                    # concatenate all t nodes
-                    text_parts = []
-                    for t in si.findall('.//a:t', ns):
-                        text_parts.append(t.text or '')
-                    shared_strings.append(''.join(text_parts))
-        except Exception:
-            shared_strings = []
+        # Build shared strings (if any): streamed into a compact buffer, decoded on access
+        shared_strings = load_shared_strings(z)
         # Map sheet id -> name and relationships
         sheet_names = []
         try: